@@ -0,0 +1,61 @@
+import numpy as np
+from movement_analysis import EARTH_RADIUS
+
+METRES_PER_DEGREE = np.pi * EARTH_RADIUS / 180
+
+# Rings get enough vertices that no edge strays more than this inside the true circle, in steps of RING_STEP
+MAX_RING_ERROR_M = 1.0
+RING_STEP = 8
+MIN_RING_VERTICES = 8
+MAX_RING_VERTICES = 64
+
+_unit_circles = {}
+_ring_formats = {}
+
+
+def ring_vertex_counts(radius):
+    # A chord of a circle of radius r with n sides sags r * (1 - cos(pi / n)) inside it
+    ratio = np.clip(1 - MAX_RING_ERROR_M / np.maximum(radius, MAX_RING_ERROR_M), -1, 1)
+    needed = np.pi / np.maximum(np.arccos(ratio), 1e-9)
+    counts = np.ceil(needed / RING_STEP) * RING_STEP
+    return np.clip(counts, MIN_RING_VERTICES, MAX_RING_VERTICES).astype(np.int64)
+
+
+def unit_circle(vertices):
+    # Closed ring of cosines and sines, computed once per vertex count
+    if vertices not in _unit_circles:
+        angles = np.linspace(0, 2 * np.pi, vertices + 1)
+        angles[-1] = 0  # KML rings end exactly where they start
+        _unit_circles[vertices] = np.cos(angles), np.sin(angles)
+    return _unit_circles[vertices]
+
+
+def _ring_format(vertices):
+    # One % format for a whole ring, so each ring is a single C-level formatting call
+    if vertices not in _ring_formats:
+        _ring_formats[vertices] = " ".join(["%.7f,%.7f"] * (vertices + 1))
+    return _ring_formats[vertices]
+
+
+def accuracy_rings(lat, lon, radius):
+    # KML coordinate text of a ring of the given radius in metres around each point, None where there is no usable
+    # radius; every ring of the same vertex count is scaled and offset from one unit circle in a single operation
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    radius = np.asarray(radius, dtype=np.float64)
+    rings = [None] * len(lat)
+    usable = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(radius) & (radius > 0)
+    counts = np.where(usable, ring_vertex_counts(np.where(usable, radius, 0)), 0)
+    for vertices in np.unique(counts[usable]):
+        positions = np.flatnonzero(counts == vertices)
+        cosines, sines = unit_circle(int(vertices))
+        lat_radius = radius[positions] / METRES_PER_DEGREE
+        # A degree of longitude shrinks with the cosine of the latitude
+        lon_radius = lat_radius / np.maximum(np.cos(np.radians(lat[positions])), 0.01)
+        ring_lat = lat[positions, None] + lat_radius[:, None] * sines
+        ring_lon = lon[positions, None] + lon_radius[:, None] * cosines
+        coordinates = np.stack([ring_lon, ring_lat], axis=2).reshape(len(positions), -1).tolist()
+        ring_format = _ring_format(int(vertices))
+        for position, values in zip(positions.tolist(), coordinates):
+            rings[position] = ring_format % tuple(values)
+    return rings
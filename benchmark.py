@@ -0,0 +1,233 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import export_runner
+import exporters
+import external_sort
+import location_export
+import location_reader
+import places
+from location_export import COLUMN_DTYPES
+
+# Compares the readers on real exports: python benchmark.py "Cache export.xlsx" [more files...]
+# Checks the hot paths against the recorded budgets: python benchmark.py --perf
+# Records this machine's numbers as the new budgets: python benchmark.py --update-baseline
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "performance_baseline.json")
+
+# Synthetic exports are generated from a fixed seed, so every run measures the same rows
+PERF_SEED = 2024
+PERF_ROWS = 50000
+PERF_READ_ROWS = 10000
+
+# A stage fails when it is this much slower, or takes this much more memory, than its baseline
+SPEED_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.3
+
+# Peaks this small vary with allocator noise more than with the code, so they get this much extra room
+MEMORY_SLACK_MB = 2.0
+
+# The external sort is given a budget well under the rows it sorts, so the stage measures spilling and merging
+PERF_SORT_MEMORY_MB = 4
+
+# The filter stage drops the wide fixes, as most exports do
+PERF_ACCURACY_FILTER = "< 100m"
+
+PERF_START = datetime(2024, 1, 1)
+PERF_END = datetime(2024, 2, 1)
+
+
+def benchmark_engines(excel_path, repeat=3):
+    # Best of a few reads per engine, as rows per second; an engine that cannot read the file gets its error
+    results = {}
+    for engine in location_reader.available_engines():
+        best = None
+        try:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                df = location_reader.read_excel_frame(excel_path, COLUMN_DTYPES, engines=[engine])
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+        except Exception as e:
+            results[engine] = str(e)
+            continue
+        results[engine] = len(df) / best if best > 0 else 0.0
+    return results
+
+
+def synthetic_export(rows, seed=PERF_SEED):
+    # An unordered export shaped like a real one, as read_locations returns it: a walk around Brisbane over January
+    # 2024 with a fix every few seconds, varying accuracy and the odd missing speed and course
+    rng = np.random.default_rng(seed)
+    timestamps = 725724000 + np.cumsum(rng.exponential(5.0, rows)).round(3)
+    steps = rng.normal(0, 0.00005, (rows, 2)).cumsum(axis=0)
+    speed = rng.gamma(2.0, 2.0, rows).round(2)
+    speed[rng.random(rows) < 0.05] = -1.0
+    course = rng.uniform(0, 360, rows).round(1)
+    course[speed < 0] = -1.0
+    df = pd.DataFrame({
+        "Z_PK": np.arange(1, rows + 1).astype(str),
+        "ZALTITUDE": rng.normal(30, 10, rows).round(2),
+        "ZCOURSE": course,
+        "ZHORIZONTALACCURACY": rng.choice([5.0, 10.0, 35.0, 65.0, 165.0, 1414.0], rows, p=[0.4, 0.3, 0.15, 0.1, 0.04, 0.01]),
+        "ZLATITUDE": (-27.47 + steps[:, 0]).round(7),
+        "ZLONGITUDE": (153.02 + steps[:, 1]).round(7),
+        "ZSPEED": speed,
+        "ZTIMESTAMP": timestamps.astype(str),
+        "ZVERTICALACCURACY": rng.choice([3.0, 4.0, 6.0, 10.0], rows),
+    })
+    # Exports are often out of time order, a fifth of these rows are moved to random places
+    moved = rng.random(rows) < 0.2
+    position = np.where(moved, rng.random(rows), np.arange(rows) / rows)
+    return df.iloc[np.argsort(position, kind="stable")].reset_index(drop=True).astype(COLUMN_DTYPES)
+
+
+def _export_stage(export_format):
+    def stage(df, folder):
+        file_exporters = exporters.open_exporters([export_format], "perf.xlsx", folder, "nil", PERF_START, PERF_END, True, True, True, True, "km/h")
+        exporters.export_batches(exporters.frame_batches(df), file_exporters)
+        return len(df)
+    return stage
+
+
+def _filter_stage(df, folder):
+    location_export.apply_filters(df, PERF_START, PERF_END, PERF_ACCURACY_FILTER)
+    return len(df)
+
+
+def _sort_stage(df, folder):
+    batches = exporters.frame_batches(location_export.apply_filters(df, PERF_START, PERF_END, "nil")[0])
+    for _ in external_sort.external_sort(batches, memory_mb=PERF_SORT_MEMORY_MB, temp_dir=folder):
+        pass
+    return len(df)
+
+
+def _places_stage(df, folder):
+    places.find_places(location_export.apply_filters(df, PERF_START, PERF_END, "nil")[0])
+    return len(df)
+
+
+def _read_stage(excel_path, folder):
+    return len(location_reader.read_locations(excel_path))
+
+
+def _end_to_end_stage(excel_path, folder):
+    # Unfiltered, so every row read is a row written
+    result = export_runner.run_export(excel_path, folder, PERF_START, PERF_END, "nil", True, True, True, True, "km/h",
+                                      formats=("KML", "CSV"), force=True)
+    return result["point_count"]
+
+
+# Stage name, the function it runs, and whether it takes the synthetic frame or the synthetic workbook
+PERF_STAGES = [
+    ("read", _read_stage, "workbook"),
+    ("filter", _filter_stage, "frame"),
+    ("kml", _export_stage("KML"), "frame"),
+    ("csv", _export_stage("CSV"), "frame"),
+    ("geojson", _export_stage("GeoJSON"), "frame"),
+    ("sort", _sort_stage, "frame"),
+    ("places", _places_stage, "frame"),
+    ("end_to_end", _end_to_end_stage, "workbook"),
+]
+
+
+def measure_stage(stage, source, folder, repeat=2):
+    # Rows per second from the best of a few untraced runs, then the peak traced memory of one more run in MB;
+    # tracing slows everything down, so the two are never taken from the same run
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = stage(source, folder)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        stage(source, folder)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"rows_per_second": rows / best if best > 0 else 0.0, "peak_mb": peak / (1024 * 1024)}
+
+
+def run_perf_stages(rows=PERF_ROWS, read_rows=PERF_READ_ROWS, seed=PERF_SEED, stages=None, log=print):
+    # Measures every stage on the synthetic export, headless and in a temporary folder
+    df = synthetic_export(rows, seed)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="location-perf-") as folder:
+        excel_path = os.path.join(folder, "perf.xlsx")
+        if any(kind == "workbook" for name, _, kind in PERF_STAGES if stages is None or name in stages):
+            synthetic_export(read_rows, seed).to_excel(excel_path, index=False)
+        for name, stage, kind in PERF_STAGES:
+            if stages is not None and name not in stages:
+                continue
+            output_folder = os.path.join(folder, name)
+            os.makedirs(output_folder)
+            results[name] = measure_stage(stage, df if kind == "frame" else excel_path, output_folder)
+            log(f"{name}: {results[name]['rows_per_second']:.0f} rows/s, {results[name]['peak_mb']:.1f} MB peak")
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH, rows=PERF_ROWS, read_rows=PERF_READ_ROWS, seed=PERF_SEED):
+    baseline = {
+        "rows": rows, "read_rows": read_rows, "seed": seed,
+        "speed_tolerance": SPEED_TOLERANCE, "memory_tolerance": MEMORY_TOLERANCE,
+        "stages": {name: {key: round(value, 1) for key, value in result.items()} for name, result in results.items()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def check_budgets(results, baseline):
+    # One row per stage: (stage, rows/s, lowest allowed rows/s, peak MB, highest allowed peak MB, problems)
+    speed_tolerance = baseline.get("speed_tolerance", SPEED_TOLERANCE)
+    memory_tolerance = baseline.get("memory_tolerance", MEMORY_TOLERANCE)
+    report = []
+    for name, budget in baseline["stages"].items():
+        if name not in results:
+            continue
+        result = results[name]
+        min_speed = budget["rows_per_second"] * (1 - speed_tolerance)
+        max_peak = budget["peak_mb"] * (1 + memory_tolerance) + MEMORY_SLACK_MB
+        problems = []
+        if result["rows_per_second"] < min_speed:
+            problems.append("slower")
+        if result["peak_mb"] > max_peak:
+            problems.append("more memory")
+        report.append((name, result["rows_per_second"], min_speed, result["peak_mb"], max_peak, problems))
+    return report
+
+
+def format_report(report):
+    lines = [f"{'stage':12} {'rows/s':>10} {'min':>10} {'peak MB':>9} {'max':>9}  status"]
+    for name, speed, min_speed, peak, max_peak, problems in report:
+        status = "REGRESSED: " + ", ".join(problems) if problems else "ok"
+        lines.append(f"{name:12} {speed:10.0f} {min_speed:10.0f} {peak:9.1f} {max_peak:9.1f}  {status}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--update-baseline"]:
+        save_baseline(run_perf_stages())
+        print(f"Baseline saved to {BASELINE_PATH}")
+    elif sys.argv[1:2] == ["--perf"]:
+        baseline = load_baseline()
+        report = check_budgets(run_perf_stages(baseline["rows"], baseline["read_rows"], baseline["seed"]), baseline)
+        print(format_report(report))
+        sys.exit(1 if any(problems for *_, problems in report) else 0)
+    else:
+        for path in sys.argv[1:]:
+            print(path)
+            for engine, result in benchmark_engines(path).items():
+                print(f"  {engine:10} {result:12.0f} rows/s" if isinstance(result, float) else f"  {engine:10} failed: {result}")
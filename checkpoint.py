@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+from location_export import no_log
+
+# Rows written between checkpoints; each one flushes and syncs every output, so they are kept far apart
+CHECKPOINT_ROWS = 50000
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_path(filters_path, digest):
+    # The checkpoint sits next to the settings file of the export it belongs to, named after the export's digest so
+    # other exports of the same input, with another window or other settings, keep checkpoints of their own
+    return f"{os.path.splitext(filters_path)[0]} - {digest[:16]}.checkpoint.json"
+
+
+def load_checkpoint(path, digest):
+    # Only a checkpoint of the same input and settings can be continued, and only while its outputs are still at
+    # least as long as when it was taken
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except ValueError:
+        return None
+    if state.get("version") != CHECKPOINT_VERSION or state.get("digest") != digest:
+        return None
+    for output in state["outputs"].values():
+        if not os.path.isfile(output["path"]) or os.path.getsize(output["path"]) < output["size"]:
+            return None
+    return state
+
+
+def save_checkpoint(path, state):
+    # Written to a temporary file and synced before it replaces the last one, so a crash leaves one or the other;
+    # every save gets a temporary file of its own, so two workers saving at once never write into the same one
+    state["version"] = CHECKPOINT_VERSION
+    folder, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder or ".", prefix=name + ".", suffix=".tmp", delete=False) as f:
+        try:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def clear_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def skip_rows(batches, count):
+    # The batches after the first count rows, which a resumed export has already written
+    for batch in batches:
+        if count >= len(batch):
+            count -= len(batch)
+            continue
+        yield batch.iloc[count:] if count else batch
+        count = 0
+
+
+class Checkpointer:
+    # Passed as export_batches' on_batch: every CHECKPOINT_ROWS rows it makes the outputs durable and records how far
+    # they got
+
+    def __init__(self, path, digest, exporters, rows=0, every=CHECKPOINT_ROWS, log=no_log):
+        self.path = path
+        self.digest = digest
+        self.exporters = exporters
+        self.rows = rows
+        self.every = every
+        self.log = log
+        self.last = rows
+
+    def __call__(self, done):
+        rows = self.rows + done
+        if rows - self.last < self.every:
+            return
+        outputs = {export_format: exporter.checkpoint() for export_format, exporter in self.exporters.items()}
+        save_checkpoint(self.path, {"digest": self.digest, "rows": rows, "outputs": outputs})
+        self.last = rows
+        self.log(f"Checkpoint saved after {rows} rows")
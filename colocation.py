@@ -0,0 +1,239 @@
+import csv
+import numpy as np
+import pandas as pd
+import simplekml
+import integrity
+from location_export import IPHONE_EPOCH, UTC_OFFSET, convert_timestamp, kml_time, no_log
+from movement_analysis import EARTH_RADIUS, haversine
+
+# Two fixes count as together when they are this close in metres, plus both accuracy radii, and this close in seconds
+DEFAULT_DISTANCE_M = 50
+DEFAULT_TIME_S = 60
+
+# Fixes less accurate than this could be "together" with anything for kilometres, so they are left out of the join
+MAX_JOIN_ACCURACY = 500
+
+# Matched fixes further apart in time than this start a new meeting
+MEETING_GAP_S = 600
+
+# Device A fixes joined at a time, which bounds the candidate pairs held in memory
+JOIN_CHUNK = 20000
+
+METRES_PER_DEGREE = np.pi * EARTH_RADIUS / 180
+
+# Cells are sized on the distance plus twice this percentile of the accuracy radii, so all but the rare wide pairs
+# match within the neighbouring cells; wider fixes search more rings of cells
+TYPICAL_ACCURACY_PERCENTILE = 99
+
+# Each fix is put in an accuracy band counted in this many parts of a cell: a pair of bands can only match within
+# ceil((band_a + band_b) / BAND_PARTS) cells of each other
+BAND_PARTS = 4
+
+PAIR_COLUMNS = ["a_pk", "a_timestamp", "a_latitude", "a_longitude", "a_accuracy",
+                "b_pk", "b_timestamp", "b_latitude", "b_longitude", "b_accuracy", "distance", "time_gap"]
+
+
+def _fixes(df, max_accuracy):
+    # Timestamps, coordinates and accuracy of the fixes that can take part in the join
+    timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+    lat = df["ZLATITUDE"].to_numpy(dtype=np.float64)
+    lon = df["ZLONGITUDE"].to_numpy(dtype=np.float64)
+    accuracy = np.nan_to_num(df["ZHORIZONTALACCURACY"].to_numpy(dtype=np.float64))
+    keep = ~(np.isnan(timestamps) | np.isnan(lat) | np.isnan(lon)) & (accuracy <= max_accuracy)
+    return {
+        "pk": df["Z_PK"].to_numpy()[keep],
+        "timestamp": timestamps[keep],
+        "latitude": lat[keep],
+        "longitude": lon[keep],
+        "accuracy": np.maximum(accuracy[keep], 0),
+    }
+
+
+def _neighbours(rings):
+    # Offsets of a cell and every cell within rings of it in (time slot, latitude row, longitude column)
+    return [(slot, row, column) for slot in (-1, 0, 1) for row in range(-rings, rings + 1) for column in range(-rings, rings + 1)]
+
+
+def _band_index(bands, keys):
+    # The fixes of each accuracy band, sorted by cell key
+    index = {}
+    for band in np.unique(bands):
+        members = np.flatnonzero(bands == band)
+        order = members[np.argsort(keys[members], kind="stable")]
+        index[band] = (order, keys[order])
+    return index
+
+
+def _cell_pairs(query_cells, query_fixes, order, sorted_keys, rings, pack):
+    # (query fix, indexed fix) pairs sharing a cell or within rings of each other, one chunk of query fixes at a time
+    for start in range(0, len(query_fixes), JOIN_CHUNK):
+        positions = query_fixes[start:start + JOIN_CHUNK]
+        slot, row, column = (values[positions] for values in query_cells)
+        found_query = []
+        found_index = []
+        for slot_offset, row_offset, column_offset in _neighbours(rings):
+            keys = pack(slot + slot_offset, row + row_offset, column + column_offset)
+            low = np.searchsorted(sorted_keys, keys, side="left")
+            counts = np.searchsorted(sorted_keys, keys, side="right") - low
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Expand every (query fix, range of indexed fixes) into explicit pairs without a Python loop
+            starts = np.repeat(low - np.cumsum(counts) + counts, counts)
+            found_query.append(np.repeat(positions, counts))
+            found_index.append(order[starts + np.arange(total)])
+        if found_query:
+            yield np.concatenate(found_query), np.concatenate(found_index)
+
+
+def _closest(pair_a, pair_b, distance):
+    # The closest B fix of each A fix among the pairs given
+    order = np.lexsort((distance, pair_a))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pair_a[order][1:] != pair_a[order][:-1]
+    return pair_a[order][first], pair_b[order][first], distance[order][first]
+
+
+def find_colocations(df_a, df_b, distance_m=DEFAULT_DISTANCE_M, time_s=DEFAULT_TIME_S, max_accuracy=MAX_JOIN_ACCURACY, log=no_log):
+    # For every device A fix, the closest device B fix within the time and distance tolerance
+    a = _fixes(df_a, max_accuracy)
+    b = _fixes(df_b, max_accuracy)
+    if not len(a["timestamp"]) or not len(b["timestamp"]):
+        log("One of the devices has no usable fixes")
+        return pd.DataFrame(columns=PAIR_COLUMNS)
+
+    # Cells are sized for typical fixes, so one wide fix does not make every cell wide; longitude cells are sized at
+    # the highest latitude present, where a degree is shortest
+    typical = np.percentile(np.concatenate([a["accuracy"], b["accuracy"]]), TYPICAL_ACCURACY_PERCENTILE)
+    radius = (distance_m + 2 * typical) * 1.01
+    cell_lat = radius / METRES_PER_DEGREE
+    highest = min(max(np.abs(a["latitude"]).max(), np.abs(b["latitude"]).max()), 89.0)
+    cell_lon = cell_lat / np.cos(np.radians(highest))
+
+    def bands(fixes):
+        # Half the distance plus the fix's own accuracy, in parts of a cell; typical fixes all share the half-cell
+        # band, any two of them match within the neighbouring cells
+        return np.maximum(np.ceil((distance_m / 2 + fixes["accuracy"]) * BAND_PARTS / radius), BAND_PARTS // 2).astype(np.int64)
+
+    def cells(fixes):
+        return (np.floor(fixes["timestamp"] / time_s).astype(np.int64),
+                np.floor(fixes["latitude"] / cell_lat).astype(np.int64),
+                np.floor(fixes["longitude"] / cell_lon).astype(np.int64))
+
+    bands_a = bands(a)
+    bands_b = bands(b)
+    max_rings = int(-(-(bands_a.max() + bands_b.max()) // BAND_PARTS))
+    cells_a = cells(a)
+    cells_b = cells(b)
+
+    # Each (time slot, row, column) is packed into one int64 relative to the smallest cell, with room for the
+    # widest neighbour offsets on both sides
+    margins = (1, max_rings, max_rings)
+    origins = [min(values_a.min(), values_b.min()) - margin for values_a, values_b, margin in zip(cells_a, cells_b, margins)]
+    spans = [max(values_a.max(), values_b.max()) - origin + margin + 1
+             for values_a, values_b, origin, margin in zip(cells_a, cells_b, origins, margins)]
+    if float(spans[0]) * spans[1] * spans[2] >= 2 ** 62:
+        raise ValueError("The devices are too far apart in time and space to compare in one run, please narrow the filters.")
+
+    def pack(slot, row, column):
+        return ((slot - origins[0]) * spans[1] + (row - origins[1])) * spans[2] + (column - origins[2])
+
+    index_a = _band_index(bands_a, pack(*cells_a))
+    index_b = _band_index(bands_b, pack(*cells_b))
+    log(f"Joining {len(a['timestamp'])} fixes against {len(b['timestamp'])} in {radius:.0f} m by {time_s} s cells, "
+        f"searching up to {max_rings} cells away for the least accurate fixes")
+
+    # Every pair of bands is searched from the side with fewer fixes, so the rare wide fixes search many cells and
+    # the many typical ones only their neighbours
+    best_a = []
+    best_b = []
+    best_distance = []
+    for band_a, (order_a, keys_a) in index_a.items():
+        for band_b, (order_b, keys_b) in index_b.items():
+            rings = int(-(-(band_a + band_b) // BAND_PARTS))
+            if len(order_a) <= len(order_b):
+                found = _cell_pairs(cells_a, order_a, order_b, keys_b, rings, pack)
+            else:
+                found = ((pair_a, pair_b) for pair_b, pair_a in _cell_pairs(cells_b, order_b, order_a, keys_a, rings, pack))
+            for pair_a, pair_b in found:
+                # Confirm the candidates with the exact time gap and great-circle distance
+                distance = haversine(a["latitude"][pair_a], a["longitude"][pair_a], b["latitude"][pair_b], b["longitude"][pair_b])
+                close = ((np.abs(a["timestamp"][pair_a] - b["timestamp"][pair_b]) <= time_s)
+                         & (distance <= distance_m + a["accuracy"][pair_a] + b["accuracy"][pair_b]))
+                if close.any():
+                    pair_a, pair_b, distance = _closest(pair_a[close], pair_b[close], distance[close])
+                    best_a.append(pair_a)
+                    best_b.append(pair_b)
+                    best_distance.append(distance)
+
+    if not best_a:
+        log("No co-located fixes found")
+        return pd.DataFrame(columns=PAIR_COLUMNS)
+    # An A fix can have candidates in several bands, the closest of them all is kept
+    pair_a, pair_b, distance = _closest(np.concatenate(best_a), np.concatenate(best_b), np.concatenate(best_distance))
+    pairs = pd.DataFrame({
+        "a_pk": a["pk"][pair_a], "a_timestamp": a["timestamp"][pair_a], "a_latitude": a["latitude"][pair_a],
+        "a_longitude": a["longitude"][pair_a], "a_accuracy": a["accuracy"][pair_a],
+        "b_pk": b["pk"][pair_b], "b_timestamp": b["timestamp"][pair_b], "b_latitude": b["latitude"][pair_b],
+        "b_longitude": b["longitude"][pair_b], "b_accuracy": b["accuracy"][pair_b],
+        "distance": distance,
+        "time_gap": np.abs(a["timestamp"][pair_a] - b["timestamp"][pair_b]),
+    }).sort_values("a_timestamp", kind="stable", ignore_index=True)
+    log(f"Found {len(pairs)} device A fixes with device B nearby")
+    return pairs
+
+
+def group_meetings(pairs, gap_s=MEETING_GAP_S):
+    # Runs of matched fixes with no break longer than gap_s, one row per meeting
+    if pairs.empty:
+        return pd.DataFrame(columns=["meeting", "start", "end", "fixes", "latitude", "longitude", "min_distance"])
+    timestamps = pairs["a_timestamp"].to_numpy()
+    meeting = np.concatenate([[0], np.cumsum(np.diff(timestamps) > gap_s)]) + 1
+    midpoints = pairs.assign(
+        meeting=meeting,
+        latitude=(pairs["a_latitude"] + pairs["b_latitude"]) / 2,
+        longitude=(pairs["a_longitude"] + pairs["b_longitude"]) / 2,
+    )
+    return midpoints.groupby("meeting", as_index=False).agg(
+        start=("a_timestamp", "min"), end=("a_timestamp", "max"), fixes=("a_timestamp", "size"),
+        latitude=("latitude", "median"), longitude=("longitude", "median"), min_distance=("distance", "min"))
+
+
+def _local_time(ts):
+    return IPHONE_EPOCH + UTC_OFFSET + pd.to_timedelta(ts, unit="s")
+
+
+def write_colocation_csv(pairs, path, algorithms=integrity.DEFAULT_ALGORITHMS):
+    with integrity.open_output(path, algorithms) as f:
+        writer = csv.writer(f)
+        writer.writerow(["Device A ID", "Device A Date", "Device A Time", "Device A Latitude", "Device A Longitude", "Device A Accuracy",
+                         "Device B ID", "Device B Date", "Device B Time", "Device B Latitude", "Device B Longitude", "Device B Accuracy",
+                         "Distance (m)", "Time Gap (s)", "Time Zone"])
+        for row in pairs.itertuples(index=False):
+            a_date, a_time, time_zone = convert_timestamp(row.a_timestamp)
+            b_date, b_time, _ = convert_timestamp(row.b_timestamp)
+            writer.writerow([row.a_pk, a_date, a_time, row.a_latitude, row.a_longitude, row.a_accuracy,
+                             row.b_pk, b_date, b_time, row.b_latitude, row.b_longitude, row.b_accuracy,
+                             round(row.distance, 1), round(row.time_gap, 1), time_zone])
+        integrity.hashing_writer(f).rows = len(pairs)
+
+
+def write_colocation_kml(meetings, path, name_a, name_b, algorithms=integrity.DEFAULT_ALGORITHMS):
+    # One placemark per meeting, spanning its time on the Google Earth time slider
+    kml = simplekml.Kml()
+    for row in meetings.itertuples(index=False):
+        start_date, start_time, time_zone = convert_timestamp(row.start)
+        _, end_time, _ = convert_timestamp(row.end)
+        point = kml.newpoint(name=f"Meeting {row.meeting}: {start_date} {start_time}-{end_time}", coords=[(row.longitude, row.latitude)])
+        point.description = (
+            f"Devices: {name_a} and {name_b}\n"
+            f"Time Zone: {time_zone}\n"
+            f"Start: {start_date} {start_time}\n"
+            f"End: {end_time}\n"
+            f"Co-located fixes: {row.fixes}\n"
+            f"Closest distance: {row.min_distance:.1f} m"
+        )
+        point.timespan.begin = kml_time(_local_time(row.start))
+        point.timespan.end = kml_time(_local_time(row.end))
+        point.style.iconstyle.icon.href = "http://maps.google.com/mapfiles/kml/shapes/man.png"
+    integrity.save_kml(kml, path, algorithms)
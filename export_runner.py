@@ -0,0 +1,459 @@
+import os
+import pandas as pd
+import checkpoint
+import colocation
+import exporters
+import external_sort
+import frame_cache as frame_cache_module
+import heatmap
+import integrity
+import location_export
+import location_reader
+import manifest
+import movement_analysis
+import pipeline
+import places
+import source_merge
+import trips
+from location_export import no_log
+
+
+def _report_progress(progress, done, total):
+    if progress:
+        progress(done, total)
+
+
+def _read_stage(excel_path, hasher, total_rows, read_state, progress):
+    # Streams the sheet while hashing it, counting rows, noting whether any latitude and longitude were seen and
+    # reporting progress
+    with integrity.open_input(excel_path, hasher) as source:
+        for batch in location_reader.iter_excel_batches(source):
+            read_state["ZLATITUDE"] = read_state["ZLATITUDE"] or bool(batch["ZLATITUDE"].notna().any())
+            read_state["ZLONGITUDE"] = read_state["ZLONGITUDE"] or bool(batch["ZLONGITUDE"].notna().any())
+            read_state["rows"] += len(batch)
+            if total_rows:
+                _report_progress(progress, min(read_state["rows"], total_rows), total_rows)
+            yield batch
+
+
+def _load_input(path, frame_cache, hash_algorithms, compact=False, streamable=False, log=no_log):
+    # Returns (input record, frame): a prefetched file comes back already parsed with its record, any other file gets
+    # an empty record that the pass parsing it fills in. A file that is not loaded yet is only loaded through the
+    # cache when the export needs the whole frame anyway; one that can be streamed is left to the stream. Compact
+    # exports have compact frames of their own in the cache, so the full frame is never copied to compact it
+    if frame_cache is None:
+        return {}, None
+    status = frame_cache.status(path, hash_algorithms, compact)
+    if status != frame_cache_module.READY and streamable:
+        return {}, None
+    if status == frame_cache_module.LOADING:
+        log(f"Waiting for the background load of {os.path.basename(path)} to finish...")
+    input_record, frame = frame_cache.load(path, hash_algorithms, compact)
+    log(f"Using the frame loaded in the background: {len(frame)} rows")
+    return dict(input_record), frame  # The cached record is shared with later runs
+
+
+def _parse_input(path, record, hash_algorithms, compact=False, log=no_log):
+    # Parses the file and, unless it has already been hashed, hashes it in the same pass; no copy of its bytes
+    # outlives the parse
+    log(f"Reading file: {path}")
+    hasher = None if record else integrity.InputHasher(hash_algorithms)
+    df = location_reader.read_locations(path, compact=compact, log=log, hasher=hasher)
+    if hasher is not None:
+        record.update(hasher.record())
+        log(f"Input hashed while reading: {os.path.basename(path)} | {integrity.format_record(record)}")
+    return df
+
+
+def _cached_run(filters_path, input_paths, inputs, run_parameters, hash_algorithms, log):
+    # Only when records of earlier exports of this input are in the folder are the inputs not yet hashed read once
+    # on their own, to see whether one of them matches; their records then spare the parsers the hashing
+    if not manifest.run_records(filters_path):
+        return None
+    for path, (record, _) in zip(input_paths, inputs):
+        if not record:
+            record.update(integrity.hash_file(path, hash_algorithms))
+            log(f"Input hashed: {os.path.basename(path)} | {integrity.format_record(record)}")
+    cached = manifest.cached_outputs(filters_path, _run_digest(inputs, run_parameters))
+    if cached is None:
+        return None
+    # The settings file describes the export the folder was last asked for, which is now this one again
+    output_paths, point_count, settings = cached
+    with open(filters_path, "w", encoding="utf-8") as f:
+        f.write(settings)
+    return output_paths, point_count
+
+
+def _run_digest(inputs, run_parameters):
+    return manifest.run_digest("+".join(record["sha256"] for record, _ in inputs), run_parameters)
+
+
+def _checkpoint_digest(input_paths, run_parameters):
+    # A checkpoint is looked up before the inputs have been read, so it is keyed by each file's size and modification
+    # time rather than by its content digest
+    stats = [os.stat(path) for path in input_paths]
+    return manifest.run_digest("+".join(f"{stat.st_size}:{stat.st_mtime_ns}" for stat in stats), run_parameters)
+
+
+def _check_coordinates(df):
+    # Check if latitude and longitude columns are present and not empty
+    if "ZLATITUDE" not in df.columns or "ZLONGITUDE" not in df.columns:
+        raise ValueError("Latitude or Longitude columns are missing in the file.")
+    if df["ZLATITUDE"].isna().all() or df["ZLONGITUDE"].isna().all():
+        raise ValueError("Latitude or Longitude columns are empty in the file.")
+
+
+def run_export(excel_path, output_folder, start_datetime, end_datetime, horizontal_accuracy_filter, show_date, show_time, show_speed, show_bearing, speed_unit,
+               partition_by="none", points_per_partition=1000, formats=("KML",), incremental=False, force=False, compact=False,
+               movement_check=False, exclude_flagged=False, max_speed_kmh=movement_analysis.DEFAULT_MAX_SPEED_KMH,
+               hash_algorithms=integrity.DEFAULT_ALGORITHMS, frame_cache=None, merge_paths=(), resume=False, checkpoint_rows=checkpoint.CHECKPOINT_ROWS,
+               trip_gap_s=trips.DEFAULT_TRIP_GAP_S, trip_distance_m=trips.DEFAULT_TRIP_DISTANCE_M, accuracy_circles=False, kml_processes=None, kml_pool=None,
+               time_order=False, sort_memory_mb=external_sort.DEFAULT_SORT_MEMORY_MB, regenerate_parts=None,
+               place_radius_m=places.DEFAULT_PLACE_RADIUS_M, place_min_dwell_s=places.DEFAULT_MIN_DWELL_S, log=no_log, progress=None):
+    log("Starting file processing...")
+    log(f"Excel path: {excel_path}")
+    log(f"Output folder: {output_folder}")
+    log(f"Start datetime: {start_datetime}")
+    log(f"End datetime: {end_datetime}")
+    log(f"Horizontal accuracy filter: {horizontal_accuracy_filter}")
+    log(f"Show date: {show_date}, Show time: {show_time}, Show speed: {show_speed}, Show bearing: {show_bearing}, Speed unit: {speed_unit}")
+    log(f"Partition by: {partition_by}")
+    if regenerate_parts:
+        log(f"Regenerating parts: {', '.join(str(number) for number in sorted(regenerate_parts))}")
+        if partition_by == "none" or "KML" not in formats:
+            raise ValueError("Single parts can only be regenerated for partitioned KML output.")
+    if partition_by == "trip":
+        log(f"New trip after a gap of {trip_gap_s} s or a jump of {trip_distance_m} m")
+    log(f"Output formats: {', '.join(formats)}")
+    if places.PLACES_FORMAT in formats:
+        log(f"Places: {place_min_dwell_s} s of dwell within {place_radius_m} m")
+    if accuracy_circles:
+        log("KML accuracy circles: on")
+    if time_order:
+        log(f"Sorting rows by time within {sort_memory_mb} MB of memory")
+    log(f"Incremental: {incremental}, Force: {force}, Compact: {compact}")
+    log(f"Movement check: {movement_check}, Exclude flagged: {exclude_flagged}, Max speed: {max_speed_kmh} km/h")
+    log(f"Hash algorithms: {', '.join(integrity.ALGORITHM_LABELS[algorithm] for algorithm in hash_algorithms)}")
+    if merge_paths:
+        log(f"Merging with: {', '.join(merge_paths)}")
+        if incremental:
+            raise ValueError("Incremental updates follow a single input, they cannot merge several inputs.")
+
+    # Skip the export when an intact output of the same input and settings is already in the output folder
+    input_filename = os.path.basename(excel_path)
+    filters_filename = f"Filters - {os.path.splitext(input_filename)[0]}.txt"
+    filters_path = os.path.join(output_folder, filters_filename)
+    run_parameters = manifest.export_parameters(start_datetime, end_datetime, horizontal_accuracy_filter, show_date, show_time, show_speed, show_bearing, speed_unit, formats)
+    run_parameters.update({"partition_by": partition_by, "points_per_partition": points_per_partition, "incremental": incremental, "compact": compact,
+                           "movement_check": movement_check, "exclude_flagged": exclude_flagged, "max_speed_kmh": max_speed_kmh,
+                           "hash_algorithms": list(hash_algorithms), "merge_paths": [os.path.basename(path) for path in merge_paths]})
+    if accuracy_circles:
+        run_parameters["accuracy_circles"] = True
+    if time_order:
+        run_parameters["time_order"] = True
+    if places.PLACES_FORMAT in formats:
+        run_parameters.update({"place_radius_m": place_radius_m, "place_min_dwell_s": place_min_dwell_s})
+    if partition_by == "trip":
+        run_parameters.update({"trip_gap_s": trip_gap_s, "trip_distance_m": trip_distance_m})
+
+    # Exports that only filter and write each row are streamed, so reading, filtering and writing overlap;
+    # the other options need every row at once
+    row_by_row = (not incremental and not movement_check and heatmap.HEATMAP_FORMAT not in formats
+                  and places.PLACES_FORMAT not in formats
+                  and (partition_by == "none" or "KML" not in formats))
+    # Streaming parses with openpyxl, so it is only worth it when no faster engine can read the whole sheet, and
+    # only when the file has not already been parsed in the background
+    streamable = (row_by_row and not merge_paths and not compact and not excel_path.endswith("-wal")
+                  and location_reader.preferred_engine() == "openpyxl")
+
+    # Each input is hashed in the same pass that parses it below
+    input_paths = [excel_path, *merge_paths]
+    inputs = [_load_input(path, frame_cache, hash_algorithms, compact, streamable, log) for path in input_paths]
+    input_record, cached_frame = inputs[0]
+    # Regenerating parts is a forced rebuild of those parts, the rest are left as they are
+    cached = None if force or incremental or regenerate_parts else _cached_run(filters_path, input_paths, inputs, run_parameters, hash_algorithms, log)
+    if cached:
+        output_paths, point_count = cached
+        log("An identical export already exists, skipping regeneration (use Force regenerate to rebuild it)")
+        _report_progress(progress, 1, 1)
+        return {"output_paths": output_paths, "point_count": point_count, "filters_path": filters_path, "cached": True}
+
+    streamed = streamable and cached_frame is None
+    read_state = {"rows": 0, "ZLATITUDE": False, "ZLONGITUDE": False}
+    merged_batches = None
+    if streamed:
+        df = None
+    elif merge_paths:
+        # Every input is parsed and sorted on its own, then a k-way merge on ZTIMESTAMP yields one time-ordered,
+        # de-duplicated stream without concatenating the inputs
+        frames = []
+        for path, (record, frame) in zip(input_paths, inputs):
+            if frame is None:
+                frame = _parse_input(path, record, hash_algorithms, compact=compact, log=log)
+            _check_coordinates(frame)
+            record["rows"] = len(frame)
+            frames.append(frame)
+        merged_batches = source_merge.merge_sources(
+            [source_merge.source_batches(frame, path) for path, frame in zip(input_paths, frames)], log=log)
+        # Only a row-by-row export can take the merged rows as a stream, the rest need them as one frame
+        df = None if row_by_row else pd.concat(list(merged_batches), ignore_index=True)
+        read_state["rows"] = sum(len(frame) for frame in frames)
+    elif cached_frame is not None:
+        df = cached_frame
+    else:
+        # Read the Excel export, or the WAL file itself, into a pandas DataFrame with the correct column names
+        df = _parse_input(excel_path, input_record, hash_algorithms, compact=compact, log=log)
+        log("File read successfully")
+
+    if df is not None and not merge_paths:
+        _check_coordinates(df)
+
+    # In incremental mode only rows newer than the last recorded export are processed
+    df_read = df
+    suffix = ""
+    if incremental:
+        parameters = manifest.export_parameters(start_datetime, end_datetime, horizontal_accuracy_filter, show_date, show_time, show_speed, show_bearing, speed_unit, formats)
+        filter_str = location_export.ACCURACY_FILTERS.get(horizontal_accuracy_filter, (None, "nil"))[1]
+        manifest_file = manifest.manifest_path(excel_path, output_folder, filter_str, start_datetime, end_datetime)
+        previous_manifest = manifest.matching_manifest(manifest_file, excel_path, parameters)
+        if previous_manifest:
+            df = manifest.select_new_rows(df, previous_manifest)
+            log(f"{len(df)} of {len(df_read)} rows are newer than update {len(previous_manifest['updates'])}")
+        else:
+            log("No matching manifest found, exporting all rows")
+        update_number = len(previous_manifest["updates"]) + 1 if previous_manifest else 1
+        suffix = f" - update {update_number:04d}"
+
+    # Filter the DataFrame based on the time window and horizontal accuracy
+    horizontal_accuracy_filter_str = location_export.ACCURACY_FILTERS.get(horizontal_accuracy_filter, (None, "nil"))[1]
+    if df is not None:
+        df, horizontal_accuracy_filter_str = location_export.apply_filters(df, start_datetime, end_datetime, horizontal_accuracy_filter)
+        log(f"Filtered frame memory: {location_reader.format_bytes(location_reader.frame_memory(df))} for {len(df)} rows")
+        if time_order:
+            df = movement_analysis.sort_by_time(df)
+
+    # Derive missing speed and course from consecutive fixes and flag implausible jumps
+    if movement_check:
+        df = movement_analysis.analyse_movement(df, max_speed_kmh=max_speed_kmh, log=log)
+        if exclude_flagged:
+            df = df[~movement_analysis.flagged(df)]
+            log(f"{len(df)} rows left after excluding flagged fixes")
+
+    output_paths = []
+    part_paths = []
+    point_count = 0
+    stream_formats = list(formats)
+    if partition_by != "none" and "KML" in stream_formats:
+        # Split the KML into time-contiguous partitions linked from a small index KML
+        stream_formats.remove("KML")
+        log(f"Writing partitioned KML files by {partition_by}...")
+        output_kml, point_count, part_paths = location_export.export_partitioned(
+            df, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime,
+            partition_by, show_date, show_time, show_speed, show_bearing, speed_unit,
+            points_per_partition=points_per_partition, algorithms=hash_algorithms, trip_gap_s=trip_gap_s, trip_distance_m=trip_distance_m,
+            accuracy_circles=accuracy_circles, max_workers=kml_processes, use_processes=bool(kml_processes and kml_processes > 1),
+            only_parts=set(regenerate_parts) if regenerate_parts else None, pool=kml_pool, log=log)
+        _report_progress(progress, 1, 1)
+        output_paths.append(output_kml)
+        log(f"KML file created: {output_kml}")
+        if regenerate_parts:
+            # The parts left alone were written by an earlier run, maybe in a process since closed; their digests
+            # come from that run's record while the files are as it left them
+            for part_path, record in manifest.recorded_outputs(filters_path, part_paths, output_folder).items():
+                if integrity.output_record(part_path) is None:
+                    integrity.record_output(part_path, record)
+    if heatmap.HEATMAP_FORMAT in stream_formats:
+        # A density raster stays the same size however many fixes it covers
+        stream_formats.remove(heatmap.HEATMAP_FORMAT)
+        log("Writing heatmap overlay...")
+        heatmap_paths, heatmap_count = heatmap.write_heatmap(
+            df, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime, suffix=suffix,
+            algorithms=hash_algorithms, log=log)
+        output_paths.extend(heatmap_paths)
+        point_count = max(point_count, heatmap_count)
+        log(f"Heatmap created: {heatmap_paths[0]}")
+    if places.PLACES_FORMAT in stream_formats:
+        # Clustering needs every fix, ranked places are written as placemarks and a table
+        stream_formats.remove(places.PLACES_FORMAT)
+        log("Finding frequently visited places...")
+        places_paths, place_count = places.write_places(
+            df, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime, suffix=suffix,
+            radius_m=place_radius_m, min_dwell_s=place_min_dwell_s, algorithms=hash_algorithms, log=log)
+        output_paths.extend(places_paths)
+        log(f"Places created: {places_paths[0]} ({place_count} places)")
+    if stream_formats:
+        # Stream the filtered rows to every selected format in a single pass
+        log(f"Writing {', '.join(stream_formats)} output...")
+        # GeoJSON goes one feature per line on the number of rows read, before any filter, so the streamed and
+        # whole-frame paths pick the same layout for the same input
+        if streamed:
+            row_count = input_rows = location_reader.excel_row_count(excel_path) or 0
+        else:
+            row_count = read_state["rows"] if df is None else len(df)
+            input_rows = read_state["rows"] if merge_paths else len(df_read)
+        # The outputs are made durable every few thousand rows, and a resumed run continues the same files from the
+        # last checkpoint of this input and these settings
+        checkpoint_digest = _checkpoint_digest(input_paths, run_parameters)
+        checkpoint_file = checkpoint.checkpoint_path(filters_path, checkpoint_digest)
+        resume_state = checkpoint.load_checkpoint(checkpoint_file, checkpoint_digest) if resume else None
+        if resume:
+            log(f"Resuming after {resume_state['rows']} rows" if resume_state else "No checkpoint of this export to resume, starting from the beginning")
+        file_exporters = exporters.open_exporters(
+            stream_formats, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime,
+            show_date, show_time, show_speed, show_bearing, speed_unit,
+            newline_delimited=input_rows > exporters.NEWLINE_DELIMITED_ROWS, suffix=suffix, algorithms=hash_algorithms,
+            resume=resume_state["outputs"] if resume_state else None, accuracy_circles=accuracy_circles)
+        skipped_rows = resume_state["rows"] if resume_state else 0
+        on_batch = checkpoint.Checkpointer(checkpoint_file, checkpoint_digest, file_exporters, rows=skipped_rows, every=checkpoint_rows, log=log)
+        if streamed:
+            # Each batch is filtered on its own thread while the next one is parsed and the previous one written
+            log(f"Streaming file: {excel_path} ({row_count} rows)")
+            hasher = None if input_record else integrity.InputHasher(hash_algorithms)
+            batches = pipeline.run_pipeline(
+                ("read", _read_stage(excel_path, hasher, row_count, read_state, progress)),
+                [("filter", lambda batch: location_export.apply_filters(batch, start_datetime, end_datetime, horizontal_accuracy_filter)[0])],
+                log=log)
+            if time_order:
+                # The sheet is streamed rather than held in memory, so the filtered rows are sorted through run files on disk
+                batches = external_sort.external_sort(batches, memory_mb=sort_memory_mb, log=log)
+            output_paths.extend(exporters.export_batches(checkpoint.skip_rows(batches, skipped_rows), file_exporters, log=log, on_batch=on_batch, processes=kml_processes, pool=kml_pool).values())
+            if not (read_state["ZLATITUDE"] and read_state["ZLONGITUDE"]):
+                raise ValueError("Latitude or Longitude columns are empty in the file.")
+            if hasher is not None:
+                input_record.update(hasher.record())
+                log(f"Input hashed while reading: {input_filename} | {integrity.format_record(input_record)}")
+        elif df is None:
+            # Merged rows are filtered on their own thread while the merge produces the next step; the merge is
+            # already in time order
+            batches = pipeline.run_pipeline(
+                ("merge", merged_batches),
+                [("filter", lambda batch: location_export.apply_filters(batch, start_datetime, end_datetime, horizontal_accuracy_filter)[0])],
+                log=log)
+            output_paths.extend(exporters.export_batches(checkpoint.skip_rows(batches, skipped_rows), file_exporters, log=log, on_batch=on_batch, processes=kml_processes, pool=kml_pool).values())
+        else:
+            output_paths.extend(exporters.export_batches(exporters.frame_batches(df.iloc[skipped_rows:]), file_exporters, total_rows=len(df) - skipped_rows,
+                                                         log=log, progress=progress, on_batch=on_batch, processes=kml_processes, pool=kml_pool).values())
+        checkpoint.clear_checkpoint(checkpoint_file)
+        point_count = max([point_count] + [exporter.point_count for exporter in file_exporters.values()])
+    if not merge_paths:
+        input_record["rows"] = read_state["rows"] if streamed else len(df_read)
+    if incremental:
+        # Record the new high-water mark and link every KML update from one index document
+        begin = location_export.kml_time(df["datetime"].min()) if len(df) else None
+        end = location_export.kml_time(df["datetime"].max()) if len(df) else None
+        export_manifest = manifest.record_update(previous_manifest, excel_path, parameters, df_read, df, output_paths, begin, end, input_record)
+        manifest.save_manifest(manifest_file, export_manifest)
+        log(f"Manifest saved to: {manifest_file}")
+        if "KML" in formats:
+            links = [(f"Update {update['number']}: {update['rows']} points", kml_file, update["begin"], update["end"])
+                     for update in export_manifest["updates"] if update["rows"]
+                     for kml_file in update["files"] if kml_file.endswith(".kml")]
+            output_kml = os.path.join(output_folder, location_export.export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime))
+            location_export.write_index(output_kml, links, hash_algorithms)
+            output_paths.append(output_kml)
+            log(f"Update index created: {output_kml}")
+    log(f"Total data points created: {point_count}")
+    digest = _run_digest(inputs, run_parameters)
+    log(f"Run digest: {digest}")
+
+    # Write filters and settings to a text file
+    with open(filters_path, 'w', encoding='utf-8') as f:
+        f.write(f"Start Date: {start_datetime.strftime('%d/%m/%Y %H:%M')}\n")
+        f.write(f"End Date: {end_datetime.strftime('%d/%m/%Y %H:%M')}\n")
+        f.write(f"Horizontal Accuracy Filter: {horizontal_accuracy_filter}\n")
+        f.write(f"Show Date: {show_date}\n")
+        f.write(f"Show Time: {show_time}\n")
+        f.write(f"Show Speed: {show_speed}\n")
+        f.write(f"Show Bearing: {show_bearing}\n")
+        f.write(f"Speed Unit: {speed_unit}\n")
+        f.write(f"Output Formats: {', '.join(formats)}\n")
+        if accuracy_circles:
+            f.write("Accuracy Circles: True\n")
+        if places.PLACES_FORMAT in formats:
+            f.write(f"Places: {place_min_dwell_s} s of dwell within {place_radius_m} m\n")
+        f.write(f"Partition By: {partition_by}\n")
+        if partition_by == "points":
+            f.write(f"Points Per Partition: {points_per_partition}\n")
+        if partition_by == "trip":
+            f.write(f"Trip Breaks: gap over {trip_gap_s} s or jump over {trip_distance_m} m\n")
+        if time_order:
+            f.write("Sorted By Time: True\n")
+        f.write(f"Incremental: {incremental}\n")
+        f.write(f"Movement Check: {movement_check}\n")
+        if movement_check:
+            f.write(f"Flagged Fixes: {'excluded' if exclude_flagged else 'marked'} above {max_speed_kmh} km/h\n")
+        f.writelines(manifest.input_line(path, record) for path, (record, _) in zip(input_paths, inputs))
+        f.write(f"Points Exported: {point_count}\n")
+        f.write(f"Run Digest: {digest}\n")
+        # Every partition gets its own line, the index is only as good as the files it links to
+        f.writelines(manifest.output_lines(output_paths + part_paths, output_folder))
+    manifest.save_run_record(filters_path, digest, point_count, output_paths + part_paths, output_folder)
+    log(f"Filters and settings saved to: {filters_path}")
+    return {"output_paths": output_paths, "point_count": point_count, "filters_path": filters_path, "cached": False}
+
+
+def run_colocation(excel_path, other_path, output_folder, start_datetime, end_datetime, horizontal_accuracy_filter,
+                   distance_m=colocation.DEFAULT_DISTANCE_M, time_s=colocation.DEFAULT_TIME_S,
+                   hash_algorithms=integrity.DEFAULT_ALGORITHMS, frame_cache=None, log=no_log, progress=None):
+    # Where and when device A (excel_path) and device B (other_path) were within distance_m and time_s of each other
+    log("Starting co-location check...")
+    log(f"Device A: {excel_path}")
+    log(f"Device B: {other_path}")
+    log(f"Tolerance: {distance_m} m plus both accuracy radii, {time_s} s")
+    name_a = os.path.splitext(os.path.basename(excel_path))[0]
+    name_b = os.path.splitext(os.path.basename(other_path))[0]
+    filters_path = os.path.join(output_folder, f"Filters - Co-location - {name_a} - {name_b}.txt")
+    run_parameters = manifest.export_parameters(start_datetime, end_datetime, horizontal_accuracy_filter, False, False, False, False, None, ["Co-location"])
+    run_parameters.update({"other_path": os.path.basename(other_path), "distance_m": distance_m, "time_s": time_s,
+                           "hash_algorithms": list(hash_algorithms)})
+
+    input_paths = [excel_path, other_path]
+    inputs = [_load_input(path, frame_cache, hash_algorithms, log=log) for path in input_paths]
+    cached = _cached_run(filters_path, input_paths, inputs, run_parameters, hash_algorithms, log)
+    if cached:
+        output_paths, point_count = cached
+        log("An identical co-location check already exists, skipping regeneration")
+        _report_progress(progress, 1, 1)
+        return {"output_paths": output_paths, "point_count": point_count, "filters_path": filters_path, "cached": True}
+
+    frames = []
+    for number, (path, (record, frame)) in enumerate(zip(input_paths, inputs), start=1):
+        if frame is None:
+            frame = _parse_input(path, record, hash_algorithms, log=log)
+        _check_coordinates(frame)
+        record["rows"] = len(frame)
+        frame, horizontal_accuracy_filter_str = location_export.apply_filters(frame, start_datetime, end_datetime, horizontal_accuracy_filter)
+        log(f"{os.path.basename(path)}: {len(frame)} fixes after filtering")
+        frames.append(frame)
+        _report_progress(progress, number, 4)
+
+    pairs = colocation.find_colocations(frames[0], frames[1], distance_m, time_s, log=log)
+    meetings = colocation.group_meetings(pairs)
+    log(f"Co-located fixes grouped into {len(meetings)} meetings")
+    _report_progress(progress, 3, 4)
+
+    output_name = f"Co-location - {name_a} - {name_b} - {horizontal_accuracy_filter_str} - {start_datetime.strftime('%Y%m%d%H%M')}_to_{end_datetime.strftime('%Y%m%d%H%M')}"
+    output_paths = [os.path.join(output_folder, output_name + ".kml"), os.path.join(output_folder, output_name + ".csv")]
+    colocation.write_colocation_kml(meetings, output_paths[0], name_a, name_b, hash_algorithms)
+    colocation.write_colocation_csv(pairs, output_paths[1], hash_algorithms)
+    for output_path in output_paths:
+        log(f"Co-location output created: {output_path}")
+    point_count = len(pairs)
+    _report_progress(progress, 4, 4)
+    digest = _run_digest(inputs, run_parameters)
+    log(f"Run digest: {digest}")
+
+    with open(filters_path, 'w', encoding='utf-8') as f:
+        f.write(f"Start Date: {start_datetime.strftime('%d/%m/%Y %H:%M')}\n")
+        f.write(f"End Date: {end_datetime.strftime('%d/%m/%Y %H:%M')}\n")
+        f.write(f"Horizontal Accuracy Filter: {horizontal_accuracy_filter}\n")
+        f.write(f"Co-location Distance: {distance_m} m plus both accuracy radii\n")
+        f.write(f"Co-location Time: {time_s} s\n")
+        f.writelines(manifest.input_line(path, record) for path, (record, _) in zip(input_paths, inputs))
+        f.write(f"Meetings Found: {len(meetings)}\n")
+        f.write(f"Points Exported: {point_count}\n")
+        f.write(f"Run Digest: {digest}\n")
+        f.writelines(manifest.output_lines(output_paths))
+    manifest.save_run_record(filters_path, digest, point_count, output_paths)
+    log(f"Filters and settings saved to: {filters_path}")
+    return {"output_paths": output_paths, "point_count": point_count, "filters_path": filters_path, "cached": False}
@@ -0,0 +1,320 @@
+import csv
+import integrity
+import accuracy_rings
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from xml.sax.saxutils import escape, quoteattr
+from location_export import COLUMN_NAMES, IPHONE_EPOCH, PROCESS_CONTEXT, RED_DOT_ICON, convert_timestamp, export_filename, no_log, placemark_fields
+
+# Rows handed to the writers at a time
+BATCH_SIZE = 5000
+
+# Above this many rows GeoJSON is written one feature per line
+NEWLINE_DELIMITED_ROWS = 100000
+
+# Accuracy rings are outlined in the colour of the dot they surround, with a faint fill
+RING_STYLES = {
+    "red_dot": "<LineStyle><color>ff0000ff</color><width>1</width></LineStyle><PolyStyle><color>330000ff</color></PolyStyle>",
+    "flagged_dot": "<LineStyle><color>ff00ffff</color><width>1</width></LineStyle><PolyStyle><color>3300ffff</color></PolyStyle>",
+}
+
+
+def frame_batches(df, batch_size=BATCH_SIZE):
+    for start in range(0, len(df), batch_size):
+        yield df.iloc[start:start + batch_size]
+
+
+def utc_time(ts):
+    return (IPHONE_EPOCH + timedelta(seconds=float(ts))).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _json_value(value):
+    # JSON has no NaN, so missing readings are written as null
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class Exporter:
+    extension = ""
+
+    def __init__(self, path, show_date=False, show_time=False, show_speed=False, show_bearing=False, speed_unit="km/h", algorithms=integrity.DEFAULT_ALGORITHMS,
+                 resume=None):
+        # resume is a state returned by checkpoint() of an earlier, interrupted writer of the same file
+        self.path = path
+        self.show_date = show_date
+        self.show_time = show_time
+        self.show_speed = show_speed
+        self.show_bearing = show_bearing
+        self.speed_unit = speed_unit
+        if resume is None:
+            self.point_count = 0
+            self.file = integrity.open_output(path, algorithms)
+            self.write_header()
+        else:
+            self.point_count = resume["point_count"]
+            self.file = integrity.open_output(path, algorithms, resume_at=resume["size"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_header(self):
+        pass
+
+    def write_footer(self):
+        pass
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def write_batch(self, batch):
+        # Rows without coordinates cannot be placed on a map
+        batch = batch[batch["ZLATITUDE"].notna() & batch["ZLONGITUDE"].notna()]
+        for row in batch.to_dict("records"):
+            self.write_row(row)
+        self.point_count += len(batch)
+
+    def placemark(self, row):
+        return placemark_fields(row, self.show_date, self.show_time, self.show_speed, self.show_bearing, self.speed_unit)
+
+    def checkpoint(self):
+        # Everything written so far made durable, and the state a resumed writer continues from
+        return {"path": self.path, "size": integrity.sync_output(self.file), "point_count": self.point_count}
+
+    def close(self):
+        if not self.file.closed:
+            self.write_footer()
+            integrity.hashing_writer(self.file).rows = self.point_count
+            self.file.close()
+        return self.point_count
+
+
+class KmlExporter(Exporter):
+    extension = ".kml"
+
+    def __init__(self, path, accuracy_circles=False, **options):
+        # With accuracy_circles each fix also gets a ring showing its horizontal accuracy radius
+        self.accuracy_circles = accuracy_circles
+        super().__init__(path, **options)
+
+    def write_header(self):
+        ring_styles = RING_STYLES if self.accuracy_circles else {}
+        self.file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+            '<Document>\n'
+            '<Style id="red_dot"><IconStyle><color>ff0000ff</color><scale>0.6</scale>'
+            f'<Icon><href>{escape(RED_DOT_ICON)}</href></Icon></IconStyle>{ring_styles.get("red_dot", "")}</Style>\n'
+            '<Style id="flagged_dot"><IconStyle><color>ff00ffff</color><scale>0.8</scale>'
+            f'<Icon><href>{escape(RED_DOT_ICON)}</href></Icon></IconStyle>{ring_styles.get("flagged_dot", "")}</Style>\n'
+        )
+
+    def fragment_options(self):
+        # Everything kml_fragment needs to render this file's placemarks, small enough to send to another process
+        return {"show_date": self.show_date, "show_time": self.show_time, "show_speed": self.show_speed, "show_bearing": self.show_bearing,
+                "speed_unit": self.speed_unit, "accuracy_circles": self.accuracy_circles}
+
+    def write_batch(self, batch):
+        self.write_fragment(*kml_fragment(batch, self.fragment_options()))
+
+    def write_fragment(self, text, count):
+        # Placemarks rendered by kml_fragment, possibly in another process
+        self.file.write(text)
+        self.point_count += count
+
+    def write_row(self, row, ring=None):
+        self.file.write(kml_placemark(row, ring, self.fragment_options()))
+
+    def write_footer(self):
+        self.file.write('</Document>\n</kml>\n')
+
+
+def kml_placemark(row, ring, options):
+    (lon, lat, alt), name, description = placemark_fields(row, options["show_date"], options["show_time"], options["show_speed"],
+                                                          options["show_bearing"], options["speed_unit"])
+    # Fixes flagged by the movement check are drawn in yellow
+    style = "flagged_dot" if row.get("teleport") or row.get("outlier") else "red_dot"
+    geometry = f'<Point><coordinates>{lon},{lat},{alt}</coordinates></Point>'
+    if ring is not None:
+        geometry = f'<MultiGeometry>{geometry}<Polygon><outerBoundaryIs><LinearRing><coordinates>{ring}</coordinates></LinearRing></outerBoundaryIs></Polygon></MultiGeometry>'
+    return (f'<Placemark><name>{escape(name)}</name><description>{escape(description)}</description>'
+            f'<styleUrl>#{style}</styleUrl>{geometry}</Placemark>\n')
+
+
+def kml_fragment(batch, options):
+    # The Placemark XML for a batch and the number of placemarks in it; the rings of the whole batch are generated
+    # together before the rows are rendered
+    batch = batch[batch["ZLATITUDE"].notna() & batch["ZLONGITUDE"].notna()]
+    if options["accuracy_circles"]:
+        rings = accuracy_rings.accuracy_rings(batch["ZLATITUDE"], batch["ZLONGITUDE"], batch["ZHORIZONTALACCURACY"])
+    else:
+        rings = [None] * len(batch)
+    return "".join(kml_placemark(row, ring, options) for row, ring in zip(batch.to_dict("records"), rings)), len(batch)
+
+
+class GeoJsonExporter(Exporter):
+    extension = ".geojson"
+
+    def __init__(self, path, newline_delimited=False, **options):
+        # Newline-delimited GeoJSON keeps one feature per line so large sets can be streamed back in
+        self.newline_delimited = newline_delimited
+        super().__init__(path, **options)
+        self.separator = ",\n" if self.point_count else ""
+
+    def write_header(self):
+        if not self.newline_delimited:
+            self.file.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write_row(self, row):
+        (lon, lat, alt), name, _ = self.placemark(row)
+        date_str, time_str, time_zone = convert_timestamp(row["ZTIMESTAMP"])
+        properties = {column: _json_value(row[column]) for column in COLUMN_NAMES}
+        properties["Z_PK"] = str(row["Z_PK"])  # The same text whether the key was read as text or compacted to an integer
+        properties.update({"name": name, "date": date_str, "time": time_str, "time_zone": time_zone})
+        if row.get("source_file"):
+            properties["source_file"] = row["source_file"]
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [_json_value(lon), _json_value(lat), _json_value(alt)]},
+            "properties": properties,
+        }
+        if self.newline_delimited:
+            self.file.write(json.dumps(feature) + "\n")
+        else:
+            self.file.write(self.separator + json.dumps(feature))
+            self.separator = ",\n"
+
+    def write_footer(self):
+        if not self.newline_delimited:
+            self.file.write("\n]}\n")
+
+
+class GpxExporter(Exporter):
+    extension = ".gpx"
+
+    def write_header(self):
+        self.file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="IPhone Location Data Map Exporter" xmlns="http://www.topografix.com/GPX/1/1">\n'
+            '<trk><name>ZRTCLLOCATIONMO</name><trkseg>\n'
+        )
+
+    def write_row(self, row):
+        (lon, lat, alt), name, description = self.placemark(row)
+        self.file.write(
+            f'<trkpt lat={quoteattr(str(lat))} lon={quoteattr(str(lon))}><ele>{alt}</ele><time>{utc_time(row["ZTIMESTAMP"])}</time>'
+            f'<name>{escape(name)}</name><desc>{escape(description)}</desc></trkpt>\n'
+        )
+
+    def write_footer(self):
+        self.file.write('</trkseg></trk>\n</gpx>\n')
+
+
+class CsvExporter(Exporter):
+    extension = ".csv"
+
+    def __init__(self, path, **options):
+        # The writer is made here rather than in write_header, which a resumed file skips
+        super().__init__(path, **options)
+        self.writer = csv.writer(self.file)
+
+    def write_header(self):
+        csv.writer(self.file).writerow(COLUMN_NAMES + ["Date", "Time", "Time Zone"])
+
+    def write_row(self, row):
+        date_str, time_str, time_zone = convert_timestamp(row["ZTIMESTAMP"])
+        self.writer.writerow([row[column] for column in COLUMN_NAMES] + [date_str, time_str, time_zone])
+
+
+EXPORT_FORMATS = {
+    "KML": KmlExporter,
+    "GeoJSON": GeoJsonExporter,
+    "GPX": GpxExporter,
+    "CSV": CsvExporter,
+}
+
+
+def open_exporters(formats, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime,
+                   show_date, show_time, show_speed, show_bearing, speed_unit, newline_delimited=False, suffix="", algorithms=integrity.DEFAULT_ALGORITHMS,
+                   resume=None, accuracy_circles=False):
+    # resume maps each format to the checkpointed state its writer continues from
+    exporters = {}
+    for export_format in formats:
+        exporter_class = EXPORT_FORMATS[export_format]
+        extension = exporter_class.extension
+        options = {"show_date": show_date, "show_time": show_time, "show_speed": show_speed, "show_bearing": show_bearing, "speed_unit": speed_unit,
+                   "algorithms": algorithms}
+        if exporter_class is KmlExporter:
+            options["accuracy_circles"] = accuracy_circles
+        if exporter_class is GeoJsonExporter:
+            options["newline_delimited"] = newline_delimited
+            if newline_delimited:
+                extension = ".geojsonl"
+        path = os.path.join(output_folder, export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime, extension=suffix + extension))
+        exporters[export_format] = exporter_class(path, resume=resume[export_format] if resume else None, **options)
+    return exporters
+
+
+def rendered_batches(batches, kml_exporters, processes, pool=None):
+    # Each batch with its KML fragments rendered in a process pool, yielded in order while later batches are still
+    # being rendered; a few batches per process are kept in flight. A pool passed in is left running for the next
+    # export, otherwise one is started for this export alone
+    executor = pool or ProcessPoolExecutor(max_workers=processes, mp_context=PROCESS_CONTEXT)
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append((batch, {export_format: executor.submit(kml_fragment, batch, exporter.fragment_options())
+                                    for export_format, exporter in kml_exporters.items()}))
+            if len(pending) > 2 * processes:
+                batch, futures = pending.popleft()
+                yield batch, {export_format: future.result() for export_format, future in futures.items()}
+        while pending:
+            batch, futures = pending.popleft()
+            yield batch, {export_format: future.result() for export_format, future in futures.items()}
+    finally:
+        if pool is None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for _, futures in pending:
+                for future in futures.values():
+                    future.cancel()
+
+
+def export_batches(batches, exporters, total_rows=None, log=no_log, progress=None, on_batch=None, processes=None, pool=None):
+    # Every writer sees each batch once, so several formats cost a single pass over the filtered rows;
+    # on_batch is told the rows handed over so far after each batch is written. With processes, KML placemarks are
+    # rendered in that many worker processes and written in order, so the file is the same as a serial export; pool
+    # is a process pool of that size kept running by the caller
+    kml_exporters = {export_format: exporter for export_format, exporter in exporters.items() if isinstance(exporter, KmlExporter)}
+    if processes and processes > 1 and kml_exporters:
+        log(f"Rendering KML in {processes} processes")
+        rendered = rendered_batches(batches, kml_exporters, processes, pool)
+    else:
+        rendered = ((batch, {}) for batch in batches)
+    done = 0
+    try:
+        for batch, fragments in rendered:
+            # Every format is written batch by batch in step, so a checkpoint always finds them at the same row
+            for export_format, exporter in exporters.items():
+                if export_format in fragments:
+                    exporter.write_fragment(*fragments[export_format])
+                else:
+                    exporter.write_batch(batch)
+            done += len(batch)
+            if on_batch:
+                on_batch(done)
+            if progress and total_rows:
+                progress(done, total_rows)
+    finally:
+        rendered.close()  # Stops the worker processes straight away when a write fails
+        for export_format, exporter in exporters.items():
+            exporter.close()
+            log(f"{export_format} file created: {exporter.path} ({exporter.point_count} points)")
+    return {export_format: exporter.path for export_format, exporter in exporters.items()}
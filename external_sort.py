@@ -0,0 +1,117 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from location_export import no_log
+from location_reader import format_bytes, frame_memory
+from source_merge import merge_sources
+
+# Memory the sort may hold at once; a run is spilled at half of it, since sorting a run copies it
+DEFAULT_SORT_MEMORY_MB = 512
+
+SORT_BATCH_SIZE = 5000
+MIN_MERGE_ROWS = 1000
+
+
+def _spill_run(df, folder, number):
+    # Writes each column of a sorted run to its own .npy file; numbers and dates are saved as they are, text as
+    # fixed-width unicode with a separate null mask, so every column can be memory-mapped back in slices
+    columns = []
+    for position, column in enumerate(df.columns):
+        series = df[column]
+        path = os.path.join(folder, f"run{number:04d}-{position}.npy")
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufcmM":
+            np.save(path, series.to_numpy())
+            columns.append((column, series.dtype, path, None))
+        else:
+            nulls = series.isna().to_numpy()
+            null_path = os.path.join(folder, f"run{number:04d}-{position}-null.npy")
+            np.save(path, np.asarray(series.astype(object).where(~nulls, "").astype(str).to_numpy(), dtype=str))
+            np.save(null_path, nulls)
+            columns.append((column, series.dtype, path, null_path))
+    return columns, len(df)
+
+
+def _read_run(columns, rows, chunk_rows):
+    # A spilled run as frames of about chunk_rows rows, copied out of the memory maps so the files can be removed
+    # after; a frame never ends part way through the rows of one timestamp, which keeps the merge stable
+    arrays = [(column, dtype, np.load(path, mmap_mode="r"), None if null_path is None else np.load(null_path, mmap_mode="r"))
+              for column, dtype, path, null_path in columns]
+    timestamps = next(values for column, _, values, _ in arrays if column == "ZTIMESTAMP")
+    start = 0
+    while start < rows:
+        end = min(start + chunk_rows, rows)
+        end = int(np.searchsorted(timestamps, timestamps[end - 1], side="right"))
+        data = {}
+        for column, dtype, values, nulls in arrays:
+            chunk = np.array(values[start:end])
+            if nulls is None:
+                data[column] = chunk
+            else:
+                chunk = chunk.astype(object)
+                chunk[nulls[start:end]] = None
+                data[column] = pd.Series(chunk, dtype=dtype)
+        yield pd.DataFrame(data)
+        start = end
+
+
+def _sorted_run(parts):
+    run = pd.concat(parts, ignore_index=True)
+    order = np.argsort(run["ZTIMESTAMP"].to_numpy(), kind="stable")
+    return run.iloc[order].reset_index(drop=True)
+
+
+def external_sort(batches, memory_mb=DEFAULT_SORT_MEMORY_MB, temp_dir=None, log=no_log):
+    # Yields the rows of the batches in ZTIMESTAMP order, keeping rows of equal time in the order they arrived. Input
+    # that fits in the budget is sorted in memory; larger input is cut into sorted runs spilled to a temporary folder,
+    # then merged back a slice of each run at a time. The folder is removed when the sort finishes or is abandoned.
+    budget = memory_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory(prefix="location-sort-", dir=temp_dir, ignore_cleanup_errors=True) as folder:
+        runs = []
+        parts = []
+        held = 0
+        held_total = 0
+        rows = 0
+        dropped = 0
+        for batch in batches:
+            # A row without a timestamp has no place in time order
+            timestamps = batch["ZTIMESTAMP"].astype(float)
+            dropped += int(timestamps.isna().sum())
+            batch = batch[timestamps.notna()].assign(ZTIMESTAMP=timestamps[timestamps.notna()])
+            if not len(batch):
+                continue
+            parts.append(batch)
+            size = frame_memory(batch)
+            held += size
+            held_total += size
+            rows += len(batch)
+            if held >= budget / 2:
+                runs.append(_spill_run(_sorted_run(parts), folder, len(runs)))
+                parts = []
+                held = 0
+        if dropped:
+            log(f"Sort skipped {dropped} rows without a timestamp")
+
+        if not runs:
+            # Everything fitted in memory, nothing was written to disk
+            if parts:
+                df = _sorted_run(parts)
+                log(f"Sorted {rows} rows by time in memory")
+                for start in range(0, len(df), SORT_BATCH_SIZE):
+                    yield df.iloc[start:start + SORT_BATCH_SIZE]
+            return
+        if parts:
+            runs.append(_spill_run(_sorted_run(parts), folder, len(runs)))
+            parts = []
+        log(f"Sorting {rows} rows by time: {len(runs)} runs spilled within a budget of {format_bytes(budget)}")
+
+        # Each run contributes one slice to the merge at a time, and the merge step holds about as much again
+        row_bytes = max(1, held_total / rows)
+        chunk_rows = max(MIN_MERGE_ROWS, int(budget / (len(runs) + 1) / row_bytes / 2))
+        readers = [_read_run(columns, run_rows, chunk_rows) for columns, run_rows in runs]
+        try:
+            # Runs are listed in input order, so the merge's stable tie-break keeps equal times in arrival order
+            yield from merge_sources(readers, deduplicate=False, log=log)
+        finally:
+            for reader in readers:
+                reader.close()
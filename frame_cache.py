@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import integrity
+import location_reader
+import timeline
+from location_export import no_log
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# Parsed frames kept at once; each one is a whole device extraction
+CACHE_ENTRIES = 2
+
+
+def file_key(path, algorithms=integrity.DEFAULT_ALGORITHMS, compact=False):
+    # A re-extraction saved over the same path changes its size or modification time, which makes it a new entry; a
+    # compact frame is an entry of its own
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size, tuple(algorithms), bool(compact)
+
+
+def _load(path, algorithms, compact, log):
+    # Hash and parse in one pass over the file, exactly as a run without the cache would
+    hasher = integrity.InputHasher(algorithms)
+    df = location_reader.read_locations(path, compact=compact, log=log, hasher=hasher)
+    return hasher.record(), df
+
+
+class FrameCache:
+
+    def __init__(self, max_entries=CACHE_ENTRIES, workers=1, max_bytes=None):
+        # Loads run on their own pool so a prefetch never waits behind a queued export; with max_bytes the least
+        # recently used frames are also dropped while the loaded frames take more memory than that
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.timelines = {}
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _loaded(self, key, future):
+        if future.cancelled() or future.exception() is not None or key in self.sizes:
+            return
+        size = location_reader.frame_memory(future.result()[1])
+        with self.lock:
+            if self.entries.get(key) is future:
+                self.sizes[key] = size
+                self._trim()
+
+    def _trim(self):
+        # The most recently used entry always stays, even when it alone is over the budget
+        while len(self.entries) > self.max_entries or (
+                self.max_bytes is not None and len(self.entries) > 1 and self.memory() > self.max_bytes):
+            key, _ = self.entries.popitem(last=False)
+            self.sizes.pop(key, None)
+            self.timelines.pop(key, None)
+
+    def memory(self):
+        # Bytes held by the frames loaded so far
+        with self.lock:
+            return sum(self.sizes.values())
+
+    def prefetch(self, path, algorithms=integrity.DEFAULT_ALGORITHMS, compact=False, log=no_log):
+        # Starts loading the file unless it is already loaded or loading, and returns its future
+        key = file_key(path, algorithms, compact)
+        with self.lock:
+            future = self.entries.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self.executor.submit(_load, path, algorithms, compact, log)
+                self.entries[key] = future
+                self.sizes.pop(key, None)
+                self.timelines.pop(key, None)
+                future.add_done_callback(lambda done, key=key: self._loaded(key, done))
+            self.entries.move_to_end(key)
+            self._trim()
+        return future
+
+    def load(self, path, algorithms=integrity.DEFAULT_ALGORITHMS, compact=False, log=no_log):
+        # The input record and typed frame for the file, waiting for a prefetch that is still running; the budget is
+        # applied before returning rather than whenever the load's callback gets to it
+        future = self.prefetch(path, algorithms, compact, log)
+        result = future.result()
+        self._loaded(file_key(path, algorithms, compact), future)
+        return result
+
+    def timeline(self, path, algorithms=integrity.DEFAULT_ALGORITHMS, log=no_log):
+        # The timeline index of the file's frame, waiting for its load; the text timestamps are converted to numbers
+        # once per loaded frame, so asking again for the same file is instant
+        key = file_key(path, algorithms)
+        df = self.load(path, algorithms, log=log)[1]
+        with self.lock:
+            index = self.timelines.get(key)
+        if index is None:
+            index = timeline.TimelineIndex(df)
+            with self.lock:
+                if key in self.entries:
+                    self.timelines[key] = index
+        return index
+
+    def status(self, path, algorithms=integrity.DEFAULT_ALGORITHMS, compact=False):
+        try:
+            key = file_key(path, algorithms, compact)
+        except OSError:
+            return None
+        with self.lock:
+            future = self.entries.get(key)
+        if future is None:
+            return None
+        if not future.done():
+            return LOADING
+        return FAILED if future.exception() is not None else READY
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
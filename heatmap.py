@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import simplekml
+import integrity
+from PIL import Image
+from location_export import export_filename, no_log
+
+HEATMAP_FORMAT = "Heatmap"
+
+# Pixels along the longer side of the raster, so the PNG size does not depend on the number of fixes
+HEATMAP_SIZE = 1024
+
+# Margin added around the fixes, and the smallest box drawn around a single spot, in degrees
+BOUNDS_MARGIN = 0.0005
+
+# Colour ramp from sparse to dense: blue, cyan, green, yellow, red
+COLOUR_STOPS = np.array([
+    [0, 0, 255],
+    [0, 255, 255],
+    [0, 255, 0],
+    [255, 255, 0],
+    [255, 0, 0],
+], dtype=np.float64)
+
+
+def colour_table(levels=256):
+    # RGBA lookup table for density levels 1..levels-1; level 0 (no fixes) stays transparent
+    positions = np.linspace(0, len(COLOUR_STOPS) - 1, levels)
+    table = np.zeros((levels, 4), dtype=np.uint8)
+    for channel in range(3):
+        table[:, channel] = np.interp(positions, np.arange(len(COLOUR_STOPS)), COLOUR_STOPS[:, channel]).round()
+    table[:, 3] = 200
+    table[0] = 0
+    return table
+
+
+def heatmap_bounds(lat, lon):
+    # North, south, east and west edges of the overlay
+    north, south = float(lat.max()) + BOUNDS_MARGIN, float(lat.min()) - BOUNDS_MARGIN
+    east, west = float(lon.max()) + BOUNDS_MARGIN, float(lon.min()) - BOUNDS_MARGIN
+    return min(north, 90.0), max(south, -90.0), min(east, 180.0), max(west, -180.0)
+
+
+def density_grid(lat, lon, bounds, size=HEATMAP_SIZE):
+    # Pixels are roughly square on the ground, so a degree of longitude counts for cos(latitude) of a degree of latitude
+    north, south, east, west = bounds
+    ground_width = (east - west) * np.cos(np.radians((north + south) / 2))
+    ground_height = north - south
+    scale = size / max(ground_width, ground_height)
+    width = max(int(round(ground_width * scale)), 1)
+    height = max(int(round(ground_height * scale)), 1)
+
+    # One bincount over flattened pixel indexes, row 0 is the northern edge
+    columns = np.clip(((lon - west) / (east - west) * width).astype(np.int64), 0, width - 1)
+    rows = np.clip(((north - lat) / (north - south) * height).astype(np.int64), 0, height - 1)
+    return np.bincount(rows * width + columns, minlength=width * height).reshape(height, width)
+
+
+def render_heatmap(counts, levels=256):
+    # Log scale keeps a few very busy pixels, like home, from washing out everything else
+    scaled = np.log1p(counts)
+    top = scaled.max()
+    if top > 0:
+        scaled = scaled / top
+    indexes = np.where(counts > 0, 1 + (scaled * (levels - 2)).round().astype(np.int64), 0)
+    return Image.fromarray(colour_table(levels)[indexes], "RGBA")
+
+
+def write_heatmap(df, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime, suffix="", size=HEATMAP_SIZE,
+                  algorithms=integrity.DEFAULT_ALGORITHMS, log=no_log):
+    # Writes a density PNG and a KML GroundOverlay placing it, returns the files written and the number of fixes binned
+    located = df["ZLATITUDE"].notna() & df["ZLONGITUDE"].notna()
+    lat = df.loc[located, "ZLATITUDE"].to_numpy(dtype=np.float64)
+    lon = df.loc[located, "ZLONGITUDE"].to_numpy(dtype=np.float64)
+    kml_path = os.path.join(output_folder, export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime, extension=f"{suffix} - heatmap.kml"))
+    png_path = os.path.splitext(kml_path)[0] + ".png"
+
+    kml = simplekml.Kml()
+    output_paths = [kml_path]
+    if len(lat):
+        bounds = heatmap_bounds(lat, lon)
+        counts = density_grid(lat, lon, bounds, size=size)
+        with integrity.open_output(png_path, algorithms, text=False) as f:
+            render_heatmap(counts).save(f, format="PNG", optimize=True)
+        output_paths.append(png_path)
+        log(f"Heatmap raster: {counts.shape[1]}x{counts.shape[0]} pixels, busiest pixel {int(counts.max())} fixes")
+
+        overlay = kml.newgroundoverlay(name=f"Fix density ({len(lat)} fixes)")
+        overlay.icon.href = os.path.basename(png_path)  # Relative, so the KML and PNG can be moved together
+        overlay.latlonbox.north, overlay.latlonbox.south, overlay.latlonbox.east, overlay.latlonbox.west = bounds
+    else:
+        log("No fixes with coordinates, the heatmap is empty")
+    integrity.save_kml(kml, kml_path, algorithms)
+    return output_paths, len(lat)
@@ -0,0 +1,222 @@
+import contextlib
+import hashlib
+import io
+import os
+import threading
+
+# SHA-256 is always recorded, MD5 on request for labs that still catalogue evidence by it
+DEFAULT_ALGORITHMS = ("sha256",)
+ALGORITHM_LABELS = {"sha256": "SHA-256", "md5": "MD5"}
+
+# Bytes read from the input at a time, and the write buffer each output file gets
+READ_CHUNK = 1024 * 1024
+WRITE_BUFFER = 1024 * 1024
+
+# Records of the outputs written through open_output in this process, by absolute path
+_written = {}
+_written_lock = threading.Lock()
+
+
+class InputHasher:
+    # Digests of an input, fed to it in file order by whichever reader parses the file
+
+    def __init__(self, algorithms=DEFAULT_ALGORITHMS):
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+        self.size = 0
+
+    def update(self, chunk):
+        for digest in self.hashes.values():
+            digest.update(chunk)
+        self.size += len(chunk)
+
+    def record(self):
+        return {"size": self.size, **{algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}}
+
+
+class HashingReader(io.RawIOBase):
+    # Reader that feeds every byte of the file to a hasher once and in order, however the parser moves around in it:
+    # a seek past the bytes hashed so far hashes the gap on the way, and finish hashes whatever the parser never read
+
+    def __init__(self, raw, hasher):
+        self.raw = raw
+        self.hasher = hasher
+        self.hashed = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def _hash_to(self, position=None):
+        # Hashes from the end of the hashed bytes up to position, or to the end of the file, in chunks
+        if position is not None and position <= self.hashed:
+            return
+        current = self.raw.tell()
+        self.raw.seek(self.hashed)
+        while position is None or self.hashed < position:
+            chunk = self.raw.read(READ_CHUNK if position is None else min(READ_CHUNK, position - self.hashed))
+            if not chunk:
+                break
+            self.hasher.update(chunk)
+            self.hashed += len(chunk)
+        self.raw.seek(current)
+
+    def readinto(self, buffer):
+        start = self.raw.tell()
+        self._hash_to(start)
+        count = self.raw.readinto(buffer)
+        if count and start + count > self.hashed:
+            with memoryview(buffer).cast("B") as view:
+                self.hasher.update(view[self.hashed - start:count])
+            self.hashed = start + count
+        return count
+
+    def finish(self):
+        self._hash_to()
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class HashingWriter(io.RawIOBase):
+    # Writer that hashes every byte as it goes to disk and records the result when closed
+
+    def __init__(self, path, algorithms=DEFAULT_ALGORITHMS, resume_at=None):
+        # With resume_at the file is cut back to that many bytes and written on from there; the bytes kept are read
+        # once to bring the digests up to date, since a hash in progress cannot be saved
+        self.path = path
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+        self.size = 0
+        self.rows = None
+        if resume_at is None:
+            self.raw = open(path, "wb", buffering=0)
+            return
+        self.raw = open(path, "r+b", buffering=0)
+        self.raw.truncate(resume_at)
+        for chunk in iter(lambda: self.raw.read(READ_CHUNK), b""):
+            for digest in self.hashes.values():
+                digest.update(chunk)
+            self.size += len(chunk)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        count = self.raw.write(data)
+        chunk = memoryview(data)[:count]
+        for digest in self.hashes.values():
+            digest.update(chunk)
+        self.size += count
+        return count
+
+    def digests(self):
+        return {algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+            record = {"size": self.size, **self.digests()}
+            if self.rows is not None:
+                record["rows"] = self.rows
+            with _written_lock:
+                _written[os.path.abspath(self.path)] = record
+        super().close()
+
+
+@contextlib.contextmanager
+def open_input(path, hasher=None):
+    # The file as a parser reads it; with a hasher every byte also goes through a HashingReader and the rest of the
+    # file is hashed once the parser is done, so the digest comes out of the parsing pass. A zip is read from its end
+    # first, which makes the reader hash the whole workbook in chunks on that first seek, never holding it in memory
+    if hasher is None:
+        with open(path, "rb") as f:
+            yield f
+        return
+    reader = HashingReader(open(path, "rb", buffering=0), hasher)
+    with io.BufferedReader(reader, buffer_size=READ_CHUNK) as f:
+        yield f
+        reader.finish()
+
+
+def hash_file(path, algorithms=DEFAULT_ALGORITHMS):
+    # Digests of a file on its own, for when they are needed before it is parsed
+    hasher = InputHasher(algorithms)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            hasher.update(chunk)
+    return hasher.record()
+
+
+def open_output(path, algorithms=DEFAULT_ALGORITHMS, text=True, resume_at=None):
+    # Buffered output whose digest is taken from the bytes written, never by reading the file back
+    raw = HashingWriter(path, algorithms, resume_at)
+    buffered = io.BufferedWriter(raw, buffer_size=WRITE_BUFFER)
+    return io.TextIOWrapper(buffered, encoding="utf-8", newline="") if text else buffered
+
+
+def hashing_writer(file):
+    # The HashingWriter underneath a file returned by open_output
+    raw = getattr(file, "buffer", file).raw
+    return raw if isinstance(raw, HashingWriter) else None
+
+
+def sync_output(file):
+    # Pushes everything written so far to disk and returns the byte count it reached
+    file.flush()
+    writer = hashing_writer(file)
+    os.fsync(writer.raw.fileno())
+    return writer.size
+
+
+def save_kml(kml, path, algorithms=DEFAULT_ALGORITHMS):
+    # Same text simplekml's own save writes
+    with open_output(path, algorithms) as f:
+        f.write(kml.kml())
+
+
+def record_output(path, record):
+    # Takes on the record of a file written through open_output in another process
+    with _written_lock:
+        _written[os.path.abspath(path)] = record
+
+
+def output_record(path):
+    # Only trusted while the file is still the size it was written at
+    with _written_lock:
+        record = _written.get(os.path.abspath(path))
+    if record is None or not os.path.isfile(path) or os.path.getsize(path) != record["size"]:
+        return None
+    return record
+
+
+def format_record(record):
+    fields = [f"{record['size']} bytes"]
+    fields.extend(f"{label} {record[algorithm]}" for algorithm, label in ALGORITHM_LABELS.items() if algorithm in record)
+    if "rows" in record:
+        fields.append(f"{record['rows']} rows")
+    return " | ".join(fields)
+
+
+def parse_record(text):
+    # The record format_record wrote, or None for text it did not write
+    fields = text.split(" | ")
+    size, _, unit = fields[0].partition(" ")
+    if unit != "bytes" or not size.isdigit():
+        return None
+    record = {"size": int(size)}
+    algorithms = {label: algorithm for algorithm, label in ALGORITHM_LABELS.items()}
+    for field in fields[1:]:
+        label, _, value = field.partition(" ")
+        if label in algorithms:
+            record[algorithms[label]] = value
+        elif value == "rows" and label.isdigit():
+            record["rows"] = int(label)
+    return record
@@ -0,0 +1,68 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+# A queued export; the arguments are a read-only view so a job cannot change after it is submitted, and a job with
+# no target of its own runs the queue's
+ExportJob = namedtuple("ExportJob", ["job_id", "label", "arguments", "target"], defaults=(None,))
+
+QUEUED = "Queued"
+RUNNING = "Running"
+DONE = "Done"
+FAILED = "Failed"
+
+
+class JobQueue:
+
+    def __init__(self, target, workers=2):
+        # Workers only call target and post events, the GUI thread drains the events and touches the widgets
+        self.target = target
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.job_count = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, label, arguments, target=None):
+        with self.lock:
+            self.job_count += 1
+            job = ExportJob(self.job_count, label, MappingProxyType(dict(arguments)), target)
+        self.events.put((QUEUED, job.job_id, job))
+        self.jobs.put(job)
+        return job
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            job_id = job.job_id
+            self.events.put((RUNNING, job_id, time.monotonic()))
+
+            def log(message):
+                self.events.put(("log", job_id, message))
+
+            def progress(done, total):
+                self.events.put(("progress", job_id, int(done / total * 100) if total else 100))
+
+            try:
+                result = (job.target or self.target)(**job.arguments, log=log, progress=progress)
+            except Exception as e:
+                self.events.put((FAILED, job_id, e))
+            else:
+                self.events.put((DONE, job_id, result))
+
+    def pending_events(self):
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def shutdown(self):
+        for _ in self.threads:
+            self.jobs.put(None)
@@ -0,0 +1,111 @@
+import argparse
+import json
+import math
+import os
+import sys
+from datetime import datetime
+import integrity
+import location_reader
+import point_lookup
+import worker_service
+from location_export import convert_timestamp, iphone_seconds
+
+# Command line tools for the same exports the GUI reads:
+#   python location_cli.py locate "Cache export.xlsx" "01/01/2024 14:32:10" [more times...] [--times-file times.txt] [--kml where.kml]
+#   python location_cli.py serve [--memory-mb 2048]
+#   python location_cli.py submit job.json
+
+TIME_FORMATS = ["%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M"]
+
+
+def parse_time(text):
+    # Brisbane wall-clock time, as the GUI and the exports show it, to seconds since the iPhone epoch
+    for time_format in TIME_FORMATS:
+        try:
+            return iphone_seconds(datetime.strptime(text.strip(), time_format))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"Unrecognised time '{text}', use DD/MM/YYYY HH:MM:SS")
+
+
+def locate_command(args):
+    queries = list(args.times)
+    if args.times_file:
+        with open(args.times_file, encoding="utf-8") as f:
+            queries.extend(parse_time(line) for line in f if line.strip())
+    if not queries:
+        raise SystemExit("No times given to look up.")
+    index = point_lookup.LocationIndex(location_reader.read_locations(args.source))
+    results = index.locate(queries, max_gap=args.max_gap)
+    for row in results.itertuples(index=False):
+        date_str, time_str, _ = convert_timestamp(row.query)
+        if not math.isnan(row.latitude):
+            print(f"{date_str} {time_str}  {row.latitude:.6f}, {row.longitude:.6f}  +/- {row.uncertainty:.1f} m  (nearest fix {row.nearest_pk}, {row.time_offset:+.0f} s)")
+        else:
+            print(f"{date_str} {time_str}  nearest fix {row.nearest_pk} at {row.nearest_latitude:.6f}, {row.nearest_longitude:.6f}  +/- {row.nearest_accuracy:.1f} m  ({row.time_offset:+.0f} s, not interpolated)")
+    if args.kml:
+        point_lookup.write_lookup_kml(results, args.kml)
+        print(f"KML written: {args.kml}")
+    if args.csv:
+        with integrity.open_output(args.csv) as f:
+            results.to_csv(f, index=False)
+            integrity.hashing_writer(f).rows = len(results)
+        print(f"CSV written: {args.csv}")
+
+
+def serve_command(args):
+    service = worker_service.WorkerService(args.address, max_bytes=args.memory_mb * 1024 * 1024, kml_processes=args.kml_processes, log=print)
+    service.serve_forever()
+
+
+def submit_command(args):
+    # The job spec is {"command": "export", "arguments": {...run_export arguments...}}, times in ISO format
+    if args.spec in ("ping", "shutdown"):
+        spec = {"command": args.spec}
+    else:
+        with open(args.spec, encoding="utf-8") as f:
+            spec = json.load(f)
+    reply = worker_service.submit(spec, args.address)
+    for line in reply.get("log", []):
+        print(line)
+    if reply["status"] != "done":
+        raise SystemExit(f"Job failed: {reply['error']}")
+    print(json.dumps(reply["result"], indent=2))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="iPhone location cache tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    locate = commands.add_parser("locate", help="Where the phone was at the given times (AEST)")
+    locate.add_argument("source", help="Excel export or Cache.sqlite-wal file")
+    locate.add_argument("times", nargs="*", type=parse_time, help="Times as DD/MM/YYYY HH:MM:SS")
+    locate.add_argument("--times-file", help="File with one time per line")
+    locate.add_argument("--max-gap", type=float, default=point_lookup.MAX_INTERPOLATION_GAP_S,
+                        help="Longest gap in seconds between fixes to interpolate across")
+    locate.add_argument("--kml", help="Also write the positions to this KML file")
+    locate.add_argument("--csv", help="Also write the results to this CSV file")
+    locate.set_defaults(handler=locate_command)
+
+    serve = commands.add_parser("serve", help="Keep a worker running that holds loaded files in memory between exports")
+    serve.add_argument("--address", help="Socket path, or pipe name on Windows")
+    serve.add_argument("--memory-mb", type=int, default=worker_service.DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                       help="Memory the loaded files may take before the least recently used are dropped")
+    serve.add_argument("--kml-processes", type=int, default=os.cpu_count(),
+                       help="Processes rendering KML placemarks for each export, 1 to render them in the service itself")
+    serve.set_defaults(handler=serve_command)
+
+    submit = commands.add_parser("submit", help="Run a job on the worker started with serve")
+    submit.add_argument("spec", help="JSON job spec file, or ping / shutdown")
+    submit.add_argument("--address", help="Socket path, or pipe name on Windows")
+    submit.set_defaults(handler=submit_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,14 +1,26 @@
 # Ensure you have Pillow installed: pip install pillow
-import pandas as pd
-import simplekml
-from datetime import datetime, timedelta
+# Optional: pip install python-calamine for much faster reading of large Excel exports
+from datetime import datetime
 import tkinter as tk
 from tkinter import filedialog, messagebox, Toplevel, Label, HORIZONTAL
-from tkinter.ttk import Progressbar, Combobox
+from tkinter.ttk import Progressbar, Combobox, Treeview
 from tkcalendar import DateEntry
 import os
+import queue
 import threading
+import time
 from PIL import Image, ImageTk
+import location_export
+import exporters
+import colocation
+import heatmap
+import places
+import movement_analysis
+import export_runner
+import job_queue as job_queue_module
+import frame_cache as frame_cache_module
+import trips
+from location_export import PARTITION_MODES
 
 def update_speed_unit_state():
     log_message("Updating speed unit state...")
@@ -20,212 +32,193 @@ def update_speed_unit_state():
         ms_radiobutton.config(state=tk.DISABLED)
 
 def convert_timestamp(ts):
-    try:
-        log_message(f"Converting timestamp: {ts}")
-        # iPhone epoch starts from 2001-01-01
-        iphone_epoch_start = datetime(2001, 1, 1)
-        utc_time = iphone_epoch_start + timedelta(seconds=float(ts))
-        brisbane_time = utc_time + timedelta(hours=10)
-        return brisbane_time.strftime('%d/%m/%Y'), brisbane_time.strftime('%H:%M:%S'), 'AEST (UTC+10)'
-    except ValueError:
+    log_message(f"Converting timestamp: {ts}")
+    date_str, time_str, time_zone = location_export.convert_timestamp(ts)
+    if time_zone == 'Unknown':
         log_message(f"Failed to convert timestamp: {ts}")
-        return ts, ts, 'Unknown'  # Return as-is if conversion fails
+    return date_str, time_str, time_zone
 
 def log_message(message):
     log_window.insert(tk.END, message + "\n")
     log_window.see(tk.END)
 
-def process_file(excel_path, output_folder, start_datetime, end_datetime, horizontal_accuracy_filter, progress_bar, show_date, show_time, show_speed, show_bearing, speed_unit):
-    try:
-        log_message("Starting file processing...")
-        log_message(f"Excel path: {excel_path}")
-        log_message(f"Output folder: {output_folder}")
-        log_message(f"Start datetime: {start_datetime}")
-        log_message(f"End datetime: {end_datetime}")
-        log_message(f"Horizontal accuracy filter: {horizontal_accuracy_filter}")
-        log_message(f"Show date: {show_date}, Show time: {show_time}, Show speed: {show_speed}, Show bearing: {show_bearing}, Speed unit: {speed_unit}")
-
-        # Define the column names
-        column_names = [
-            "Z_PK", "ZALTITUDE", "ZCOURSE", "ZHORIZONTALACCURACY", "ZLATITUDE", "ZLONGITUDE",
-            "ZSPEED", "ZTIMESTAMP", "ZVERTICALACCURACY"
-        ]
-
-        # Read the Excel file into a pandas DataFrame with the correct column names
-        log_message(f"Reading Excel file: {excel_path}")
-        df = pd.read_excel(excel_path, usecols=column_names, dtype={
-            "Z_PK": str, "ZALTITUDE": float, "ZCOURSE": float, "ZHORIZONTALACCURACY": float, "ZLATITUDE": float, "ZLONGITUDE": float,
-            "ZSPEED": float, "ZTIMESTAMP": str, "ZVERTICALACCURACY": float
-        })
-        log_message("Excel file read successfully")
-
-        # Check if latitude and longitude columns are present and not empty
-        if "ZLATITUDE" not in df.columns or "ZLONGITUDE" not in df.columns:
-            raise ValueError("Latitude or Longitude columns are missing in the file.")
-        if df["ZLATITUDE"].isna().all() or df["ZLONGITUDE"].isna().all():
-            raise ValueError("Latitude or Longitude columns are empty in the file.")
-
-        # Filter the DataFrame based on the start and end datetime
-        df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float)
-        df["datetime"] = df["ZTIMESTAMP"].apply(lambda ts: datetime(2001, 1, 1) + timedelta(seconds=ts) + timedelta(hours=10))
-        df = df[(df["datetime"] >= start_datetime) & (df["datetime"] <= end_datetime)]
-
-        # Apply horizontal accuracy filter
-        if horizontal_accuracy_filter == "< 10m":
-            df = df[df["ZHORIZONTALACCURACY"] < 10]
-            horizontal_accuracy_filter_str = "less than 10m"
-        elif horizontal_accuracy_filter == "< 50m":
-            df = df[df["ZHORIZONTALACCURACY"] < 50]
-            horizontal_accuracy_filter_str = "less than 50m"
-        elif horizontal_accuracy_filter == "< 100m":
-            df = df[df["ZHORIZONTALACCURACY"] < 100]
-            horizontal_accuracy_filter_str = "less than 100m"
-        elif horizontal_accuracy_filter == "< 500m":
-            df = df[df["ZHORIZONTALACCURACY"] < 500]
-            horizontal_accuracy_filter_str = "less than 500m"
+def show_large_export_warning(point_count):
+    # Display warning if more than 1000 data points
+    if point_count > 1000:
+        warning_message = (
+            "WARNING - This file may crash Google Earth due to the large data volume."
+            "Consider re-applying filters or using the Heatmap output if there are issues."
+        )
+        log_message(f"WARNING: {warning_message}")
+        messagebox.showwarning("Warning", warning_message)
+
+def poll_jobs():
+    # Results, progress and errors come back from the worker threads through the job queue
+    for event, job_id, value in job_queue.pending_events():
+        item = str(job_id)
+        if event == job_queue_module.QUEUED:
+            job_started[job_id] = None
+            job_list.insert("", tk.END, iid=item, values=(job_id, value.label, event, "0%", ""))
+        elif event == job_queue_module.RUNNING:
+            job_started[job_id] = value
+            job_list.set(item, "status", event)
+        elif event == "log":
+            log_message(f"[Job {job_id}] {value}")
+        elif event == "progress":
+            job_list.set(item, "progress", f"{value}%")
+            progress_bar['value'] = value
+        elif event == job_queue_module.DONE:
+            job_list.set(item, "status", "Done (cached)" if value["cached"] else event)
+            job_list.set(item, "progress", "100%")
+            job_started.pop(job_id, None)
+            show_large_export_warning(value["point_count"])
+            show_success_message(value["output_paths"], value["point_count"], value["filters_path"])
+        elif event == job_queue_module.FAILED:
+            job_list.set(item, "status", event)
+            job_started.pop(job_id, None)
+            log_message(f"[Job {job_id}] An error occurred: {value}")
+            messagebox.showerror("Error", f"Job {job_id}: An error occurred: {value}")
+
+    # A timeline preview finished loading in the background
+    for excel_path, result in drain_queue(preview_events):
+        if excel_path != excel_path_entry.get():
+            continue  # Another file was selected while this one loaded
+        if isinstance(result, Exception):
+            log_message(f"Timeline preview failed for {excel_path}: {result}")
+            preview_count_label.config(text="Preview failed")
         else:
-            horizontal_accuracy_filter_str = "nil"
-
-        # Create a KML object
-        log_message("Creating KML object...")
-        kml = simplekml.Kml()
-
-        # Define the style for the red dot icon
-        red_dot_style = simplekml.Style()
-        red_dot_style.iconstyle.icon.href = 'http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png'
-        red_dot_style.iconstyle.color = simplekml.Color.red  # Set the color to red
-        red_dot_style.iconstyle.scale = 0.6  # Increase the icon size
-
-        # Iterate through the DataFrame and create placemarks
-        log_message("Iterating through DataFrame...")
-        point_count = 0
-        total_rows = len(df)
-        for index, row in df.iterrows():
-            lat = row["ZLATITUDE"]
-            lon = row["ZLONGITUDE"]
-
-            # Skip rows with missing latitude or longitude
-            if pd.isna(lat) or pd.isna(lon):
-                log_message(f"Skipping row with missing coordinates: lat={lat}, lon={lon}")
-                continue
-
-            alt = round(row.get("ZALTITUDE", 0), 1)  # Use altitude from the column and round to 1 decimal place
-            vertical_accuracy = round(row.get("ZVERTICALACCURACY", 0), 1)  # Round to 1 decimal place
-            horizontal_accuracy = round(row.get("ZHORIZONTALACCURACY", 0), 1)  # Round to 1 decimal place
-            speed_mps = round(row.get("ZSPEED", 0), 1)  # Speed in meters per second, rounded to 1 decimal place
-            speed_kmh = round(speed_mps * 3.6, 1)  # Convert speed from m/s to km/h and round to 1 decimal place
-            course = round(row.get("ZCOURSE", 0), 1)  # Round course to 1 decimal place
-            if course == -1:
-                course = "No data recorded"
-            if speed_mps == -1:
-                speed_text = "No data recorded"
-            else:
-                if speed_unit == "km/h":
-                    speed_text = f"{speed_kmh} km/h"
-                else:
-                    speed_text = f"{speed_mps} m/s"
-
-            # Create a new point with the red dot style
-            log_message(f"Creating point: coords: ({lon}, {lat}, {alt})")
-            pnt = kml.newpoint(coords=[(lon, lat, alt)])
-            pnt.style = red_dot_style
-
-            # Convert timestamp to Brisbane time
-            date_str, time_str, time_zone = convert_timestamp(row["ZTIMESTAMP"])
-
-            # Set the description with the row data
-            description = (
-                "IPhone iOS location service Cache.sqlite-wal (Table: ZRTCLLOCATIONMO)\n"
-                f"ID: {row['Z_PK']}\n"
-                f"Time Zone: {time_zone}\n"
-                f"Time: {time_str}\n"
-                f"Date: {date_str}\n"
-                f"Latitude: {lat}\n"
-                f"Longitude: {lon}\n"
-                f"Altitude: {alt} (m) radius\n"
-                f"Vertical Accuracy: {vertical_accuracy} (m) radius\n"
-                f"Horizontal Accuracy: {horizontal_accuracy} (m) radius\n"
-                f"Course: {course}\n"
-                f"Speed: {speed_text}"
-            )
-            pnt.description = description
-
-            # Set the name with selected data points
-            name_parts = []
-            if show_date:
-                name_parts.append(date_str)
-            if show_time:
-                name_parts.append(time_str)
-            if show_speed:
-                name_parts.append(speed_text)
-            if show_bearing:
-                name_parts.append(str(course))
-            pnt.name = " | ".join(name_parts)
-
-            point_count += 1
-
-            # Update progress bar
-            progress = int((index + 1) / total_rows * 100)
-            progress_bar['value'] = progress
-            root.update_idletasks()
-
-        # Set the KML output file name
-        input_filename = os.path.basename(excel_path)
-        start_date_str = start_datetime.strftime('%Y%m%d%H%M')
-        end_date_str = end_datetime.strftime('%Y%m%d%H%M')
-        output_filename = f"Exported - {os.path.splitext(input_filename)[0]} - {horizontal_accuracy_filter_str} - {start_date_str}_to_{end_date_str}.kml"
-        output_kml = os.path.join(output_folder, output_filename)
-        log_message(f"Saving KML file to: {output_kml}")
-        kml.save(output_kml)
-        log_message(f"KML file created: {output_kml}")
-        log_message(f"Total data points created: {point_count}")
-
-        # Write filters and settings to a text file
-        filters_filename = f"Filters - {os.path.splitext(input_filename)[0]}.txt"
-        filters_path = os.path.join(output_folder, filters_filename)
-        with open(filters_path, 'w') as f:
-            f.write(f"Start Date: {start_datetime.strftime('%d/%m/%Y %H:%M')}\n")
-            f.write(f"End Date: {end_datetime.strftime('%d/%m/%Y %H:%M')}\n")
-            f.write(f"Horizontal Accuracy Filter: {horizontal_accuracy_filter}\n")
-            f.write(f"Show Date: {show_date}\n")
-            f.write(f"Show Time: {show_time}\n")
-            f.write(f"Show Speed: {show_speed}\n")
-            f.write(f"Show Bearing: {show_bearing}\n")
-            f.write(f"Speed Unit: {speed_unit}\n")
-        log_message(f"Filters and settings saved to: {filters_path}")
-
-        # Display warning if more than 1000 data points
-        if point_count > 1000:
-            warning_message = (
-                "WARNING - This file may crash Google Earth due to the large data volume."
-                "Consider re-applying filters if there are issues."
-            )
-            log_message(f"WARNING: {warning_message}")
-            messagebox.showwarning("Warning", warning_message)
-
-        # Show success message with image
-        show_success_message(output_kml, point_count, filters_path)
-
-    except Exception as e:
-        log_message(f"An error occurred: {e}")
-        messagebox.showerror("Error", f"An error occurred: {e}")
-
-def show_success_message(output_kml, point_count, filters_path):
+            timeline_state["index"] = result
+            log_message(f"Timeline preview ready: {result.row_count} fixes")
+            update_timeline_preview()
+
+    # Show whether the selected file is loading, ready or failed
+    update_file_status()
+
+    # Update the elapsed time of running jobs
+    now = time.monotonic()
+    for job_id, started in job_started.items():
+        if started is not None:
+            job_list.set(str(job_id), "elapsed", f"{int(now - started)}s")
+    root.after(200, poll_jobs)
+
+def drain_queue(events):
+    while True:
+        try:
+            yield events.get_nowait()
+        except queue.Empty:
+            return
+
+def load_timeline_preview():
+    excel_path = excel_path_entry.get()
+    if not excel_path:
+        messagebox.showwarning("Input Error", "Please select a file to preview.")
+        return
+    log_message(f"Loading timeline preview for {excel_path}...")
+    start_timeline_preview(excel_path)
+
+def start_timeline_preview(excel_path):
+    timeline_state["index"] = None
+    timeline_canvas.delete("all")
+    preview_count_label.config(text="Loading...")
+
+    # Reading the file is the slow part, so it happens off the GUI thread and shares the prefetched frame; the index
+    # is kept with the frame, so a file that is already loaded is shown straight away
+    hash_algorithms = selected_hash_algorithms()
+
+    def load():
+        try:
+            preview_events.put((excel_path, frame_cache.timeline(excel_path, hash_algorithms)))
+        except Exception as e:
+            preview_events.put((excel_path, e))
+
+    threading.Thread(target=load, daemon=True).start()
+
+def preview_window():
+    # The export window from the form, or None while a time is half typed
+    start_time = start_time_entry.get()
+    end_time = end_time_entry.get()
+    try:
+        start_datetime = datetime.combine(start_date_entry.get_date(), datetime.strptime(start_time, "%H:%M").time())
+        end_datetime = datetime.combine(end_date_entry.get_date(), datetime.strptime(end_time, "%H:%M").time())
+    except ValueError:
+        return None
+    return start_datetime, end_datetime
+
+def update_timeline_preview(event=None):
+    index = timeline_state["index"]
+    if index is None:
+        return
+    timeline_canvas.delete("all")
+    horizontal_accuracy_filter = horizontal_accuracy_combobox.get()
+    counts = index.histogram(horizontal_accuracy_filter)
+    if len(counts) == 0:
+        preview_count_label.config(text="No fixes in file")
+        return
+
+    # One bar per hour or day, the selected window is drawn in red
+    width = int(timeline_canvas["width"])
+    height = int(timeline_canvas["height"])
+    bar_width = width / len(counts)
+    tallest = max(int(counts.max()), 1)
+    window = preview_window()
+    bin_starts = index.bin_starts()
+    if window is not None:
+        window_start, window_end = (location_export.iphone_seconds(value) for value in window)
+    for position, count in enumerate(counts):
+        if count == 0:
+            continue
+        selected = window is not None and bin_starts[position] + index.bin_seconds > window_start and bin_starts[position] <= window_end
+        x = position * bar_width
+        timeline_canvas.create_rectangle(x, height - count / tallest * (height - 2), x + max(bar_width - 1, 1), height,
+                                         fill="red" if selected else "grey", width=0)
+
+    if window is None:
+        preview_count_label.config(text="Enter valid times")
+    else:
+        preview_count_label.config(text=f"{index.count(window[0], window[1], horizontal_accuracy_filter)} fixes selected")
+
+def show_success_message(output_paths, point_count, filters_path):
     log_message("Showing success message...")
     success_window = Toplevel(root)
     success_window.title("Success")
 
     # Create and place the widgets
-    Label(success_window, text=f"KML file created: {output_kml}").pack(pady=10)
+    for output_path in output_paths:
+        Label(success_window, text=f"File created: {output_path}").pack(pady=5)
     Label(success_window, text=f"Total data points created: {point_count}").pack(pady=5)
     Label(success_window, text=f"Filters and settings saved to: {filters_path}").pack(pady=5)
 
+def selected_hash_algorithms():
+    return ("sha256", "md5") if md5_var.get() else ("sha256",)
+
+def prefetch_file(event=None):
+    # Start hashing and parsing the selected file straight away so Run can go straight to filtering
+    excel_path = excel_path_entry.get()
+    if not os.path.isfile(excel_path):
+        return
+    if frame_cache.status(excel_path, selected_hash_algorithms()) is None:
+        log_message(f"Loading {excel_path} in the background...")
+    frame_cache.prefetch(excel_path, selected_hash_algorithms())
+    # The timeline preview is drawn as soon as the frame is ready, without waiting for the button
+    start_timeline_preview(excel_path)
+
+def schedule_prefetch(event=None):
+    # Wait for a pause in typing before treating the path as selected
+    if prefetch_state["pending"] is not None:
+        root.after_cancel(prefetch_state["pending"])
+    prefetch_state["pending"] = root.after(500, prefetch_file)
+
+def update_file_status():
+    status = frame_cache.status(excel_path_entry.get(), selected_hash_algorithms())
+    file_status_label.config(text=status.capitalize() if status else "", fg={"ready": "green", "failed": "red"}.get(status, "black"))
+
 def browse_file():
     log_message("Browsing for file...")
-    file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
+    file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("SQLite WAL files", "*-wal")])
     if file_path:
         excel_path_entry.delete(0, tk.END)
         excel_path_entry.insert(0, file_path)
+        prefetch_file()
 
 def browse_folder():
     log_message("Browsing for folder...")
@@ -234,6 +227,63 @@ def browse_folder():
         output_folder_entry.delete(0, tk.END)
         output_folder_entry.insert(0, folder_path)
 
+def browse_merge_files():
+    log_message("Browsing for files to merge...")
+    file_paths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx"), ("SQLite WAL files", "*-wal")])
+    if file_paths:
+        merge_paths[:] = file_paths
+        merge_label.config(text=f"{len(merge_paths)} more file{'s' if len(merge_paths) > 1 else ''}")
+        log_message(f"Merging with: {', '.join(merge_paths)}")
+        # Start loading the extra inputs too, so they are ready by the time Run is pressed
+        for file_path in merge_paths:
+            frame_cache.prefetch(file_path, selected_hash_algorithms())
+
+def clear_merge_files():
+    merge_paths.clear()
+    merge_label.config(text="No other files")
+    log_message("Merge files cleared")
+
+def browse_colocation_file():
+    log_message("Browsing for the other device...")
+    file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx"), ("SQLite WAL files", "*-wal")])
+    if file_path:
+        colocation_state["path"] = file_path
+        colocation_label.config(text=os.path.basename(file_path))
+        log_message(f"Co-location device: {file_path}")
+        frame_cache.prefetch(file_path, selected_hash_algorithms())
+
+def find_colocation():
+    log_message("Queueing co-location check...")
+    excel_path = excel_path_entry.get()
+    other_path = colocation_state["path"]
+    output_folder = output_folder_entry.get()
+    start_time = start_time_entry.get()
+    end_time = end_time_entry.get()
+    distance_m = colocation_distance_entry.get()
+    time_s = colocation_time_entry.get()
+
+    if not excel_path or not other_path or not output_folder or not start_time or not end_time:
+        messagebox.showwarning("Input Error", "Please choose both devices, the output folder and the time range.")
+        return
+    if not validate_time_format(start_time) or not validate_time_format(end_time):
+        messagebox.showerror("Input Error", "Time must be in HH:MM format.")
+        return
+    if not distance_m.isdigit() or not time_s.isdigit() or int(time_s) < 1:
+        messagebox.showerror("Input Error", "Co-location distance and time must be whole numbers, and the time greater than 0.")
+        return
+
+    start_datetime = datetime.combine(start_date_entry.get_date(), datetime.strptime(start_time, "%H:%M").time())
+    end_datetime = datetime.combine(end_date_entry.get_date(), datetime.strptime(end_time, "%H:%M").time())
+    label = f"Co-location {os.path.basename(excel_path)} / {os.path.basename(other_path)} {start_datetime.strftime('%d/%m/%Y %H:%M')} to {end_datetime.strftime('%d/%m/%Y %H:%M')}"
+    # No kml_processes here: worker processes are spawned, and a spawned worker imports this script again, window
+    # and all, so KML partitions are written on threads; process scaling is for the worker service
+    job = job_queue.submit(label, {
+        "excel_path": excel_path, "other_path": other_path, "output_folder": output_folder,
+        "start_datetime": start_datetime, "end_datetime": end_datetime, "horizontal_accuracy_filter": horizontal_accuracy_combobox.get(),
+        "distance_m": int(distance_m), "time_s": int(time_s), "hash_algorithms": selected_hash_algorithms(), "frame_cache": frame_cache,
+    }, target=export_runner.run_colocation)
+    log_message(f"Job {job.job_id} queued: {label}")
+
 def update_date_label(entry, label):
     log_message("Updating date label...")
     date = entry.get_date()
@@ -241,7 +291,7 @@ def update_date_label(entry, label):
     label.config(text=formatted_date)
 
 def run():
-    log_message("Running process...")
+    log_message("Queueing export...")
     if not validate_speed_selection():
         return
 
@@ -252,6 +302,22 @@ def run():
     end_date = end_date_entry.get_date()
     end_time = end_time_entry.get()
     horizontal_accuracy_filter = horizontal_accuracy_combobox.get()
+    partition_by = partition_combobox.get()
+    points_per_partition = points_per_partition_entry.get()
+    trip_gap_minutes = trip_gap_entry.get()
+    trip_distance_m = trip_distance_entry.get()
+    regenerate_parts = regenerate_parts_entry.get()
+    formats = [export_format for export_format, format_var in format_vars.items() if format_var.get()]
+    incremental = incremental_var.get()
+    force = force_var.get()
+    resume = resume_var.get()
+    accuracy_circles = accuracy_circles_var.get()
+    time_order = time_order_var.get()
+    compact = compact_var.get()
+    movement_check = movement_check_var.get()
+    exclude_flagged = flagged_combobox.get() == "Exclude flagged"
+    max_speed_kmh = max_speed_entry.get()
+    hash_algorithms = selected_hash_algorithms()
 
     # Get checkbox values
     show_date = date_var.get()
@@ -289,9 +355,75 @@ def run():
         messagebox.showerror("Input Error", "Time must be in HH:MM format.")
         return
 
+    if not formats:
+        messagebox.showwarning("Input Error", "Please select at least one output format.")
+        return
+
+    if incremental and partition_by != "none":
+        messagebox.showerror("Input Error", "Incremental updates are already written as separate parts, please set Split Output By to none.")
+        return
+
+    if incremental and merge_paths:
+        messagebox.showerror("Input Error", "Incremental updates follow a single file, please clear the files to merge.")
+        return
+
+    # Validate the movement check speed limit
+    max_speed_entry.config(bg="white")
+    if movement_check and (not max_speed_kmh.isdigit() or int(max_speed_kmh) < 1):
+        max_speed_entry.config(bg="red")
+        messagebox.showerror("Input Error", "Max speed must be a whole number of km/h greater than 0.")
+        return
+    max_speed_kmh = int(max_speed_kmh) if max_speed_kmh.isdigit() else movement_analysis.DEFAULT_MAX_SPEED_KMH
+
+    # Validate the partition size
+    points_per_partition_entry.config(bg="white")
+    if partition_by == "points" and (not points_per_partition.isdigit() or int(points_per_partition) < 1):
+        points_per_partition_entry.config(bg="red")
+        messagebox.showerror("Input Error", "Points per partition must be a whole number greater than 0.")
+        return
+    points_per_partition = int(points_per_partition) if points_per_partition.isdigit() else 1000
+
+    # Validate the trip breaks
+    trip_gap_entry.config(bg="white")
+    trip_distance_entry.config(bg="white")
+    if partition_by == "trip" and not (trip_gap_minutes.isdigit() and int(trip_gap_minutes) > 0 and trip_distance_m.isdigit() and int(trip_distance_m) > 0):
+        trip_gap_entry.config(bg="red")
+        trip_distance_entry.config(bg="red")
+        messagebox.showerror("Input Error", "Trip gap and jump must be whole numbers greater than 0.")
+        return
+    trip_gap_s = int(trip_gap_minutes) * 60 if trip_gap_minutes.isdigit() else trips.DEFAULT_TRIP_GAP_S
+    trip_distance_m = int(trip_distance_m) if trip_distance_m.isdigit() else trips.DEFAULT_TRIP_DISTANCE_M
+
+    # Validate the parts to regenerate, left empty to write every part
+    regenerate_parts_entry.config(bg="white")
+    try:
+        regenerate_parts = location_export.parse_part_numbers(regenerate_parts)
+    except ValueError as e:
+        regenerate_parts_entry.config(bg="red")
+        messagebox.showerror("Input Error", f"Regenerate parts: {e}")
+        return
+    if regenerate_parts and (partition_by == "none" or "KML" not in formats):
+        regenerate_parts_entry.config(bg="red")
+        messagebox.showerror("Input Error", "Single parts can only be regenerated for partitioned KML output.")
+        return
+
     start_datetime = datetime.combine(start_date, datetime.strptime(start_time, "%H:%M").time())
     end_datetime = datetime.combine(end_date, datetime.strptime(end_time, "%H:%M").time())
-    threading.Thread(target=process_file, args=(excel_path, output_folder, start_datetime, end_datetime, horizontal_accuracy_filter, progress_bar, show_date, show_time, show_speed, show_bearing, speed_unit)).start()
+    label = f"{os.path.basename(excel_path)}{f' + {len(merge_paths)}' if merge_paths else ''} {start_datetime.strftime('%d/%m/%Y %H:%M')} to {end_datetime.strftime('%d/%m/%Y %H:%M')}"
+    # No kml_processes here: worker processes are spawned, and a spawned worker imports this script again, window
+    # and all, so KML partitions are written on threads; process scaling is for the worker service
+    job = job_queue.submit(label, {
+        "excel_path": excel_path, "output_folder": output_folder, "start_datetime": start_datetime, "end_datetime": end_datetime,
+        "horizontal_accuracy_filter": horizontal_accuracy_filter, "show_date": show_date, "show_time": show_time,
+        "show_speed": show_speed, "show_bearing": show_bearing, "speed_unit": speed_unit,
+        "partition_by": partition_by, "points_per_partition": points_per_partition, "formats": tuple(formats),
+        "trip_gap_s": trip_gap_s, "trip_distance_m": trip_distance_m, "accuracy_circles": accuracy_circles,
+        "regenerate_parts": tuple(sorted(regenerate_parts)) or None,
+        "incremental": incremental, "force": force, "compact": compact, "resume": resume, "time_order": time_order,
+        "movement_check": movement_check, "exclude_flagged": exclude_flagged, "max_speed_kmh": max_speed_kmh,
+        "hash_algorithms": hash_algorithms, "frame_cache": frame_cache, "merge_paths": tuple(merge_paths),
+    })
+    log_message(f"Job {job.job_id} queued: {label}")
 
 def validate_time_format(time_str):
     log_message(f"Validating time format: {time_str}")
@@ -334,13 +466,27 @@ root.after(0, show_warning)
 tk.Label(root, text="Excel File:").grid(row=0, column=0, padx=10, pady=10, sticky="e")
 excel_path_entry = tk.Entry(root, width=50)
 excel_path_entry.grid(row=0, column=1, padx=10, pady=10)
+excel_path_entry.bind("<KeyRelease>", schedule_prefetch)
+excel_path_entry.bind("<Return>", prefetch_file)
+excel_path_entry.bind("<FocusOut>", prefetch_file)
 tk.Button(root, text="Browse...", command=browse_file).grid(row=0, column=2, padx=10, pady=10)
+file_status_label = tk.Label(root, text="")
+file_status_label.grid(row=0, column=3, padx=10, pady=10, sticky="w")
 
 tk.Label(root, text="Output Folder:").grid(row=1, column=0, padx=10, pady=10, sticky="e")
 output_folder_entry = tk.Entry(root, width=50)
 output_folder_entry.grid(row=1, column=1, padx=10, pady=10)
 tk.Button(root, text="Browse...", command=browse_folder).grid(row=1, column=2, padx=10, pady=10)
 
+# Other exports of the same device merged into one time-ordered output without duplicates
+merge_frame = tk.Frame(root)
+merge_frame.grid(row=1, column=3, columnspan=2, padx=10, pady=10, sticky="w")
+tk.Button(merge_frame, text="Merge With...", command=browse_merge_files).pack(side=tk.LEFT)
+tk.Button(merge_frame, text="Clear", command=clear_merge_files).pack(side=tk.LEFT, padx=5)
+merge_label = tk.Label(merge_frame, text="No other files")
+merge_label.pack(side=tk.LEFT)
+merge_paths = []
+
 tk.Label(root, text="Time Zone AEST +10 UTC").grid(row=2, column=0, columnspan=5, padx=10, pady=10)
 
 tk.Label(root, text="Filter Options", font=("Helvetica", 12, "bold", "underline")).grid(row=3, column=0, columnspan=5, padx=10, pady=10)
@@ -369,36 +515,153 @@ start_date_entry = DateEntry(root, width=12, background='darkblue', foreground='
 start_date_entry.grid(row=7, column=1, padx=10, pady=10)
 start_date_label = tk.Label(root, text="")
 start_date_label.grid(row=7, column=2, padx=10, pady=10, sticky="w")
-start_date_entry.bind("<<DateEntrySelected>>", lambda event: update_date_label(start_date_entry, start_date_label))
+start_date_entry.bind("<<DateEntrySelected>>", lambda event: (update_date_label(start_date_entry, start_date_label), update_timeline_preview()))
 
 tk.Label(root, text="Start Time (HH:MM) 24hr:").grid(row=7, column=3, padx=10, pady=10, sticky="e")
 start_time_entry = tk.Entry(root, width=10)
 start_time_entry.grid(row=7, column=4, padx=10, pady=10, sticky="w")
+start_time_entry.bind("<KeyRelease>", update_timeline_preview)
 
 tk.Label(root, text="End Date:").grid(row=8, column=0, padx=10, pady=10, sticky="e")
 end_date_entry = DateEntry(root, width=12, background='darkblue', foreground='white', borderwidth=2, date_pattern='dd/mm/yyyy')
 end_date_entry.grid(row=8, column=1, padx=10, pady=10)
 end_date_label = tk.Label(root, text="")
 end_date_label.grid(row=8, column=2, padx=10, pady=10, sticky="w")
-end_date_entry.bind("<<DateEntrySelected>>", lambda event: update_date_label(end_date_entry, end_date_label))
+end_date_entry.bind("<<DateEntrySelected>>", lambda event: (update_date_label(end_date_entry, end_date_label), update_timeline_preview()))
 
 tk.Label(root, text="End Time (HH:MM) 24hr:").grid(row=8, column=3, padx=10, pady=10, sticky="e")
 end_time_entry = tk.Entry(root, width=10)
 end_time_entry.grid(row=8, column=4, padx=10, pady=10, sticky="w")
+end_time_entry.bind("<KeyRelease>", update_timeline_preview)
 
 tk.Label(root, text="Horizontal Accuracy:").grid(row=9, column=0, padx=10, pady=10, sticky="e")
 horizontal_accuracy_combobox = Combobox(root, values=["nil", "< 10m", "< 50m", "< 100m", "< 500m"], state="readonly")
 horizontal_accuracy_combobox.grid(row=9, column=1, padx=10, pady=10, sticky="w")
 horizontal_accuracy_combobox.current(0)  # Set default value to "nil"
-
-tk.Button(root, text="Run", command=run, width=20, height=2).grid(row=10, column=0, columnspan=5, padx=10, pady=20)
+horizontal_accuracy_combobox.bind("<<ComboboxSelected>>", update_timeline_preview)
+
+tk.Label(root, text="Split Output By:").grid(row=9, column=2, padx=10, pady=10, sticky="e")
+partition_combobox = Combobox(root, values=PARTITION_MODES, state="readonly", width=8)
+partition_combobox.grid(row=9, column=3, padx=10, pady=10, sticky="w")
+partition_combobox.current(0)  # Set default value to "none"
+partition_options_frame = tk.Frame(root)
+partition_options_frame.grid(row=9, column=4, padx=10, pady=10, sticky="w")
+points_per_partition_entry = tk.Entry(partition_options_frame, width=10)
+points_per_partition_entry.pack(side=tk.LEFT)
+points_per_partition_entry.insert(0, "1000")
+# A trip ends after a gap with no fixes or a jump between two fixes longer than these
+tk.Label(partition_options_frame, text="Trip gap (min):").pack(side=tk.LEFT, padx=(10, 0))
+trip_gap_entry = tk.Entry(partition_options_frame, width=5)
+trip_gap_entry.pack(side=tk.LEFT)
+trip_gap_entry.insert(0, str(trips.DEFAULT_TRIP_GAP_S // 60))
+tk.Label(partition_options_frame, text="jump (m):").pack(side=tk.LEFT, padx=(5, 0))
+trip_distance_entry = tk.Entry(partition_options_frame, width=6)
+trip_distance_entry.pack(side=tk.LEFT)
+trip_distance_entry.insert(0, str(trips.DEFAULT_TRIP_DISTANCE_M))
+# Part numbers such as "3, 7-9" rewrite only those parts of an earlier partitioned export
+tk.Label(partition_options_frame, text="Regenerate parts:").pack(side=tk.LEFT, padx=(10, 0))
+regenerate_parts_entry = tk.Entry(partition_options_frame, width=8)
+regenerate_parts_entry.pack(side=tk.LEFT)
+
+# Add checkboxes for the output formats, written together in one pass
+tk.Label(root, text="Output Formats:").grid(row=10, column=0, padx=10, pady=5, sticky="e")
+format_frame = tk.Frame(root)
+format_frame.grid(row=10, column=1, columnspan=4, padx=10, pady=5, sticky="w")
+format_vars = {export_format: tk.BooleanVar(value=export_format == "KML") for export_format in [*exporters.EXPORT_FORMATS, heatmap.HEATMAP_FORMAT, places.PLACES_FORMAT]}
+for export_format, format_var in format_vars.items():
+    tk.Checkbutton(format_frame, text=export_format, variable=format_var).pack(side=tk.LEFT, padx=(0, 20))
+# Draw each fix's horizontal accuracy radius around it in the KML
+accuracy_circles_var = tk.BooleanVar()
+tk.Checkbutton(format_frame, text="KML accuracy circles", variable=accuracy_circles_var).pack(side=tk.LEFT, padx=(0, 20))
+# Write the points in time order whatever order the source lists them in
+time_order_var = tk.BooleanVar()
+tk.Checkbutton(format_frame, text="Sort by time", variable=time_order_var).pack(side=tk.LEFT)
+
+# Add a checkbox for recording MD5 digests next to the SHA-256 ones
+md5_var = tk.BooleanVar()
+tk.Checkbutton(root, text="Record MD5 too", variable=md5_var, command=prefetch_file).grid(row=11, column=0, padx=10, pady=5, sticky="w")
+
+# Add a checkbox for incremental updates that only export rows added since the last run
+incremental_var = tk.BooleanVar()
+tk.Checkbutton(root, text="Incremental update (only new rows)", variable=incremental_var).grid(row=11, column=1, padx=10, pady=5, sticky="w")
+
+# Add a checkbox to continue an interrupted export from its last checkpoint
+resume_var = tk.BooleanVar()
+tk.Checkbutton(root, text="Resume interrupted", variable=resume_var).grid(row=11, column=2, padx=10, pady=5, sticky="w")
+
+# Add a checkbox to rebuild an export even when an identical one already exists
+force_var = tk.BooleanVar()
+tk.Checkbutton(root, text="Force regenerate", variable=force_var).grid(row=11, column=3, padx=10, pady=5, sticky="w")
+
+# Add a checkbox for the compact in-memory representation of large files
+compact_var = tk.BooleanVar()
+tk.Checkbutton(root, text="Compact memory mode", variable=compact_var).grid(row=11, column=4, padx=10, pady=5, sticky="w")
+
+# Add the movement check options: derive missing speed/course and flag implausible jumps
+tk.Label(root, text="Movement Check:").grid(row=12, column=0, padx=10, pady=5, sticky="e")
+movement_check_var = tk.BooleanVar()
+tk.Checkbutton(root, text="Derive speed/course, flag jumps", variable=movement_check_var).grid(row=12, column=1, padx=10, pady=5, sticky="w")
+flagged_combobox = Combobox(root, values=["Mark flagged", "Exclude flagged"], state="readonly", width=15)
+flagged_combobox.grid(row=12, column=2, padx=10, pady=5, sticky="w")
+flagged_combobox.current(0)  # Set default value to "Mark flagged"
+tk.Label(root, text="Max Speed (km/h):").grid(row=12, column=3, padx=10, pady=5, sticky="e")
+max_speed_entry = tk.Entry(root, width=10)
+max_speed_entry.grid(row=12, column=4, padx=10, pady=5, sticky="w")
+max_speed_entry.insert(0, str(movement_analysis.DEFAULT_MAX_SPEED_KMH))
+
+# Timeline preview of fix density, with a live count of the fixes the current filters select
+tk.Button(root, text="Preview Timeline", command=load_timeline_preview).grid(row=13, column=0, padx=10, pady=5, sticky="e")
+timeline_canvas = tk.Canvas(root, width=600, height=60, bg="white")
+timeline_canvas.grid(row=13, column=1, columnspan=3, padx=10, pady=5)
+preview_count_label = tk.Label(root, text="No preview loaded")
+preview_count_label.grid(row=13, column=4, padx=10, pady=5, sticky="w")
+timeline_state = {"index": None}
+preview_events = queue.Queue()
+
+# Co-location of the selected device with a second one: where and when they were together
+tk.Label(root, text="Co-location With:").grid(row=14, column=0, padx=10, pady=5, sticky="e")
+colocation_frame = tk.Frame(root)
+colocation_frame.grid(row=14, column=1, padx=10, pady=5, sticky="w")
+tk.Button(colocation_frame, text="Browse", command=browse_colocation_file).pack(side=tk.LEFT)
+colocation_label = tk.Label(colocation_frame, text="No other device")
+colocation_label.pack(side=tk.LEFT, padx=5)
+colocation_state = {"path": None}
+colocation_tolerance_frame = tk.Frame(root)
+colocation_tolerance_frame.grid(row=14, column=2, columnspan=2, padx=10, pady=5, sticky="w")
+tk.Label(colocation_tolerance_frame, text="Within (m):").pack(side=tk.LEFT)
+colocation_distance_entry = tk.Entry(colocation_tolerance_frame, width=6)
+colocation_distance_entry.pack(side=tk.LEFT)
+colocation_distance_entry.insert(0, str(colocation.DEFAULT_DISTANCE_M))
+tk.Label(colocation_tolerance_frame, text="and (s):").pack(side=tk.LEFT, padx=(5, 0))
+colocation_time_entry = tk.Entry(colocation_tolerance_frame, width=6)
+colocation_time_entry.pack(side=tk.LEFT)
+colocation_time_entry.insert(0, str(colocation.DEFAULT_TIME_S))
+tk.Button(root, text="Find Co-location", command=find_colocation).grid(row=14, column=4, padx=10, pady=5, sticky="w")
+
+tk.Button(root, text="Run (add to queue)", command=run, width=20, height=2).grid(row=15, column=0, columnspan=5, padx=10, pady=20)
 
 progress_bar = Progressbar(root, orient=tk.HORIZONTAL, length=400, mode="determinate")
-progress_bar.grid(row=11, column=0, columnspan=5, padx=10, pady=10)
+progress_bar.grid(row=16, column=0, columnspan=5, padx=10, pady=10)
+
+# Create the job list showing every queued export
+job_list = Treeview(root, columns=("job", "export", "status", "progress", "elapsed"), show="headings", height=5)
+for column, heading, width in (("job", "Job", 40), ("export", "Export", 330), ("status", "Status", 100), ("progress", "Progress", 70), ("elapsed", "Elapsed", 70)):
+    job_list.heading(column, text=heading)
+    job_list.column(column, width=width, anchor="w")
+job_list.grid(row=17, column=0, columnspan=5, padx=10, pady=5)
 
 # Create the log window
 log_window = tk.Text(root, height=10, width=80)
-log_window.grid(row=12, column=0, columnspan=5, padx=10, pady=10)
+log_window.grid(row=18, column=0, columnspan=5, padx=10, pady=10)
+
+# Files are hashed and parsed in the background as soon as they are selected
+frame_cache = frame_cache_module.FrameCache()
+prefetch_state = {"pending": None}
+
+# Exports run on a small worker pool so the form stays usable while they run
+job_queue = job_queue_module.JobQueue(export_runner.run_export, workers=2)
+job_started = {}
+root.after(200, poll_jobs)
 
 # Run the application
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,287 @@
+import contextlib
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+import pandas as pd
+import simplekml
+import integrity
+
+# Columns exported from the ZRTCLLOCATIONMO table and the types they are read as
+COLUMN_NAMES = [
+    "Z_PK", "ZALTITUDE", "ZCOURSE", "ZHORIZONTALACCURACY", "ZLATITUDE", "ZLONGITUDE",
+    "ZSPEED", "ZTIMESTAMP", "ZVERTICALACCURACY"
+]
+COLUMN_DTYPES = {
+    "Z_PK": str, "ZALTITUDE": float, "ZCOURSE": float, "ZHORIZONTALACCURACY": float, "ZLATITUDE": float, "ZLONGITUDE": float,
+    "ZSPEED": float, "ZTIMESTAMP": str, "ZVERTICALACCURACY": float
+}
+
+# iPhone epoch starts from 2001-01-01, times are shown in Brisbane time
+IPHONE_EPOCH = datetime(2001, 1, 1)
+UTC_OFFSET = timedelta(hours=10)
+TIME_ZONE_NAME = 'AEST (UTC+10)'
+TIME_ZONE_SUFFIX = '+10:00'
+
+# Horizontal accuracy filter choices: (maximum accuracy in metres, text used in file names)
+ACCURACY_FILTERS = {
+    "< 10m": (10, "less than 10m"),
+    "< 50m": (50, "less than 50m"),
+    "< 100m": (100, "less than 100m"),
+    "< 500m": (500, "less than 500m"),
+}
+
+RED_DOT_ICON = 'http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png'
+
+PARTITION_MODES = ["none", "hour", "day", "points", "trip"]
+
+# Worker processes are started fresh rather than forked: the worker service runs exports on threads, and a fork taken
+# while another thread holds a lock leaves the child waiting on it forever
+PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def no_log(message):
+    pass
+
+
+def convert_timestamp(ts):
+    try:
+        brisbane_time = IPHONE_EPOCH + timedelta(seconds=float(ts)) + UTC_OFFSET
+        return brisbane_time.strftime('%d/%m/%Y'), brisbane_time.strftime('%H:%M:%S'), TIME_ZONE_NAME
+    except ValueError:
+        return ts, ts, 'Unknown'  # Return as-is if conversion fails
+
+
+def iphone_seconds(value):
+    # Brisbane wall-clock time to seconds since the iPhone epoch, the unit ZTIMESTAMP is stored in
+    return (value - UTC_OFFSET - IPHONE_EPOCH).total_seconds()
+
+
+def apply_filters(df, start_datetime, end_datetime, horizontal_accuracy_filter):
+    # Filter the DataFrame based on the start and end datetime, compared in the ZTIMESTAMP unit
+    timestamps = df["ZTIMESTAMP"].astype(float)
+    mask = (timestamps >= iphone_seconds(start_datetime)) & (timestamps <= iphone_seconds(end_datetime))
+
+    # Apply horizontal accuracy filter
+    if horizontal_accuracy_filter in ACCURACY_FILTERS:
+        max_accuracy, horizontal_accuracy_filter_str = ACCURACY_FILTERS[horizontal_accuracy_filter]
+        mask &= df["ZHORIZONTALACCURACY"] < max_accuracy
+    else:
+        horizontal_accuracy_filter_str = "nil"
+
+    # Select once with the combined mask instead of copying the frame after every filter step
+    df = df[mask]
+    df["ZTIMESTAMP"] = timestamps[mask]
+    df["datetime"] = IPHONE_EPOCH + UTC_OFFSET + pd.to_timedelta(df["ZTIMESTAMP"], unit="s")
+    return df, horizontal_accuracy_filter_str
+
+
+def export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime, extension=".kml"):
+    input_name = os.path.splitext(os.path.basename(excel_path))[0]
+    start_date_str = start_datetime.strftime('%Y%m%d%H%M')
+    end_date_str = end_datetime.strftime('%Y%m%d%H%M')
+    return f"Exported - {input_name} - {horizontal_accuracy_filter_str} - {start_date_str}_to_{end_date_str}{extension}"
+
+
+def placemark_fields(row, show_date, show_time, show_speed, show_bearing, speed_unit):
+    lat = row["ZLATITUDE"]
+    lon = row["ZLONGITUDE"]
+    # Values are rounded as Python floats so compact float32 columns print exactly like float64 ones
+    alt = round(float(row.get("ZALTITUDE", 0)), 1)  # Use altitude from the column and round to 1 decimal place
+    vertical_accuracy = round(float(row.get("ZVERTICALACCURACY", 0)), 1)  # Round to 1 decimal place
+    horizontal_accuracy = round(float(row.get("ZHORIZONTALACCURACY", 0)), 1)  # Round to 1 decimal place
+    speed_mps = round(float(row.get("ZSPEED", 0)), 1)  # Speed in meters per second, rounded to 1 decimal place
+    speed_kmh = round(speed_mps * 3.6, 1)  # Convert speed from m/s to km/h and round to 1 decimal place
+    course = round(float(row.get("ZCOURSE", 0)), 1)  # Round course to 1 decimal place
+    if course == -1:
+        course = "No data recorded"
+    elif row.get("course_derived"):
+        course = f"{course} (derived)"
+    if speed_mps == -1:
+        speed_text = "No data recorded"
+    else:
+        if speed_unit == "km/h":
+            speed_text = f"{speed_kmh} km/h"
+        else:
+            speed_text = f"{speed_mps} m/s"
+        if row.get("speed_derived"):
+            speed_text += " (derived)"
+
+    # Convert timestamp to Brisbane time
+    date_str, time_str, time_zone = convert_timestamp(row["ZTIMESTAMP"])
+
+    # Set the description with the row data
+    description = (
+        "IPhone iOS location service Cache.sqlite-wal (Table: ZRTCLLOCATIONMO)\n"
+        f"ID: {row['Z_PK']}\n"
+        f"Time Zone: {time_zone}\n"
+        f"Time: {time_str}\n"
+        f"Date: {date_str}\n"
+        f"Latitude: {lat}\n"
+        f"Longitude: {lon}\n"
+        f"Altitude: {alt} (m) radius\n"
+        f"Vertical Accuracy: {vertical_accuracy} (m) radius\n"
+        f"Horizontal Accuracy: {horizontal_accuracy} (m) radius\n"
+        f"Course: {course}\n"
+        f"Speed: {speed_text}"
+    )
+    if row.get("outlier"):
+        description += "\nMovement Check: outlier, jumps away and straight back at an implausible speed"
+    elif row.get("teleport"):
+        description += "\nMovement Check: implausible jump from the previous fix"
+    if row.get("source_file"):
+        description += f"\nSource File: {row['source_file']}"
+
+    # Set the name with selected data points
+    name_parts = []
+    if show_date:
+        name_parts.append(date_str)
+    if show_time:
+        name_parts.append(time_str)
+    if show_speed:
+        name_parts.append(speed_text)
+    if show_bearing:
+        name_parts.append(str(course))
+    return (lon, lat, alt), " | ".join(name_parts), description
+
+
+def write_kml(df, output_kml, show_date, show_time, show_speed, show_bearing, speed_unit, log=no_log, progress=None, algorithms=integrity.DEFAULT_ALGORITHMS,
+              accuracy_circles=False):
+    # Imported here because the exporters build on the helpers in this module
+    from exporters import KmlExporter, export_batches, frame_batches
+
+    # Skip rows with missing latitude or longitude
+    missing = int((df["ZLATITUDE"].isna() | df["ZLONGITUDE"].isna()).sum())
+    if missing:
+        log(f"Skipping {missing} rows with missing coordinates")
+
+    exporter = KmlExporter(output_kml, show_date=show_date, show_time=show_time, show_speed=show_speed, show_bearing=show_bearing, speed_unit=speed_unit,
+                           algorithms=algorithms, accuracy_circles=accuracy_circles)
+    export_batches(frame_batches(df), {"KML": exporter}, total_rows=len(df), progress=progress)
+    return exporter.point_count
+
+
+def kml_time(value):
+    # KML times carry the offset so Google Earth places them correctly on its time slider
+    return value.strftime('%Y-%m-%dT%H:%M:%S') + TIME_ZONE_SUFFIX
+
+
+def partition_frame(df, partition_by, points_per_partition=1000, trip_gap_s=None, trip_distance_m=None):
+    # Partitions are time-contiguous so each one gets a meaningful TimeSpan
+    df = df.sort_values("datetime", kind="stable")
+    if partition_by in ("hour", "day"):
+        keys = df["datetime"].dt.floor("h" if partition_by == "hour" else "D")
+        for _, part in df.groupby(keys, sort=True):
+            yield part
+    elif partition_by == "points":
+        if points_per_partition < 1:
+            raise ValueError("Points per partition must be at least 1.")
+        for start in range(0, len(df), points_per_partition):
+            yield df.iloc[start:start + points_per_partition]
+    elif partition_by == "trip":
+        # Imported here because the trip module builds on the helpers in this module
+        import trips
+        df, trip = trips.segment_trips(df, trip_gap_s or trips.DEFAULT_TRIP_GAP_S, trip_distance_m or trips.DEFAULT_TRIP_DISTANCE_M)
+        for _, part in df.groupby(trip, sort=True):
+            yield part
+    else:
+        raise ValueError(f"Unknown partition mode: {partition_by}")
+
+
+def partition_filename(excel_path, horizontal_accuracy_filter_str, part, number, label="part"):
+    name = export_filename(excel_path, horizontal_accuracy_filter_str, part["datetime"].iloc[0], part["datetime"].iloc[-1], extension="")
+    return f"{name} - {label} {number:04d}.kml"
+
+
+def parse_part_numbers(text):
+    # "3, 7-9" as {3, 7, 8, 9}; partitions are numbered from 1
+    numbers = set()
+    for item in text.replace(" ", "").split(","):
+        if not item:
+            continue
+        first, dash, last = item.partition("-")
+        last = last if dash else first
+        if not (first.isdigit() and last.isdigit()) or not 1 <= int(first) <= int(last):
+            raise ValueError(f"'{item}' is not a part number or range of part numbers.")
+        numbers.update(range(int(first), int(last) + 1))
+    return numbers
+
+
+def partition_description(part, partition_by):
+    # Trips are described by their statistics, other partitions need nothing beyond their name and time span
+    if partition_by != "trip":
+        return None
+    import trips
+    summary = trips.trip_summaries(part, [1] * len(part)).iloc[0]
+    start_date, start_time, time_zone = convert_timestamp(summary["start"])
+    end_date, end_time, _ = convert_timestamp(summary["end"])
+    return f"Time Zone: {time_zone}\n" + trips.trip_description(summary, f"{start_date} {start_time}", f"{end_date} {end_time}")
+
+
+def write_index(index_path, links, algorithms=integrity.DEFAULT_ALGORITHMS):
+    # Each link is (name, href, begin, end), optionally followed by a description; Google Earth loads the linked
+    # files on demand and each link can be switched on and off on its own
+    index_kml = simplekml.Kml()
+    for name, href, begin, end, *description in links:
+        link = index_kml.newnetworklink(name=name)
+        link.link.href = href
+        link.timespan.begin = begin
+        link.timespan.end = end
+        if description:
+            link.description = description[0]
+    integrity.save_kml(index_kml, index_path, algorithms)
+
+
+def _write_partition(args):
+    # The record goes back with the count, a partition written in a worker process is only recorded in that process
+    part, part_path, show_date, show_time, show_speed, show_bearing, speed_unit, algorithms, accuracy_circles = args
+    count = write_kml(part, part_path, show_date, show_time, show_speed, show_bearing, speed_unit, algorithms=algorithms, accuracy_circles=accuracy_circles)
+    return count, integrity.output_record(part_path)
+
+
+def export_partitioned(df, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime,
+                       partition_by, show_date, show_time, show_speed, show_bearing, speed_unit,
+                       points_per_partition=1000, max_workers=None, use_processes=False, only_parts=None, algorithms=integrity.DEFAULT_ALGORITHMS,
+                       trip_gap_s=None, trip_distance_m=None, accuracy_circles=False, pool=None, log=no_log):
+    index_filename = export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime)
+    parts_folder_name = os.path.splitext(index_filename)[0] + " - parts"
+    parts_folder = os.path.join(output_folder, parts_folder_name)
+    os.makedirs(parts_folder, exist_ok=True)
+
+    # Work out every partition up front so the index can list them all, even the ones not regenerated
+    jobs = []
+    links = []
+    part_paths = []
+    point_count = 0
+    label = "trip" if partition_by == "trip" else "part"
+    for number, part in enumerate(partition_frame(df, partition_by, points_per_partition, trip_gap_s, trip_distance_m), start=1):
+        part_filename = partition_filename(excel_path, horizontal_accuracy_filter_str, part, number, label)
+        links.append((f"{label.capitalize()} {number}: {len(part)} points", f"{parts_folder_name}/{part_filename}",
+                      kml_time(part["datetime"].iloc[0]), kml_time(part["datetime"].iloc[-1]), partition_description(part, partition_by)))
+        part_path = os.path.join(parts_folder, part_filename)
+        part_paths.append(part_path)
+        # A part missing from the folder is written even when it was not asked for, the index links to every part
+        if only_parts is None or number in only_parts or not os.path.isfile(part_path):
+            jobs.append((part, part_path, show_date, show_time, show_speed, show_bearing, speed_unit, algorithms, accuracy_circles))
+        else:
+            point_count += int((part["ZLATITUDE"].notna() & part["ZLONGITUDE"].notna()).sum())
+    log(f"Writing {len(jobs)} of {len(links)} partitions by {partition_by}...")
+
+    # Each partition is an independent file, so they can be written concurrently; a process pool passed in is left
+    # running for the next export
+    if pool is not None:
+        executor = contextlib.nullcontext(pool)
+    elif use_processes:
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=PROCESS_CONTEXT)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    with executor as workers:
+        for job, (count, record) in zip(jobs, workers.map(_write_partition, jobs)):
+            integrity.record_output(job[1], record)
+            log(f"Partition written: {job[1]} ({count} points)")
+            point_count += count
+
+    index_path = os.path.join(output_folder, index_filename)
+    write_index(index_path, links, algorithms)
+    log(f"Partition index created: {index_path}")
+    return index_path, point_count, part_paths
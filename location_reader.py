@@ -0,0 +1,135 @@
+import importlib.util
+import time
+import numpy as np
+import openpyxl
+import pandas as pd
+import integrity
+import wal_reader
+from location_export import COLUMN_NAMES, COLUMN_DTYPES, no_log
+
+# Rows per batch when an export is streamed through the pipeline
+READ_BATCH_SIZE = 5000
+
+# pandas Excel engines, fastest first, with the module each one needs; calamine parses in native code
+EXCEL_ENGINES = [("calamine", "python_calamine"), ("openpyxl", "openpyxl")]
+
+# Compact mode reads every column as a number and narrows them afterwards
+COMPACT_READ_DTYPES = {column: float for column in COLUMN_NAMES}
+
+# Columns that are only ever shown rounded, so float32 is tried for them; coordinates always stay float64
+FLOAT32_COLUMNS = ["ZALTITUDE", "ZCOURSE", "ZHORIZONTALACCURACY", "ZSPEED", "ZVERTICALACCURACY"]
+
+
+def frame_memory(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def format_bytes(size):
+    return f"{size / (1024 * 1024):.2f} MB"
+
+
+def compact_frame(df, log=no_log):
+    # Z_PK becomes an integer key when every value is a whole number
+    pk = pd.to_numeric(df["Z_PK"], errors="coerce")
+    if pk.notna().all() and (pk % 1 == 0).all():
+        int_type = np.int32 if len(pk) == 0 or (pk.min() >= np.iinfo(np.int32).min and pk.max() <= np.iinfo(np.int32).max) else np.int64
+        df["Z_PK"] = pk.astype(int_type)
+    else:
+        log("Z_PK is not numeric in every row, keeping it as text")
+    df["ZTIMESTAMP"] = pd.to_numeric(df["ZTIMESTAMP"]).astype(np.float64)
+
+    # Only narrow a column when float32 holds every value exactly, so sentinels like -1 and the exported text are unchanged
+    narrowed = []
+    for column in FLOAT32_COLUMNS:
+        values = df[column].to_numpy(dtype=np.float64)
+        compact_values = values.astype(np.float32)
+        if np.array_equal(compact_values.astype(np.float64), values, equal_nan=True):
+            df[column] = compact_values
+            narrowed.append(column)
+    log(f"Columns stored as float32: {', '.join(narrowed) if narrowed else 'none'}")
+    return df
+
+
+def available_engines():
+    return [engine for engine, module in EXCEL_ENGINES if importlib.util.find_spec(module) is not None]
+
+
+def preferred_engine():
+    engines = available_engines()
+    return engines[0] if engines else None
+
+
+def read_excel_frame(source, dtype, engines=None, log=no_log):
+    # Reads the location columns with the fastest engine installed, falling back to the next one if it fails
+    engines = engines or available_engines()
+    for position, engine in enumerate(engines):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        started = time.perf_counter()
+        try:
+            df = pd.read_excel(source, engine=engine, usecols=COLUMN_NAMES, dtype=dtype)
+        except Exception as e:
+            if position == len(engines) - 1:
+                raise
+            log(f"The {engine} engine could not read the file ({e}), falling back to {engines[position + 1]}")
+            continue
+        elapsed = time.perf_counter() - started
+        log(f"Read {len(df)} rows with the {engine} engine in {elapsed:.2f}s ({len(df) / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+        return df
+    raise ValueError("No Excel engine is installed, please install openpyxl.")
+
+
+def read_locations(excel_path, compact=False, log=no_log, hasher=None):
+    # With a hasher the file is hashed in the same pass that parses it, nothing else reads it
+    if excel_path.endswith("-wal"):
+        # Rows still sitting in an uncheckpointed Cache.sqlite-wal are decoded straight from its frames; only the latest
+        # committed version of each row is exported, older and uncommitted ones would read as ordinary fixes
+        df = wal_reader.read_wal(excel_path, latest_only=True, log=log, hasher=hasher)
+        if compact:
+            df = compact_frame(df, log=log)
+    else:
+        with integrity.open_input(excel_path, hasher) as source:
+            if compact:
+                try:
+                    df = read_excel_frame(source, COMPACT_READ_DTYPES, log=log)
+                except ValueError:
+                    # A non-numeric cell somewhere, read as usual and convert what can be converted
+                    df = read_excel_frame(source, COLUMN_DTYPES, log=log)
+                df = compact_frame(df, log=log)
+            else:
+                df = read_excel_frame(source, COLUMN_DTYPES, log=log)
+    log(f"Frame memory: {format_bytes(frame_memory(df))} for {len(df)} rows")
+    return df
+
+
+def excel_row_count(source):
+    # Row count from the sheet dimensions, without reading the rows; None when the file does not record it
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+    return max_row - 1 if max_row else None
+
+
+def iter_excel_batches(source, batch_size=READ_BATCH_SIZE):
+    # Streams the sheet in batches with the same columns and types as read_locations, so parsing can overlap with writing;
+    # source is a path or an open file
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, ())
+        missing = [column for column in COLUMN_NAMES if column not in header]
+        if missing:
+            raise ValueError(f"Columns missing in the file: {', '.join(missing)}")
+        positions = [header.index(column) for column in COLUMN_NAMES]
+        batch = []
+        for row in rows:
+            batch.append([row[position] if position < len(row) else None for position in positions])
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch, columns=COLUMN_NAMES, dtype=object).astype(COLUMN_DTYPES)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=COLUMN_NAMES, dtype=object).astype(COLUMN_DTYPES)
+    finally:
+        workbook.close()
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import integrity
+from location_export import export_filename
+
+MANIFEST_VERSION = 1
+
+RUN_RECORD_VERSION = 1
+
+
+def manifest_path(excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime):
+    # The manifest sits next to the output it describes and shares its name
+    return os.path.join(output_folder, export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime, extension=".manifest.json"))
+
+
+def source_identity(excel_path):
+    # Re-extractions of a device keep their file name but change size and modification time
+    stat = os.stat(excel_path)
+    return {
+        "name": os.path.basename(excel_path),
+        "size": stat.st_size,
+        "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+    }
+
+
+def export_parameters(start_datetime, end_datetime, horizontal_accuracy_filter, show_date, show_time, show_speed, show_bearing, speed_unit, formats):
+    return {
+        "start": start_datetime.isoformat(),
+        "end": end_datetime.isoformat(),
+        "horizontal_accuracy_filter": horizontal_accuracy_filter,
+        "show_date": bool(show_date),
+        "show_time": bool(show_time),
+        "show_speed": bool(show_speed),
+        "show_bearing": bool(show_bearing),
+        "speed_unit": speed_unit,
+        "formats": list(formats),
+    }
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    # Write to a temporary file first so an interrupted run never leaves a half-written manifest
+    manifest["version"] = MANIFEST_VERSION
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def matching_manifest(path, excel_path, parameters):
+    # An incremental run can only continue a manifest for the same source name and the same settings
+    manifest = load_manifest(path)
+    if manifest is None:
+        return None
+    if manifest["source"]["name"] != os.path.basename(excel_path) or manifest["parameters"] != parameters:
+        return None
+    return manifest
+
+
+def high_water_mark(df):
+    pk = pd.to_numeric(df["Z_PK"], errors="coerce")
+    timestamps = pd.to_numeric(df["ZTIMESTAMP"], errors="coerce")
+    last_pk = int(pk.max()) if pk.notna().any() else None
+    last_timestamp = float(timestamps.max()) if timestamps.notna().any() else None
+    return last_pk, last_timestamp
+
+
+def select_new_rows(df, manifest):
+    # Z_PK increases as Core Data inserts rows, so the delta is a range search over the sorted keys
+    last_pk = manifest.get("last_pk")
+    if last_pk is None:
+        timestamps = pd.to_numeric(df["ZTIMESTAMP"], errors="coerce").to_numpy()
+        return df[timestamps > manifest["last_timestamp"]]
+    pk = pd.to_numeric(df["Z_PK"], errors="coerce").to_numpy()
+    order = np.argsort(pk, kind="stable")  # NaN keys sort last
+    sorted_pk = pk[order]
+    start = np.searchsorted(sorted_pk, last_pk, side="right")
+    stop = start + np.count_nonzero(~np.isnan(sorted_pk[start:]))
+    # Keep the source order for the rows that are new
+    return df.iloc[np.sort(order[start:stop])]
+
+
+def record_update(manifest, excel_path, parameters, df_read, df_exported, output_paths, begin, end, input_record=None):
+    last_pk, last_timestamp = high_water_mark(df_read)
+    if manifest is None:
+        manifest = {"parameters": parameters, "updates": [], "last_pk": None, "last_timestamp": None}
+    manifest["source"] = source_identity(excel_path)
+    # Keep the previous mark when this read held nothing newer
+    if last_pk is not None:
+        manifest["last_pk"] = max(last_pk, manifest["last_pk"] or last_pk)
+    if last_timestamp is not None:
+        manifest["last_timestamp"] = max(last_timestamp, manifest["last_timestamp"] or last_timestamp)
+    manifest["updates"].append({
+        "number": len(manifest["updates"]) + 1,
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": len(df_exported),
+        "begin": begin,
+        "end": end,
+        "files": [os.path.basename(path) for path in output_paths],
+        "input": input_record,
+        "outputs": {os.path.basename(path): integrity.output_record(path) for path in output_paths},
+    })
+    return manifest
+
+
+def run_digest(content_digest, parameters):
+    # A run is identified by what was read and every setting that shapes the output
+    key = json.dumps({"input": content_digest, "parameters": parameters}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def input_line(excel_path, input_record):
+    return f"Input File: {os.path.basename(excel_path)} | {integrity.format_record(input_record)}\n"
+
+
+def output_name(path, output_folder=None):
+    # Files in a folder under output_folder, such as KML partitions, are named by their path from it
+    return os.path.relpath(path, output_folder).replace(os.sep, "/") if output_folder else os.path.basename(path)
+
+
+def output_lines(output_paths, output_folder=None):
+    # Digests come from the bytes as they were written; files written some other way get their size only
+    lines = []
+    for path in output_paths:
+        record = integrity.output_record(path) or {"size": os.path.getsize(path)}
+        lines.append(f"Output File: {output_name(path, output_folder)} | {integrity.format_record(record)}\n")
+    return lines
+
+
+def run_record_path(filters_path, digest):
+    # One record per export, next to the settings file and named after the export's digest, so an export of another
+    # window or other settings of the same input never replaces it
+    return f"{os.path.splitext(filters_path)[0]} - {digest[:16]}.run.json"
+
+
+def run_records(filters_path):
+    # Every run record an export of this input has left next to its settings file
+    folder, name = os.path.split(filters_path)
+    prefix = os.path.splitext(name)[0] + " - "
+    if not os.path.isdir(folder or "."):
+        return []
+    records = []
+    for entry in sorted(os.listdir(folder or ".")):
+        if entry.startswith(prefix) and entry.endswith(".run.json"):
+            try:
+                with open(os.path.join(folder, entry), encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if record.get("version") == RUN_RECORD_VERSION:
+                records.append(record)
+    return records
+
+
+def recorded_outputs(filters_path, output_paths, output_folder=None):
+    # The records, with every digest and row count, that earlier exports of this input wrote for these files; a file
+    # only gets one while its size and modification time are still those that export left it with
+    found = {}
+    for run_record in run_records(filters_path):
+        lines = {}
+        for line in run_record["settings"].splitlines():
+            key, separator, value = line.partition(": ")
+            if key == "Output File" and separator:
+                name, _, fields = value.partition(" | ")
+                lines[name] = integrity.parse_record(fields)
+        for path in output_paths:
+            name = output_name(path, output_folder)
+            output = run_record["outputs"].get(name)
+            if path in found or output is None or not lines.get(name) or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            if stat.st_size == output["size"] == lines[name]["size"] and stat.st_mtime_ns == output["mtime_ns"]:
+                found[path] = lines[name]
+    return found
+
+
+def save_run_record(filters_path, digest, point_count, output_paths, output_folder=None):
+    # The settings file as written, and every output with the size, modification time and SHA-256 it was left with;
+    # written to a temporary file of its own first, so concurrent exports never leave a half-written record
+    with open(filters_path, encoding="utf-8") as f:
+        settings = f.read()
+    outputs = {}
+    for path in output_paths:
+        record = integrity.output_record(path) or {}
+        sha256 = record.get("sha256") or integrity.hash_file(path, ("sha256",))["sha256"]
+        stat = os.stat(path)
+        outputs[output_name(path, output_folder)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    path = run_record_path(filters_path, digest)
+    folder, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder or ".", prefix=name + ".", suffix=".tmp", delete=False) as f:
+        json.dump({"version": RUN_RECORD_VERSION, "digest": digest, "point_count": point_count, "settings": settings, "outputs": outputs}, f, indent=2)
+    os.replace(f.name, path)
+    return path
+
+
+def cached_outputs(filters_path, digest):
+    # Reuse an earlier export only when a record of the same digest is in the folder and every file it produced is
+    # still the one it wrote, KML partitions included: size and modification time first, then the SHA-256 of the
+    # bytes. Returns the files in the output folder itself, as a fresh run returns them, the point count and the
+    # settings written for that export
+    path = run_record_path(filters_path, digest)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            record = json.load(f)
+    except ValueError:
+        return None
+    if record.get("version") != RUN_RECORD_VERSION or record.get("digest") != digest or not record["outputs"]:
+        return None
+    folder = os.path.dirname(filters_path)
+    paths = []
+    for name, output in record["outputs"].items():
+        output_path = os.path.join(folder, *name.split("/"))
+        if not os.path.isfile(output_path):
+            return None
+        stat = os.stat(output_path)
+        if stat.st_size != output["size"] or stat.st_mtime_ns != output["mtime_ns"]:
+            return None
+        if integrity.hash_file(output_path, ("sha256",))["sha256"] != output["sha256"]:
+            return None
+        if "/" not in name:
+            paths.append(output_path)
+    return paths, record["point_count"], record["settings"]
@@ -0,0 +1,93 @@
+import numpy as np
+from location_export import no_log
+
+EARTH_RADIUS = 6371008.8  # Mean earth radius in metres
+
+# Faster than anything a phone is carried in, aircraft included
+DEFAULT_MAX_SPEED_KMH = 1000
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great-circle distance in metres between arrays of points given in degrees
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    # Bearing in degrees clockwise from north for travelling from point 1 to point 2
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def sort_by_time(df):
+    # Skip the sort when the frame is already in time order, which is the usual case
+    timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+    if len(timestamps) < 2 or np.all(timestamps[1:] >= timestamps[:-1]):
+        return df
+    return df.iloc[np.argsort(timestamps, kind="stable")]
+
+
+def analyse_movement(df, max_speed_kmh=DEFAULT_MAX_SPEED_KMH, fill_missing=True, log=no_log):
+    df = sort_by_time(df)
+    lat = df["ZLATITUDE"].to_numpy(dtype=np.float64)
+    lon = df["ZLONGITUDE"].to_numpy(dtype=np.float64)
+    timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+    accuracy = df["ZHORIZONTALACCURACY"].to_numpy(dtype=np.float64)
+
+    # Distance, elapsed time, speed and bearing from the previous fix; the first fix has no previous one
+    distance = np.full(len(df), np.nan)
+    elapsed = np.full(len(df), np.nan)
+    bearing = np.full(len(df), np.nan)
+    if len(df) > 1:
+        distance[1:] = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        elapsed[1:] = np.diff(timestamps)
+        bearing[1:] = initial_bearing(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(elapsed > 0, distance / elapsed, np.nan)
+
+    # A jump is implausible when even the accuracy circles of both fixes cannot explain it at the maximum speed
+    max_speed = max_speed_kmh / 3.6
+    slack = np.zeros(len(df))
+    slack[1:] = np.nan_to_num(accuracy[:-1]) + np.nan_to_num(accuracy[1:])
+    with np.errstate(invalid="ignore"):
+        jump_in = (distance - slack) > max_speed * np.where(elapsed > 0, elapsed, 0)
+    jump_in &= ~np.isnan(distance)
+    jump_out = np.zeros(len(df), dtype=bool)
+    jump_out[:-1] = jump_in[1:]
+
+    # A fix that jumps away and straight back is a lone outlier, a jump that stays is a teleport
+    outlier = jump_in & jump_out
+    teleport = jump_in & ~outlier
+    teleport[1:] &= ~outlier[:-1]  # Returning from an outlier is not a second jump
+
+    df = df.assign(
+        distance=distance,
+        elapsed=elapsed,
+        derived_speed=speed,
+        derived_course=bearing,
+        teleport=teleport,
+        outlier=outlier,
+    )
+
+    # Fill in speed and course the device did not record, marking them as derived
+    if fill_missing:
+        derived = ~(outlier | teleport)
+        derived[1:] &= ~outlier[:-1]  # Measured from an outlier
+        speed_missing = (df["ZSPEED"].to_numpy() == -1) & ~np.isnan(speed) & derived
+        course_missing = (df["ZCOURSE"].to_numpy() == -1) & ~np.isnan(bearing) & (distance > 0) & derived
+        df = df.assign(
+            ZSPEED=np.where(speed_missing, speed, df["ZSPEED"].to_numpy(dtype=np.float64)),
+            ZCOURSE=np.where(course_missing, bearing, df["ZCOURSE"].to_numpy(dtype=np.float64)),
+            speed_derived=speed_missing,
+            course_derived=course_missing,
+        )
+        log(f"Derived speed for {int(speed_missing.sum())} and course for {int(course_missing.sum())} fixes")
+    log(f"Flagged {int(teleport.sum())} teleports and {int(outlier.sum())} outliers above {max_speed_kmh} km/h")
+    return df
+
+
+def flagged(df):
+    return df["teleport"].to_numpy() | df["outlier"].to_numpy()
@@ -0,0 +1,110 @@
+import queue
+import threading
+import time
+from location_export import no_log
+
+# Batches allowed to wait between two stages; a full queue makes the stage before it wait, which caps memory
+QUEUE_DEPTH = 4
+
+# How often a blocked stage checks whether the pipeline has been stopped, in seconds
+STOP_POLL = 0.1
+
+_END = object()
+
+
+class StageStats:
+
+    def __init__(self, name):
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self.busy = 0.0
+        self.max_depth = 0
+
+    def summary(self, queue_depth):
+        rate = self.rows / self.busy if self.busy > 0 else 0
+        return (f"Stage {self.name}: {self.batches} batches, {self.rows} rows, busy {self.busy:.2f}s ({rate:.0f} rows/s), "
+                f"output queue depth up to {self.max_depth}/{queue_depth}")
+
+
+class _Failure:
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(output, item, stop):
+    while not stop.is_set():
+        try:
+            output.put(item, timeout=STOP_POLL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(source, stop):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=STOP_POLL)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _run_stage(batches, function, stats, output, stop):
+    # Pulls batches from the iterator, applies the function and hands the results on; a stage is timed over its own
+    # work only, the source over producing each batch
+    try:
+        iterator = iter(batches)
+        while True:
+            started = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                break
+            if function is not None:
+                started = time.perf_counter()
+                batch = function(batch)
+            stats.busy += time.perf_counter() - started
+            stats.batches += 1
+            stats.rows += len(batch)
+            if not _put(output, batch, stop):
+                return
+            stats.max_depth = max(stats.max_depth, output.qsize())
+        _put(output, _END, stop)
+    except Exception as e:
+        _put(output, _Failure(e), stop)
+
+
+def _drain(source, stop):
+    while True:
+        item = _get(source, stop)
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def run_pipeline(source, stages, queue_depth=QUEUE_DEPTH, log=no_log):
+    # Runs the source and every (name, function) stage on its own thread, yielding the last stage's batches as they
+    # arrive, so reading the next batch overlaps with transforming and writing the current one
+    stop = threading.Event()
+    source_name, source_batches = source
+    all_stats = [StageStats(source_name)] + [StageStats(name) for name, _ in stages]
+    queues = [queue.Queue(maxsize=queue_depth) for _ in all_stats]
+    threads = [threading.Thread(target=_run_stage, args=(source_batches, None, all_stats[0], queues[0], stop), daemon=True)]
+    for position, (_, function) in enumerate(stages, start=1):
+        threads.append(threading.Thread(target=_run_stage, args=(_drain(queues[position - 1], stop), function, all_stats[position], queues[position], stop), daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        yield from _drain(queues[-1], stop)
+    finally:
+        # Stops the other stages too when the consumer fails or gives up early
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for stats in all_stats:
+            log(stats.summary(queue_depth))
@@ -0,0 +1,204 @@
+import csv
+import os
+import numpy as np
+import pandas as pd
+import simplekml
+import integrity
+from location_export import IPHONE_EPOCH, UTC_OFFSET, convert_timestamp, export_filename, kml_time, no_log
+from movement_analysis import EARTH_RADIUS, haversine, sort_by_time
+from trips import format_duration
+
+PLACES_FORMAT = "Places"
+
+# A place is everywhere within DEFAULT_PLACE_RADIUS_M of ground where the device spent at least DEFAULT_MIN_DWELL_S
+DEFAULT_PLACE_RADIUS_M = 50
+DEFAULT_MIN_DWELL_S = 1800
+
+# The time to the next fix counts as time spent at a fix when the next fix is still there, up to MAX_STAY_GAP_S (a
+# longer silence is a phone that was off); a fix the device moved on from only gets MOVING_DWELL_S
+MAX_STAY_GAP_S = 12 * 3600
+MOVING_DWELL_S = 60
+
+# Separate visits to the same place closer together than this are one visit, so a stray fix does not split a stay
+VISIT_MERGE_GAP_S = 600
+
+MAX_PLACES = 50
+
+METRES_PER_DEGREE = np.pi * EARTH_RADIUS / 180
+
+# Grid cells are half the radius across, so every cell within the radius of another is at most two cells away
+CELLS_PER_RADIUS = 2
+CELL_OFFSETS = [(row, column) for row in range(-CELLS_PER_RADIUS, CELLS_PER_RADIUS + 1) for column in range(-CELLS_PER_RADIUS, CELLS_PER_RADIUS + 1)]
+
+PLACE_COLUMNS = ["place", "latitude", "longitude", "dwell", "visits", "fixes", "first_seen", "last_seen"]
+
+
+def dwell_times(timestamps, lat, lon, radius_m=DEFAULT_PLACE_RADIUS_M):
+    # Seconds credited to each fix of a time-ordered track
+    gaps = np.diff(timestamps)
+    stayed = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]) <= radius_m
+    dwell = np.where(stayed, np.minimum(gaps, MAX_STAY_GAP_S), np.minimum(gaps, MOVING_DWELL_S))
+    return np.append(dwell, 0.0)
+
+
+def _connected(count, first, second):
+    # Smallest cell number reachable from each cell over the edges, by label propagation with pointer jumping
+    labels = np.arange(count)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, first, labels[second])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def cluster_cells(lat, lon, dwell, radius_m=DEFAULT_PLACE_RADIUS_M, min_dwell_s=DEFAULT_MIN_DWELL_S):
+    # Density clustering on a metric grid: fixes are snapped to cells, and a cell is a core of a place when the dwell
+    # of every cell within radius_m of it adds up to min_dwell_s; core cells within reach of each other form one
+    # place, and a cell that is not a core joins the place of the nearest core in reach. Only the cells two either
+    # side of a cell are ever compared, so the work grows with the number of occupied cells, not its square.
+    # Returns the place number of every fix, -1 where the fix is in no place.
+    if not len(lat):
+        return np.zeros(0, dtype=np.int64)
+    cell_size = radius_m / CELLS_PER_RADIUS
+    # Projected around the median fix with one scale for longitude; scaling each fix's absolute longitude by its own
+    # latitude would shear the grid further the further it is from longitude 0
+    lat0 = np.median(lat)
+    lon0 = np.median(lon)
+    y = (lat - lat0) * METRES_PER_DEGREE
+    x = (lon - lon0) * METRES_PER_DEGREE * np.cos(np.radians(lat0))
+    rows = np.floor(y / cell_size).astype(np.int64)
+    columns = np.floor(x / cell_size).astype(np.int64)
+
+    # Packed with CELLS_PER_RADIUS spare cells on every side, so a neighbour offset never wraps into another row
+    row_origin = rows.min() - CELLS_PER_RADIUS
+    column_origin = columns.min() - CELLS_PER_RADIUS
+    span = columns.max() - column_origin + CELLS_PER_RADIUS + 1
+    keys, cell = np.unique((rows - row_origin) * span + (columns - column_origin), return_inverse=True)
+    cell = cell.ravel()
+    fixes = np.bincount(cell)
+    cell_dwell = np.bincount(cell, weights=dwell)
+    cell_y = np.bincount(cell, weights=y) / fixes
+    cell_x = np.bincount(cell, weights=x) / fixes
+
+    # Every pair of occupied cells within the radius of each other, found by looking up each offset in the sorted keys
+    first = []
+    second = []
+    for row_offset, column_offset in CELL_OFFSETS:
+        targets = keys + row_offset * span + column_offset
+        found = np.searchsorted(keys, targets)
+        found = np.minimum(found, len(keys) - 1)
+        hit = np.flatnonzero(keys[found] == targets)
+        first.append(hit)
+        second.append(found[hit])
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    distance = np.hypot(cell_y[first] - cell_y[second], cell_x[first] - cell_x[second])
+    reach = distance <= radius_m
+    first, second, distance = first[reach], second[reach], distance[reach]
+
+    core = np.bincount(first, weights=cell_dwell[second], minlength=len(keys)) >= min_dwell_s
+    core_edge = core[first] & core[second]
+    labels = _connected(len(keys), first[core_edge], second[core_edge])
+
+    # Border cells take the place of the closest core cell in reach
+    place = np.where(core, labels, -1)
+    border = ~core[first] & core[second]
+    order = np.lexsort((distance[border], first[border]))
+    border_cells = first[border][order]
+    nearest = np.ones(len(border_cells), dtype=bool)
+    nearest[1:] = border_cells[1:] != border_cells[:-1]
+    place[border_cells[nearest]] = labels[second[border][order][nearest]]
+    return place[cell]
+
+
+def find_places(df, radius_m=DEFAULT_PLACE_RADIUS_M, min_dwell_s=DEFAULT_MIN_DWELL_S, max_places=MAX_PLACES, log=no_log):
+    # The places the device spent most time at, ranked by total dwell, with visits and first and last seen times
+    df = sort_by_time(df)
+    timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+    lat = df["ZLATITUDE"].to_numpy(dtype=np.float64)
+    lon = df["ZLONGITUDE"].to_numpy(dtype=np.float64)
+    located = ~(np.isnan(timestamps) | np.isnan(lat) | np.isnan(lon))
+    timestamps, lat, lon = timestamps[located], lat[located], lon[located]
+    if not len(timestamps):
+        log("No fixes with coordinates, no places to find")
+        return pd.DataFrame(columns=PLACE_COLUMNS)
+    dwell = dwell_times(timestamps, lat, lon, radius_m)
+    labels = cluster_cells(lat, lon, dwell, radius_m, min_dwell_s)
+    in_place = labels >= 0
+    if not in_place.any():
+        log(f"No place held the device for {format_duration(min_dwell_s)} within {radius_m} m")
+        return pd.DataFrame(columns=PLACE_COLUMNS)
+
+    # A visit is a run of fixes in the same place, and runs of one place broken only by a short gap are joined
+    changes = np.flatnonzero(np.diff(labels)) + 1
+    run_starts = np.concatenate([[0], changes])
+    run_ends = np.append(changes, len(labels)) - 1
+    runs = pd.DataFrame({"label": labels[run_starts], "start": timestamps[run_starts], "end": timestamps[run_ends]})
+    runs = runs[runs["label"] >= 0]
+    previous_end = runs.groupby("label")["end"].shift()
+    runs["visit"] = (previous_end.isna() | (runs["start"] - previous_end > VISIT_MERGE_GAP_S)).astype(int)
+
+    fixes = pd.DataFrame({"label": labels[in_place], "timestamp": timestamps[in_place], "dwell": dwell[in_place],
+                          "lat": lat[in_place], "lon": lon[in_place]})
+    # Longer stays pull the centre towards them, a fix with no dwell still counts for a second
+    fixes["weight"] = np.maximum(fixes["dwell"], 1.0)
+    fixes["weighted_lat"] = fixes["lat"] * fixes["weight"]
+    fixes["weighted_lon"] = fixes["lon"] * fixes["weight"]
+    places = fixes.groupby("label").agg(dwell=("dwell", "sum"), fixes=("timestamp", "size"), first_seen=("timestamp", "min"),
+                                        last_seen=("timestamp", "max"), weight=("weight", "sum"),
+                                        weighted_lat=("weighted_lat", "sum"), weighted_lon=("weighted_lon", "sum"))
+    places["latitude"] = places["weighted_lat"] / places["weight"]
+    places["longitude"] = places["weighted_lon"] / places["weight"]
+    places["visits"] = runs.groupby("label")["visit"].sum()
+    places = places.sort_values(["dwell", "first_seen"], ascending=[False, True]).head(max_places).reset_index(drop=True)
+    places["place"] = np.arange(1, len(places) + 1)
+    log(f"Found {len(np.unique(labels[in_place]))} places in {len(timestamps)} fixes, kept the {len(places)} with the most dwell")
+    return places[PLACE_COLUMNS]
+
+
+def _local_time(ts):
+    return IPHONE_EPOCH + UTC_OFFSET + pd.to_timedelta(ts, unit="s")
+
+
+def place_description(place):
+    first_date, first_time, time_zone = convert_timestamp(place["first_seen"])
+    last_date, last_time, _ = convert_timestamp(place["last_seen"])
+    return (
+        f"Time Zone: {time_zone}\n"
+        f"Total Dwell: {format_duration(place['dwell'])}\n"
+        f"Visits: {place['visits']}\n"
+        f"Fixes: {place['fixes']}\n"
+        f"First Seen: {first_date} {first_time}\n"
+        f"Last Seen: {last_date} {last_time}"
+    )
+
+
+def write_places(df, excel_path, output_folder, horizontal_accuracy_filter_str, start_datetime, end_datetime, suffix="",
+                 radius_m=DEFAULT_PLACE_RADIUS_M, min_dwell_s=DEFAULT_MIN_DWELL_S, algorithms=integrity.DEFAULT_ALGORITHMS, log=no_log):
+    # Writes the ranked places as KML placemarks and a CSV table, returns the files written and the number of places
+    places = find_places(df, radius_m, min_dwell_s, log=log)
+    kml_path = os.path.join(output_folder, export_filename(excel_path, horizontal_accuracy_filter_str, start_datetime, end_datetime, extension=f"{suffix} - places.kml"))
+    csv_path = os.path.splitext(kml_path)[0] + ".csv"
+
+    kml = simplekml.Kml()
+    for place in places.to_dict("records"):
+        point = kml.newpoint(name=f"Place {place['place']}: {format_duration(place['dwell'])}", coords=[(place["longitude"], place["latitude"])])
+        point.description = place_description(place)
+        point.timespan.begin = kml_time(_local_time(place["first_seen"]))
+        point.timespan.end = kml_time(_local_time(place["last_seen"]))
+        point.style.iconstyle.icon.href = "http://maps.google.com/mapfiles/kml/shapes/homegardenbusiness.png"
+    integrity.save_kml(kml, kml_path, algorithms)
+
+    with integrity.open_output(csv_path, algorithms) as f:
+        writer = csv.writer(f)
+        writer.writerow(["Place", "Latitude", "Longitude", "Total Dwell (s)", "Visits", "Fixes", "First Seen Date", "First Seen Time",
+                         "Last Seen Date", "Last Seen Time", "Time Zone"])
+        for place in places.itertuples(index=False):
+            first_date, first_time, time_zone = convert_timestamp(place.first_seen)
+            last_date, last_time, _ = convert_timestamp(place.last_seen)
+            writer.writerow([place.place, round(place.latitude, 7), round(place.longitude, 7), round(place.dwell), place.visits, place.fixes,
+                             first_date, first_time, last_date, last_time, time_zone])
+        integrity.hashing_writer(f).rows = len(places)
+    return [kml_path, csv_path], len(places)
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import simplekml
+import integrity
+from location_export import IPHONE_EPOCH, RED_DOT_ICON, UTC_OFFSET, convert_timestamp, kml_time
+from movement_analysis import haversine, sort_by_time
+
+# Fixes further apart than this say nothing about the path between them, so no position is interpolated across the gap
+MAX_INTERPOLATION_GAP_S = 3600
+
+LOOKUP_COLUMNS = ["query", "nearest_pk", "nearest_timestamp", "nearest_latitude", "nearest_longitude", "nearest_accuracy",
+                  "time_offset", "latitude", "longitude", "uncertainty", "gap"]
+
+
+class LocationIndex:
+
+    def __init__(self, df):
+        # Sorted once, so any number of lookups are binary searches over the timestamps
+        df = df[df["ZLATITUDE"].notna() & df["ZLONGITUDE"].notna()]
+        timestamps = df["ZTIMESTAMP"].astype(float)
+        df = sort_by_time(df[timestamps.notna()].assign(ZTIMESTAMP=timestamps[timestamps.notna()]))
+        if df.empty:
+            raise ValueError("The file has no fixes with a time and position to look up.")
+        self.pk = df["Z_PK"].to_numpy()
+        self.timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+        self.latitude = df["ZLATITUDE"].to_numpy(dtype=np.float64)
+        self.longitude = df["ZLONGITUDE"].to_numpy(dtype=np.float64)
+        self.accuracy = np.nan_to_num(df["ZHORIZONTALACCURACY"].to_numpy(dtype=np.float64))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def locate(self, queries, max_gap=MAX_INTERPOLATION_GAP_S):
+        # The nearest fix to each query time, and the position interpolated along the great circle between the fixes
+        # either side of it; queries outside the recorded range or inside a gap longer than max_gap get no interpolation
+        queries = np.atleast_1d(np.asarray(queries, dtype=np.float64))
+        after = np.clip(np.searchsorted(self.timestamps, queries, side="left"), 1, len(self) - 1) if len(self) > 1 else np.zeros(len(queries), dtype=np.intp)
+        before = np.maximum(after - 1, 0)
+        nearest = np.where(np.abs(queries - self.timestamps[before]) <= np.abs(self.timestamps[after] - queries), before, after)
+
+        gap = self.timestamps[after] - self.timestamps[before]
+        inside = (queries >= self.timestamps[before]) & (queries <= self.timestamps[after]) & (gap <= max_gap)
+        fraction = np.divide(queries - self.timestamps[before], gap, out=np.zeros_like(queries), where=gap > 0)
+        latitude, longitude = great_circle_point(self.latitude[before], self.longitude[before],
+                                                 self.latitude[after], self.longitude[after], fraction)
+
+        # Each fix's accuracy radius weighted by how close the query is to it, widened towards the middle of the
+        # segment because the phone need not have travelled in a straight line between the fixes
+        segment = haversine(self.latitude[before], self.longitude[before], self.latitude[after], self.longitude[after])
+        uncertainty = ((1 - fraction) * self.accuracy[before] + fraction * self.accuracy[after]
+                       + np.minimum(fraction, 1 - fraction) * segment)
+
+        return pd.DataFrame({
+            "query": queries,
+            "nearest_pk": self.pk[nearest],
+            "nearest_timestamp": self.timestamps[nearest],
+            "nearest_latitude": self.latitude[nearest],
+            "nearest_longitude": self.longitude[nearest],
+            "nearest_accuracy": self.accuracy[nearest],
+            "time_offset": self.timestamps[nearest] - queries,
+            "latitude": np.where(inside, latitude, np.nan),
+            "longitude": np.where(inside, longitude, np.nan),
+            "uncertainty": np.where(inside, uncertainty, np.nan),
+            "gap": gap,
+        })
+
+
+def great_circle_point(lat1, lon1, lat2, lon2, fraction):
+    # The point the given fraction of the way along the great circle from point 1 to point 2, all in degrees
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    start = np.stack([np.cos(lat1) * np.cos(lon1), np.cos(lat1) * np.sin(lon1), np.sin(lat1)])
+    end = np.stack([np.cos(lat2) * np.cos(lon2), np.cos(lat2) * np.sin(lon2), np.sin(lat2)])
+    angle = np.arccos(np.clip((start * end).sum(axis=0), -1, 1))
+    sin_angle = np.sin(angle)
+    # Points a few millimetres apart make the spherical weights 0/0, where straight-line weights are just as good
+    close = sin_angle < 1e-9
+    safe = np.where(close, 1, sin_angle)
+    start_weight = np.where(close, 1 - fraction, np.sin((1 - fraction) * angle) / safe)
+    end_weight = np.where(close, fraction, np.sin(fraction * angle) / safe)
+    x, y, z = start * start_weight + end * end_weight
+    return np.degrees(np.arctan2(z, np.hypot(x, y))), np.degrees(np.arctan2(y, x))
+
+
+def write_lookup_kml(results, path, algorithms=integrity.DEFAULT_ALGORITHMS):
+    # One placemark per query, at the interpolated position when there is one and the nearest fix otherwise
+    kml = simplekml.Kml()
+    for row in results.itertuples(index=False):
+        date_str, time_str, time_zone = convert_timestamp(row.query)
+        interpolated = not np.isnan(row.latitude)
+        latitude, longitude = (row.latitude, row.longitude) if interpolated else (row.nearest_latitude, row.nearest_longitude)
+        nearest_date, nearest_time, _ = convert_timestamp(row.nearest_timestamp)
+        point = kml.newpoint(name=f"{date_str} {time_str}", coords=[(longitude, latitude)])
+        point.description = (
+            f"Time Zone: {time_zone}\n"
+            f"Query: {date_str} {time_str}\n"
+            f"Position: {'interpolated between the fixes either side' if interpolated else 'nearest fix, no fixes either side to interpolate between'}\n"
+            f"Latitude: {latitude}\n"
+            f"Longitude: {longitude}\n"
+            f"Uncertainty: {round(row.uncertainty if interpolated else row.nearest_accuracy, 1)} (m) radius\n"
+            f"Nearest Fix ID: {row.nearest_pk}\n"
+            f"Nearest Fix Time: {nearest_date} {nearest_time} ({round(row.time_offset, 1)} s)"
+        )
+        point.timestamp.when = kml_time(IPHONE_EPOCH + UTC_OFFSET + pd.to_timedelta(row.query, unit="s"))
+        point.style.iconstyle.icon.href = RED_DOT_ICON
+    integrity.save_kml(kml, path, algorithms)
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+from location_export import no_log
+from movement_analysis import sort_by_time
+
+# Column naming the input file each merged row came from
+SOURCE_COLUMN = "source_file"
+
+MERGE_BATCH_SIZE = 5000
+
+
+def source_batches(df, source_path, batch_size=MERGE_BATCH_SIZE):
+    # One input as time-ordered batches with numeric timestamps and its provenance tag; rows without a timestamp cannot be placed in time and never pass the export's time filter anyway
+    timestamps = df["ZTIMESTAMP"].astype(float)
+    df = sort_by_time(df[timestamps.notna()].assign(ZTIMESTAMP=timestamps[timestamps.notna()]))
+    df = df.assign(**{SOURCE_COLUMN: os.path.basename(source_path)})
+    for start in range(0, len(df), batch_size):
+        yield df.iloc[start:start + batch_size]
+
+
+def _next_batch(iterator):
+    for batch in iterator:
+        if len(batch):
+            return batch
+    return None
+
+
+def merge_sources(sources, deduplicate=True, log=no_log):
+    # k-way merge of time-ordered batch streams: each step emits every row up to the smallest last timestamp among
+    # the batches in hand, so no input is ever concatenated with another and each step is a vectorized slice;
+    # without deduplicate every row is kept, which is what the external sort merges its runs with
+    iterators = [iter(batches) for batches in sources]
+    current = [_next_batch(iterator) for iterator in iterators]
+
+    # A duplicate has the same timestamp as its original, so only the keys at the latest timestamp emitted need
+    # remembering between steps
+    boundary_timestamp = None
+    boundary_keys = set()
+    merged_rows = 0
+    duplicates = 0
+    while any(batch is not None for batch in current):
+        active = [position for position, batch in enumerate(current) if batch is not None]
+        frontier = min(current[position]["ZTIMESTAMP"].iloc[-1] for position in active)
+        parts = []
+        for position in active:
+            batch = current[position]
+            cut = int(np.searchsorted(batch["ZTIMESTAMP"].to_numpy(), frontier, side="right"))
+            parts.append(batch.iloc[:cut])
+            current[position] = batch.iloc[cut:] if cut < len(batch) else _next_batch(iterators[position])
+
+        # Stable, so rows with equal timestamps keep the order the inputs were given in and the earliest input wins
+        step = pd.concat(parts, ignore_index=True).sort_values("ZTIMESTAMP", kind="stable")
+        if not deduplicate:
+            merged_rows += len(step)
+            yield step.reset_index(drop=True)
+            continue
+        timestamps = step["ZTIMESTAMP"].to_numpy()
+        keys = pd.Series(list(zip(step["Z_PK"].astype(str), timestamps)), index=step.index)
+        duplicate = keys.duplicated().to_numpy().copy()
+        if boundary_timestamp is not None:
+            at_boundary = timestamps == boundary_timestamp
+            duplicate[at_boundary] |= keys[at_boundary].isin(boundary_keys).to_numpy()
+        kept = step[~duplicate]
+        duplicates += int(duplicate.sum())
+
+        if frontier != boundary_timestamp:
+            boundary_keys = set()
+            boundary_timestamp = frontier
+        boundary_keys.update(keys[(timestamps == frontier) & ~duplicate])
+        if len(kept):
+            merged_rows += len(kept)
+            yield kept.reset_index(drop=True)
+    if deduplicate:
+        log(f"Merged {len(iterators)} inputs into {merged_rows} rows, dropped {duplicates} duplicates by Z_PK and timestamp")
+    else:
+        log(f"Merged {len(iterators)} inputs into {merged_rows} rows")
@@ -0,0 +1,44 @@
+import time
+import unittest
+import numpy as np
+from accuracy_rings import MAX_RING_VERTICES, MIN_RING_VERTICES, accuracy_rings, ring_vertex_counts
+from movement_analysis import haversine
+
+
+def ring_points(text):
+    return np.array([[float(value) for value in vertex.split(",")] for vertex in text.split()])
+
+
+class TestAccuracyRings(unittest.TestCase):
+
+    def test_vertex_count_grows_with_radius(self):
+        counts = ring_vertex_counts(np.array([1.0, 5.0, 100.0, 2000.0]))
+        self.assertEqual(counts[0], MIN_RING_VERTICES)
+        self.assertTrue(np.all(np.diff(counts) >= 0))
+        self.assertEqual(counts[-1], MAX_RING_VERTICES)
+
+    def test_rings_are_closed_and_at_the_radius(self):
+        lat = np.array([-27.47, 60.0, -27.47, -27.47])
+        lon = np.array([153.02, 10.0, 153.02, 153.02])
+        radius = np.array([65.0, 250.0, np.nan, -1.0])
+        rings = accuracy_rings(lat, lon, radius)
+        self.assertIsNone(rings[2])
+        self.assertIsNone(rings[3])
+        for position in (0, 1):
+            points = ring_points(rings[position])
+            np.testing.assert_array_equal(points[0], points[-1])
+            # Longitude is scaled by latitude, so the ring is round on the ground, not in degrees
+            distances = haversine(lat[position], lon[position], points[:, 1], points[:, 0])
+            np.testing.assert_allclose(distances, radius[position], rtol=0.01)
+
+    def test_large_batch_is_quick(self):
+        rows = 100000
+        rng = np.random.default_rng(0)
+        started = time.perf_counter()
+        rings = accuracy_rings(rng.uniform(-40, -10, rows), rng.uniform(110, 155, rows), rng.uniform(3, 300, rows))
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertEqual(len(rings), rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from checkpoint import checkpoint_path, load_checkpoint, save_checkpoint, skip_rows
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_skip_rows(self):
+        batches = [pd.DataFrame({"x": range(start, start + 3)}) for start in (0, 3, 6)]
+        remaining = list(skip_rows(batches, 4))
+        self.assertEqual([list(batch["x"]) for batch in remaining], [[4, 5], [6, 7, 8]])
+        self.assertEqual(len(list(skip_rows(batches, 0))), 3)
+
+    def test_checkpoint_must_match_digest_and_outputs(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, "out.csv")
+            with open(output, "w") as f:
+                f.write("header\nrow\n")
+            path = checkpoint_path(os.path.join(folder, "Filters - device.txt"), "abc")
+            self.assertTrue(path.endswith("Filters - device - abc.checkpoint.json"))
+            self.assertNotEqual(checkpoint_path(os.path.join(folder, "Filters - device.txt"), "other settings"), path)
+            save_checkpoint(path, {"digest": "abc", "rows": 1, "outputs": {"CSV": {"path": output, "size": 11, "point_count": 1}}})
+            self.assertEqual(load_checkpoint(path, "abc")["rows"], 1)
+            self.assertIsNone(load_checkpoint(path, "other settings"))
+            with open(output, "w") as f:
+                f.write("header\n")
+            self.assertIsNone(load_checkpoint(path, "abc"))
+            self.assertEqual(sorted(os.listdir(folder)), sorted(["out.csv", os.path.basename(path)]))  # No temporary file left behind
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+import pandas as pd
+from colocation import METRES_PER_DEGREE, find_colocations, group_meetings, write_colocation_csv, write_colocation_kml
+from test_location_export import BASE_TS, make_frame
+
+
+def device(timestamps, lat_offsets_m=0.0, accuracy=5.0):
+    df = make_frame(timestamps, accuracy)
+    df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float)
+    df["ZLATITUDE"] = df["ZLATITUDE"] + np.asarray(lat_offsets_m, dtype=float) / METRES_PER_DEGREE
+    return df
+
+
+def brute_force(df_a, df_b, distance_m, time_s):
+    # Every pair compared directly, for checking the join
+    matched = set()
+    for a in df_a.itertuples():
+        for b in df_b.itertuples():
+            dlat = (a.ZLATITUDE - b.ZLATITUDE) * METRES_PER_DEGREE
+            dlon = (a.ZLONGITUDE - b.ZLONGITUDE) * METRES_PER_DEGREE * np.cos(np.radians(a.ZLATITUDE))
+            if abs(a.ZTIMESTAMP - b.ZTIMESTAMP) <= time_s and np.hypot(dlat, dlon) <= distance_m + a.ZHORIZONTALACCURACY + b.ZHORIZONTALACCURACY:
+                matched.add(a.Z_PK)
+    return matched
+
+
+class TestColocation(unittest.TestCase):
+
+    def test_matches_within_distance_and_time(self):
+        df_a = device([BASE_TS, BASE_TS + 100, BASE_TS + 200])
+        df_b = device([BASE_TS + 30, BASE_TS + 190, BASE_TS + 260], lat_offsets_m=[40, 400, 40])
+        pairs = find_colocations(df_a, df_b, distance_m=50, time_s=60)
+        # A's second fix has no B fix within a minute, A's third is a minute from B's third but 40 m + 10 m of accuracy away
+        self.assertEqual(list(pairs["a_pk"]), ["1", "3"])
+        self.assertEqual(list(pairs["b_pk"]), ["1", "3"])
+        self.assertAlmostEqual(pairs["distance"].iloc[0], 40, delta=0.5)
+
+    def test_accuracy_widens_the_tolerance(self):
+        df_a = device([BASE_TS], accuracy=5.0)
+        near = device([BASE_TS], lat_offsets_m=[80], accuracy=5.0)
+        vague = device([BASE_TS], lat_offsets_m=[80], accuracy=30.0)
+        self.assertTrue(find_colocations(df_a, near, distance_m=50, time_s=60).empty)
+        self.assertEqual(len(find_colocations(df_a, vague, distance_m=50, time_s=60)), 1)
+
+    def test_closest_fix_is_kept(self):
+        df_a = device([BASE_TS])
+        df_b = device([BASE_TS - 10, BASE_TS + 10], lat_offsets_m=[30, 10])
+        pairs = find_colocations(df_a, df_b)
+        self.assertEqual(list(pairs["b_pk"]), ["2"])
+
+    def test_join_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        df_a = device(np.sort(rng.uniform(BASE_TS, BASE_TS + 3600, 300)), rng.normal(0, 200, 300), rng.uniform(1, 40, 300))
+        df_b = device(np.sort(rng.uniform(BASE_TS, BASE_TS + 3600, 300)), rng.normal(0, 200, 300), rng.uniform(1, 40, 300))
+        pairs = find_colocations(df_a, df_b, distance_m=20, time_s=45)
+        self.assertGreater(len(pairs), 0)
+        self.assertEqual(set(pairs["a_pk"]), brute_force(df_a, df_b, 20, 45))
+
+    def test_wide_fixes_match_brute_force(self):
+        # A few fixes hundreds of metres wide search further than the typical ones the cells are sized for
+        rng = np.random.default_rng(11)
+        accuracy_a = rng.choice([5.0, 10.0, 35.0], 400, p=[0.5, 0.3, 0.2])
+        accuracy_b = rng.choice([5.0, 10.0, 65.0], 400, p=[0.5, 0.3, 0.2])
+        accuracy_a[::100] = 490.0
+        accuracy_b[50::200] = 300.0
+        df_a = device(np.sort(rng.uniform(BASE_TS, BASE_TS + 3600, 400)), rng.normal(0, 600, 400), accuracy_a)
+        df_b = device(np.sort(rng.uniform(BASE_TS, BASE_TS + 3600, 400)), rng.normal(0, 600, 400), accuracy_b)
+        pairs = find_colocations(df_a, df_b, distance_m=20, time_s=45)
+        self.assertTrue((pairs["a_accuracy"] + pairs["b_accuracy"] > 300).any())
+        self.assertEqual(set(pairs["a_pk"]), brute_force(df_a, df_b, 20, 45))
+
+    def test_large_devices_finish_quickly(self):
+        rng = np.random.default_rng(1)
+        rows = 200000
+        df_a = device(np.sort(rng.uniform(BASE_TS, BASE_TS + 7 * 86400, rows)), rng.normal(0, 3000, rows))
+        df_b = device(np.sort(rng.uniform(BASE_TS, BASE_TS + 7 * 86400, rows)), rng.normal(0, 3000, rows))
+        started = time.perf_counter()
+        find_colocations(df_a, df_b)
+        self.assertLess(time.perf_counter() - started, 10)
+
+    def test_meetings_and_outputs(self):
+        timestamps = [BASE_TS, BASE_TS + 60, BASE_TS + 120, BASE_TS + 3600, BASE_TS + 3660]
+        pairs = find_colocations(device(timestamps), device(timestamps, lat_offsets_m=10))
+        meetings = group_meetings(pairs)
+        self.assertEqual(list(meetings["fixes"]), [3, 2])
+        with tempfile.TemporaryDirectory() as folder:
+            kml_path = os.path.join(folder, "meetings.kml")
+            csv_path = os.path.join(folder, "meetings.csv")
+            write_colocation_kml(meetings, kml_path, "phone A", "phone B")
+            write_colocation_csv(pairs, csv_path)
+            with open(kml_path, encoding="utf-8") as f:
+                kml = f.read()
+            self.assertEqual(kml.count("<Placemark"), 2)
+            self.assertIn("<begin>2024-01-01T00:00:00+10:00</begin>", kml)
+            self.assertEqual(len(pd.read_csv(csv_path)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
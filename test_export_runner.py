@@ -0,0 +1,283 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime
+import exporters
+import integrity
+from export_runner import run_colocation, run_export
+from frame_cache import READY, FrameCache
+from test_location_export import BASE_TS, make_frame
+
+
+class TestExportRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.excel_path = os.path.join(self.folder.name, "device.xlsx")
+        self.write_source(20)
+        self.output_folder = os.path.join(self.folder.name, "out")
+        os.makedirs(self.output_folder)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write_source(self, rows):
+        make_frame(range(BASE_TS, BASE_TS + rows * 60, 60)).to_excel(self.excel_path, index=False)
+
+    def export(self, **options):
+        return run_export(self.excel_path, self.output_folder, datetime(2024, 1, 1), datetime(2024, 1, 2), "nil",
+                          True, True, False, False, "km/h", **options)
+
+    def test_export_writes_outputs_and_settings(self):
+        result = self.export(formats=("KML", "CSV"))
+        self.assertFalse(result["cached"])
+        self.assertEqual(result["point_count"], 20)
+        self.assertEqual([os.path.splitext(path)[1] for path in result["output_paths"]], [".kml", ".csv"])
+        with open(result["filters_path"], encoding="utf-8") as f:
+            self.assertIn("Output Formats: KML, CSV\n", f.read())
+
+    def test_streamed_export_matches_in_memory_export(self):
+        # The movement check needs the whole frame in memory, a plain export streams it through the pipeline
+        with open(self.export(formats=("CSV",))["output_paths"][0], encoding="utf-8") as f:
+            streamed = f.read()
+        with open(self.export(formats=("CSV",), movement_check=True)["output_paths"][0], encoding="utf-8") as f:
+            in_memory = f.read()
+        self.assertEqual(streamed.count("\n"), 21)
+        self.assertEqual(streamed, in_memory)
+
+    def test_geojson_layout_follows_rows_read(self):
+        # Only the first five minutes pass the filter, the layout is still chosen on all 20 rows read
+        window = (datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 5))
+        with mock.patch.object(exporters, "NEWLINE_DELIMITED_ROWS", 10):
+            for options in ({}, {"movement_check": True}, {"merge_paths": (self.excel_path,)}):
+                result = run_export(self.excel_path, self.output_folder, *window, "nil", True, True, False, False, "km/h",
+                                    formats=("GeoJSON",), force=True, **options)
+                self.assertEqual(os.path.splitext(result["output_paths"][0])[1], ".geojsonl")
+
+    def test_prefetched_frame_gives_the_same_export(self):
+        with open(self.export(formats=("CSV",), force=True)["output_paths"][0], encoding="utf-8") as f:
+            expected = f.read()
+        cache = FrameCache()
+        cache.prefetch(self.excel_path).result()
+        result = self.export(formats=("CSV",), force=True, frame_cache=cache)
+        with open(result["output_paths"][0], encoding="utf-8") as f:
+            self.assertEqual(f.read(), expected)
+        # The frame stays cached unchanged for the next run
+        self.assertEqual(len(cache.load(self.excel_path)[1]), 20)
+        self.assertNotIn("rows", cache.load(self.excel_path)[0])
+        cache.shutdown()
+
+    def test_cache_is_only_waited_for_when_the_frame_is_needed(self):
+        cache = FrameCache()
+        self.addCleanup(cache.shutdown)
+        # Nothing loaded yet: a plain export streams the sheet rather than loading it through the cache
+        log = []
+        self.export(formats=("CSV",), force=True, frame_cache=cache, log=log.append)
+        self.assertIn("Streaming file: ", "\n".join(log))
+        self.assertIsNone(cache.status(self.excel_path))
+        # A compact export loads and keeps a compact frame, without the full-width one
+        self.assertEqual(self.export(formats=("CSV",), force=True, compact=True, frame_cache=cache)["point_count"], 20)
+        self.assertEqual(cache.status(self.excel_path, compact=True), READY)
+        self.assertIsNone(cache.status(self.excel_path))
+        # Once the file is loaded, a plain export uses the loaded frame
+        cache.load(self.excel_path)
+        log = []
+        self.export(formats=("CSV",), force=True, frame_cache=cache, log=log.append)
+        self.assertIn("Using the frame loaded in the background: 20 rows", log)
+
+    def test_merged_inputs(self):
+        later_path = os.path.join(self.folder.name, "device later.xlsx")
+        later = make_frame(range(BASE_TS + 600, BASE_TS + 1800, 60))
+        later["Z_PK"] = [str(number) for number in range(11, 31)]
+        later.to_excel(later_path, index=False)
+        result = self.export(formats=("KML", "CSV"), merge_paths=(later_path,))
+        self.assertEqual(result["point_count"], 30)
+        with open(result["output_paths"][0], encoding="utf-8") as f:
+            kml = f.read()
+        self.assertEqual(kml.count("Source File: device.xlsx"), 20)
+        self.assertEqual(kml.count("Source File: device later.xlsx"), 10)
+        with open(result["filters_path"], encoding="utf-8") as f:
+            settings = f.read()
+        self.assertIn("Input File: device later.xlsx", settings)
+        # The movement check needs the merged rows as one frame
+        self.assertEqual(self.export(formats=("CSV",), merge_paths=(later_path,), movement_check=True)["point_count"], 30)
+
+    def test_time_order_sorts_unordered_source(self):
+        make_frame(list(range(BASE_TS + 19 * 60, BASE_TS - 1, -60))).to_excel(self.excel_path, index=False)
+        # A tiny budget makes the streamed export spill every batch it reads to its own run
+        result = self.export(formats=("CSV",), time_order=True, sort_memory_mb=0.001)
+        with open(result["output_paths"][0], encoding="utf-8") as f:
+            streamed = f.read()
+        self.assertEqual(streamed.splitlines()[1].split(",")[0], "20")
+        with open(self.export(formats=("CSV",), time_order=True, movement_check=True)["output_paths"][0], encoding="utf-8") as f:
+            self.assertEqual(f.read(), streamed)
+        with open(result["filters_path"], encoding="utf-8") as f:
+            self.assertIn("Sorted By Time: True\n", f.read())
+
+    def test_colocation_outputs(self):
+        other_path = os.path.join(self.folder.name, "other device.xlsx")
+        make_frame(range(BASE_TS + 20, BASE_TS + 20 + 10 * 60, 60)).to_excel(other_path, index=False)
+        result = run_colocation(self.excel_path, other_path, self.output_folder, datetime(2024, 1, 1), datetime(2024, 1, 2), "nil")
+        self.assertEqual(result["point_count"], 11)  # A's fix 40 s after B's last still counts
+        self.assertEqual([os.path.splitext(path)[1] for path in result["output_paths"]], [".kml", ".csv"])
+        with open(result["filters_path"], encoding="utf-8") as f:
+            settings = f.read()
+        self.assertIn("Meetings Found: 1\n", settings)
+        self.assertIn("Input File: other device.xlsx", settings)
+        rerun = run_colocation(self.excel_path, other_path, self.output_folder, datetime(2024, 1, 1), datetime(2024, 1, 2), "nil")
+        self.assertTrue(rerun["cached"])
+
+    def test_interrupted_export_resumes_to_identical_output(self):
+        make_frame(range(BASE_TS, BASE_TS + 6000 * 5, 5)).to_excel(self.excel_path, index=False)
+        cache = FrameCache()  # Parsed once for all three runs
+        self.addCleanup(cache.shutdown)
+        expected = self.export(formats=("KML", "CSV", "GeoJSON"), force=True, frame_cache=cache)
+        contents = {}
+        for path in expected["output_paths"]:
+            with open(path, "rb") as f:
+                contents[path] = f.read()
+        with open(expected["filters_path"], encoding="utf-8") as f:
+            expected_settings = f.read()
+
+        # Fail on the second batch, after the checkpoint taken at 5000 rows
+        write_batch = exporters.CsvExporter.write_batch
+        calls = []
+
+        def failing_write_batch(exporter, batch):
+            calls.append(len(batch))
+            if len(calls) == 2:
+                raise OSError("No space left on device")
+            write_batch(exporter, batch)
+
+        with mock.patch.object(exporters.CsvExporter, "write_batch", failing_write_batch):
+            self.assertRaises(OSError, self.export, formats=("KML", "CSV", "GeoJSON"), force=True, frame_cache=cache, checkpoint_rows=5000)
+        # An export of another window of the same file, finishing in between, leaves this export's checkpoint alone
+        run_export(self.excel_path, self.output_folder, datetime(2024, 1, 1), datetime(2024, 1, 1, 6), "nil",
+                   True, True, False, False, "km/h", formats=("CSV",), frame_cache=cache)
+        log = []
+        result = self.export(formats=("KML", "CSV", "GeoJSON"), force=True, frame_cache=cache, resume=True, log=log.append)
+        self.assertIn("Resuming after 5000 rows", log)
+        self.assertEqual(result["point_count"], 6000)
+        for path in result["output_paths"]:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), contents[path])
+        with open(result["filters_path"], encoding="utf-8") as f:
+            self.assertEqual(f.read(), expected_settings)
+        self.assertFalse([name for name in os.listdir(self.output_folder) if name.endswith((".checkpoint.json", ".tmp"))])
+
+    def test_heatmap_output(self):
+        result = self.export(formats=("Heatmap",))
+        self.assertEqual(result["point_count"], 20)
+        self.assertEqual([os.path.splitext(path)[1] for path in result["output_paths"]], [".kml", ".png"])
+
+    def test_places_output(self):
+        # Twenty minutes on the same spot is not long enough by default, but is with a lower threshold
+        with open(self.export(formats=("Places",))["output_paths"][1], encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 1)
+        result = self.export(formats=("Places",), place_min_dwell_s=600)
+        self.assertEqual([os.path.splitext(path)[1] for path in result["output_paths"]], [".kml", ".csv"])
+        with open(result["output_paths"][0], encoding="utf-8") as f:
+            self.assertIn("Total Dwell: 0:19:00", f.read())
+        with open(result["filters_path"], encoding="utf-8") as f:
+            self.assertIn("Places: 600 s of dwell within 50 m\n", f.read())
+
+    def test_settings_record_digests_of_input_and_outputs(self):
+        with open(self.excel_path, "rb") as f:
+            source = f.read()
+        # The input is hashed by the streamed read and by the whole-frame read alike
+        for options in ({}, {"movement_check": True}):
+            result = self.export(formats=("KML", "CSV"), hash_algorithms=("sha256", "md5"), **options)
+            with open(result["filters_path"], encoding="utf-8") as f:
+                settings = f.read()
+            self.assertIn(f"Input File: device.xlsx | {len(source)} bytes | SHA-256 {hashlib.sha256(source).hexdigest()} | "
+                          f"MD5 {hashlib.md5(source).hexdigest()} | 20 rows\n", settings)
+            for path in result["output_paths"]:
+                with open(path, "rb") as f:
+                    output = f.read()
+                self.assertIn(f"Output File: {os.path.basename(path)} | {len(output)} bytes | SHA-256 {hashlib.sha256(output).hexdigest()} | "
+                              f"MD5 {hashlib.md5(output).hexdigest()} | 20 rows\n", settings)
+
+    def test_settings_record_every_partition(self):
+        # Partitions written in worker processes are recorded there, their records come back with their counts
+        result = self.export(formats=("KML",), partition_by="points", points_per_partition=8, kml_processes=2)
+        with open(result["filters_path"], encoding="utf-8") as f:
+            settings = f.read()
+        parts_folder = os.path.splitext(result["output_paths"][0])[0] + " - parts"
+        part_names = sorted(os.listdir(parts_folder))
+        self.assertEqual(len(part_names), 3)
+        for name in part_names:
+            with open(os.path.join(parts_folder, name), "rb") as f:
+                output = f.read()
+            self.assertIn(f"Output File: {os.path.basename(parts_folder)}/{name} | {len(output)} bytes | "
+                          f"SHA-256 {hashlib.sha256(output).hexdigest()}", settings)
+
+    def test_regenerate_parts_leaves_other_parts_untouched(self):
+        options = {"formats": ("KML",), "partition_by": "points", "points_per_partition": 8}
+        result = self.export(**options)
+        parts_folder = os.path.splitext(result["output_paths"][0])[0] + " - parts"
+        part_paths = [os.path.join(parts_folder, name) for name in sorted(os.listdir(parts_folder))]
+        before = {}
+        for path in part_paths:
+            with open(path, "rb") as f:
+                before[path] = (f.read(), os.stat(path).st_mtime_ns)
+        with open(part_paths[1], "w", encoding="utf-8") as f:
+            f.write("damaged")
+
+        rerun = self.export(regenerate_parts=(2,), **options)
+        self.assertFalse(rerun["cached"])
+        self.assertEqual(rerun["point_count"], 20)
+        for path in part_paths:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), before[path][0])
+        self.assertEqual([os.stat(path).st_mtime_ns for path in part_paths[::2]], [before[path][1] for path in part_paths[::2]])
+        self.assertTrue(self.export(**options)["cached"])
+        self.assertRaises(ValueError, self.export, formats=("KML",), regenerate_parts=(2,))
+
+    def test_regenerated_parts_keep_the_digests_of_the_others(self):
+        options = {"formats": ("KML",), "partition_by": "points", "points_per_partition": 8, "hash_algorithms": ("sha256", "md5")}
+        with open(self.export(**options)["filters_path"], encoding="utf-8") as f:
+            part_lines = [line for line in f if line.startswith("Output File: ") and "/" in line]
+        self.assertEqual(len(part_lines), 3)
+        # A new process has no record of the files the last one wrote
+        with mock.patch.dict(integrity._written, clear=True):
+            with open(self.export(regenerate_parts=(2,), **options)["filters_path"], encoding="utf-8") as f:
+                settings = f.read()
+        for line in part_lines:
+            self.assertIn(line, settings)
+
+    def test_identical_rerun_is_cached(self):
+        self.export()
+        self.assertTrue(self.export()["cached"])
+        self.assertFalse(self.export(force=True)["cached"])
+        # A forced run records the same digest, so the next normal run is still a cache hit
+        self.assertTrue(self.export()["cached"])
+        self.assertFalse(self.export(max_speed_kmh=500, movement_check=True)["cached"])
+
+    def test_every_export_keeps_its_cache(self):
+        csv_only = {"formats": ("CSV",)}
+        self.assertEqual([self.export(**options)["cached"] for options in ({}, {}, csv_only, {}, csv_only)], [False, True, False, True, True])
+        with open(os.path.join(self.output_folder, "Filters - device.txt"), encoding="utf-8") as f:
+            self.assertIn("Output Formats: CSV\n", f.read())  # The settings file follows the export last asked for
+
+    def test_missing_partition_is_not_cached(self):
+        result = self.export(formats=("KML",), partition_by="points", points_per_partition=8)
+        rerun = self.export(formats=("KML",), partition_by="points", points_per_partition=8)
+        self.assertTrue(rerun["cached"])
+        self.assertEqual(rerun["output_paths"], result["output_paths"])
+        parts_folder = os.path.splitext(result["output_paths"][0])[0] + " - parts"
+        os.remove(os.path.join(parts_folder, sorted(os.listdir(parts_folder))[1]))
+        self.assertFalse(self.export(formats=("KML",), partition_by="points", points_per_partition=8)["cached"])
+        self.assertEqual(len(os.listdir(parts_folder)), 3)
+
+    def test_incremental_exports_only_new_rows(self):
+        self.assertEqual(self.export(incremental=True)["point_count"], 20)
+        self.write_source(30)
+        result = self.export(incremental=True)
+        self.assertEqual(result["point_count"], 10)
+        self.assertTrue(any(path.endswith("update 0002.kml") for path in result["output_paths"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
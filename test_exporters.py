@@ -0,0 +1,86 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from unittest import mock
+import exporters
+from exporters import export_batches, frame_batches, open_exporters
+from test_location_export import BASE_TS, make_frame
+
+
+class TestExporters(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.df = make_frame(range(BASE_TS, BASE_TS + 7))
+        self.df.loc[3, "ZLONGITUDE"] = None
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def export(self, formats, newline_delimited=False, accuracy_circles=False, processes=None, suffix=""):
+        file_exporters = open_exporters(formats, "device.xlsx", self.folder.name, "nil", datetime(2024, 1, 1), datetime(2024, 1, 2),
+                                        True, True, True, True, "km/h", newline_delimited=newline_delimited, suffix=suffix, accuracy_circles=accuracy_circles)
+        paths = export_batches(frame_batches(self.df, batch_size=3), file_exporters, total_rows=len(self.df), processes=processes)
+        return paths, file_exporters
+
+    def test_all_formats_in_one_pass(self):
+        paths, file_exporters = self.export(["KML", "GeoJSON", "GPX", "CSV"])
+        self.assertEqual({exporter.point_count for exporter in file_exporters.values()}, {6})
+        self.assertEqual(os.path.basename(paths["KML"]), "Exported - device - nil - 202401010000_to_202401020000.kml")
+
+        kml = ET.parse(paths["KML"]).getroot()
+        self.assertEqual(len(kml.findall(".//{http://www.opengis.net/kml/2.2}Placemark")), 6)
+
+        with open(paths["GeoJSON"]) as f:
+            collection = json.load(f)
+        self.assertEqual(len(collection["features"]), 6)
+        self.assertEqual(collection["features"][0]["geometry"]["coordinates"], [153.02, -27.47, 12.3])
+
+        gpx = ET.parse(paths["GPX"]).getroot()
+        points = gpx.findall(".//{http://www.topografix.com/GPX/1/1}trkpt")
+        self.assertEqual(len(points), 6)
+        self.assertEqual(points[0].find("{http://www.topografix.com/GPX/1/1}time").text, "2023-12-31T14:00:00Z")
+
+        with open(paths["CSV"], newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[1][-3:], ["01/01/2024", "00:00:00", "AEST (UTC+10)"])
+
+    def test_kml_accuracy_circles(self):
+        self.df.loc[5, "ZHORIZONTALACCURACY"] = -1.0  # No accuracy recorded, so the fix gets no ring
+        paths, _ = self.export(["KML"], accuracy_circles=True)
+        namespace = "{http://www.opengis.net/kml/2.2}"
+        kml = ET.parse(paths["KML"]).getroot()
+        placemarks = kml.findall(f".//{namespace}Placemark")
+        self.assertEqual(len(placemarks), 6)
+        self.assertEqual(len(kml.findall(f".//{namespace}MultiGeometry/{namespace}Polygon")), 5)
+        self.assertIsNotNone(kml.find(f".//{namespace}Style/{namespace}PolyStyle"))
+
+    def test_kml_rendered_in_processes_matches_serial(self):
+        self.df.loc[1, "ZHORIZONTALACCURACY"] = 80.0
+        serial, _ = self.export(["KML", "CSV"], accuracy_circles=True)
+        with mock.patch.object(exporters, "ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool:
+            parallel, file_exporters = self.export(["KML", "CSV"], accuracy_circles=True, processes=2, suffix=" - parallel")
+        # Never forked, the exporter may be running on one of several threads
+        self.assertEqual(pool.call_args.kwargs["mp_context"].get_start_method(), "spawn")
+        self.assertEqual(file_exporters["KML"].point_count, 6)
+        for export_format in ("KML", "CSV"):
+            with open(serial[export_format], "rb") as f, open(parallel[export_format], "rb") as g:
+                self.assertEqual(f.read(), g.read())
+
+    def test_newline_delimited_geojson(self):
+        paths, _ = self.export(["GeoJSON"], newline_delimited=True)
+        self.assertTrue(paths["GeoJSON"].endswith(".geojsonl"))
+        with open(paths["GeoJSON"]) as f:
+            features = [json.loads(line) for line in f]
+        self.assertEqual(len(features), 6)
+        self.assertEqual(features[0]["properties"]["Z_PK"], "1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from external_sort import external_sort
+from test_location_export import BASE_TS, make_frame
+
+
+class TestExternalSort(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def sort(self, df, memory_mb, log=None):
+        batches = [df.iloc[start:start + 3000] for start in range(0, len(df), 3000)]
+        return pd.concat(list(external_sort(batches, memory_mb=memory_mb, temp_dir=self.folder.name, log=log or (lambda message: None))),
+                         ignore_index=True)
+
+    def expected(self, df):
+        timestamps = df["ZTIMESTAMP"].astype(float)
+        return df.assign(ZTIMESTAMP=timestamps).iloc[np.argsort(timestamps.to_numpy(), kind="stable")].reset_index(drop=True)
+
+    def test_spilled_runs_merge_into_a_stable_time_order(self):
+        # Many fixes share a second, so equal times must come back in the order they were read
+        timestamps = np.random.default_rng(1).integers(BASE_TS, BASE_TS + 5000, 20000)
+        df = make_frame(timestamps.tolist())
+        df.loc[5, "Z_PK"] = None
+        log = []
+        sorted_df = self.sort(df, memory_mb=0.5, log=log.append)
+        self.assertTrue(any("runs spilled" in message for message in log))
+        pd.testing.assert_frame_equal(sorted_df, self.expected(df))
+        # The run files are gone once the sort has been read to the end
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+    def test_small_input_is_sorted_in_memory(self):
+        df = make_frame([BASE_TS + 3, BASE_TS + 1, BASE_TS + 2, BASE_TS + 1])
+        df.loc[2, "ZTIMESTAMP"] = None
+        sorted_df = self.sort(df, memory_mb=64)
+        self.assertEqual(list(sorted_df["ZTIMESTAMP"]), [BASE_TS + 1, BASE_TS + 1, BASE_TS + 3])
+        self.assertEqual(list(sorted_df["Z_PK"]), ["2", "4", "1"])
+
+    def test_abandoned_sort_removes_its_run_files(self):
+        df = make_frame(np.random.default_rng(2).permutation(10000).tolist())
+        sorted_batches = external_sort([df.iloc[start:start + 1000] for start in range(0, len(df), 1000)], memory_mb=0.2,
+                                       temp_dir=self.folder.name)
+        next(sorted_batches)
+        self.assertNotEqual(os.listdir(self.folder.name), [])
+        sorted_batches.close()
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
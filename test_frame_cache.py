@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from frame_cache import FAILED, READY, FrameCache
+from test_location_export import BASE_TS, make_frame
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = FrameCache(max_entries=2)
+
+    def tearDown(self):
+        self.cache.shutdown()
+        self.folder.cleanup()
+
+    def write_source(self, name, rows):
+        path = os.path.join(self.folder.name, name)
+        make_frame(range(BASE_TS, BASE_TS + rows)).to_excel(path, index=False)
+        return path
+
+    def test_prefetched_frame_is_reused(self):
+        path = self.write_source("device.xlsx", 10)
+        self.assertIsNone(self.cache.status(path))
+        self.cache.prefetch(path).result()
+        self.assertEqual(self.cache.status(path), READY)
+        record, df = self.cache.load(path)
+        self.assertEqual(len(df), 10)
+        self.assertEqual(record["size"], os.path.getsize(path))
+        self.assertIs(self.cache.load(path)[1], df)
+
+    def test_timeline_is_built_once(self):
+        path = self.write_source("device.xlsx", 10)
+        index = self.cache.timeline(path)
+        self.assertEqual(index.row_count, 10)
+        self.assertIs(self.cache.timeline(path), index)
+
+    def test_changed_file_is_loaded_again(self):
+        path = self.write_source("device.xlsx", 10)
+        self.cache.load(path)
+        self.write_source("device.xlsx", 20)
+        os.utime(path, ns=(0, 1))  # Make sure the modification time differs even on coarse clocks
+        self.assertIsNone(self.cache.status(path))
+        self.assertEqual(len(self.cache.load(path)[1]), 20)
+
+    def test_failed_load(self):
+        path = os.path.join(self.folder.name, "broken.xlsx")
+        with open(path, "w") as f:
+            f.write("not a workbook")
+        self.assertRaises(Exception, self.cache.load, path)
+        self.assertEqual(self.cache.status(path), FAILED)
+        self.assertIsNone(self.cache.status(os.path.join(self.folder.name, "missing.xlsx")))
+
+    def test_least_recently_used_entry_is_dropped(self):
+        paths = [self.write_source(f"device{number}.xlsx", 5) for number in range(3)]
+        for path in paths:
+            self.cache.load(path)
+        self.assertIsNone(self.cache.status(paths[0]))
+        self.assertEqual(self.cache.status(paths[2]), READY)
+
+    def test_memory_budget_drops_older_frames(self):
+        cache = FrameCache(max_entries=5, max_bytes=1)
+        paths = [self.write_source(f"device{number}.xlsx", 5) for number in range(2)]
+        for path in paths:
+            cache.load(path)
+        # Over budget, but the most recently used frame always stays
+        self.assertIsNone(cache.status(paths[0]))
+        self.assertEqual(cache.status(paths[1]), READY)
+        self.assertGreater(cache.memory(), 0)
+        cache.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import numpy as np
+from PIL import Image
+from heatmap import density_grid, heatmap_bounds, render_heatmap, write_heatmap
+from test_location_export import BASE_TS, make_frame
+
+
+class TestHeatmap(unittest.TestCase):
+
+    def test_density_grid_counts_every_fix(self):
+        rng = np.random.default_rng(0)
+        lat = rng.uniform(-27.6, -27.4, 10000)
+        lon = rng.uniform(152.9, 153.1, 10000)
+        counts = density_grid(lat, lon, heatmap_bounds(lat, lon), size=200)
+        self.assertEqual(int(counts.sum()), 10000)
+        self.assertEqual(max(counts.shape), 200)
+        # A degree of longitude is shorter than a degree of latitude away from the equator
+        self.assertLess(counts.shape[1], counts.shape[0])
+
+    def test_north_is_the_top_row(self):
+        lat = np.array([-27.0, -28.0])
+        lon = np.array([153.0, 153.0])
+        counts = density_grid(lat, lon, heatmap_bounds(lat, lon), size=50)
+        self.assertEqual(int(counts[0].sum()), 1)
+        self.assertEqual(int(counts[-1].sum()), 1)
+
+    def test_empty_pixels_are_transparent(self):
+        image = render_heatmap(np.array([[0, 1], [100, 0]]))
+        self.assertEqual(image.getpixel((0, 0))[3], 0)
+        self.assertGreater(image.getpixel((1, 0))[3], 0)
+        self.assertNotEqual(image.getpixel((1, 0)), image.getpixel((0, 1)))
+
+    def test_write_heatmap_overlay(self):
+        df = make_frame(range(BASE_TS, BASE_TS + 500))
+        df["ZLATITUDE"] = np.linspace(-27.5, -27.4, 500)
+        with tempfile.TemporaryDirectory() as folder:
+            (kml_path, png_path), point_count = write_heatmap(df, "device.xlsx", folder, "nil", datetime(2024, 1, 1), datetime(2024, 1, 2), size=64)
+            self.assertEqual(point_count, 500)
+            with open(kml_path, encoding="utf-8") as f:
+                kml = f.read()
+            self.assertIn("<GroundOverlay", kml)
+            self.assertIn(f"<href>{os.path.basename(png_path)}</href>", kml)
+            self.assertIn("<north>-27.3995</north>", kml)
+            with Image.open(png_path) as image:
+                self.assertEqual(image.size[1], 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
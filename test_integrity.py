@@ -0,0 +1,68 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from integrity import InputHasher, format_record, hash_file, open_input, open_output, output_record, parse_record
+
+
+class TestIntegrity(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_input_is_hashed_while_it_is_read(self):
+        path = os.path.join(self.folder.name, "device.xlsx")
+        content = os.urandom(3 * 1024 * 1024 + 17)
+        with open(path, "wb") as f:
+            f.write(content)
+        expected = {"size": len(content), "sha256": hashlib.sha256(content).hexdigest(), "md5": hashlib.md5(content).hexdigest()}
+        hasher = InputHasher(("sha256", "md5"))
+        with open_input(path, hasher) as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(hasher.record(), expected)
+        self.assertEqual(hash_file(path, ("sha256", "md5")), expected)
+
+    def test_input_read_out_of_order_is_hashed_in_order(self):
+        # A zip parser reads the end of the file first, then jumps back and forth between its members
+        path = os.path.join(self.folder.name, "device.xlsx")
+        content = os.urandom(3 * 1024 * 1024 + 17)
+        with open(path, "wb") as f:
+            f.write(content)
+        hasher = InputHasher()
+        with open_input(path, hasher) as f:
+            f.seek(-22, os.SEEK_END)
+            self.assertEqual(f.read(), content[-22:])
+            f.seek(100)
+            self.assertEqual(f.read(50), content[100:150])
+            f.seek(2 * 1024 * 1024)
+            self.assertEqual(f.read(10), content[2 * 1024 * 1024:2 * 1024 * 1024 + 10])
+        self.assertEqual(hasher.record(), {"size": len(content), "sha256": hashlib.sha256(content).hexdigest()})
+
+    def test_output_is_hashed_while_it_is_written(self):
+        path = os.path.join(self.folder.name, "out.kml")
+        with open_output(path) as f:
+            f.write("<kml>\n" * 1000 + "Brisbane ü\n")
+        with open(path, "rb") as f:
+            content = f.read()
+        self.assertEqual(output_record(path), {"size": len(content), "sha256": hashlib.sha256(content).hexdigest()})
+
+        # A file changed since it was written no longer has a trusted record
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("edited")
+        self.assertIsNone(output_record(path))
+
+    def test_format_record(self):
+        self.assertEqual(format_record({"size": 10, "md5": "b", "sha256": "a", "rows": 3}), "10 bytes | SHA-256 a | MD5 b | 3 rows")
+
+    def test_parse_record(self):
+        record = {"size": 10, "md5": "b", "sha256": "a", "rows": 3}
+        self.assertEqual(parse_record(format_record(record)), record)
+        self.assertEqual(parse_record("10 bytes"), {"size": 10})
+        self.assertIsNone(parse_record("unknown"))
+
+
+if __name__ == '__main__':
+    unittest.main()
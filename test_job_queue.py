@@ -0,0 +1,58 @@
+import time
+import unittest
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def fake_export(value, log, progress):
+    log(f"working on {value}")
+    progress(1, 2)
+    if value == "bad":
+        raise ValueError("Latitude or Longitude columns are missing in the file.")
+    return {"value": value}
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def collect(self, jobs, expected_finished):
+        events = []
+        deadline = time.monotonic() + 5
+        while sum(event in (DONE, FAILED) for event, _, _ in events) < expected_finished and time.monotonic() < deadline:
+            events.extend(jobs.pending_events())
+            time.sleep(0.01)
+        return events
+
+    def test_results_and_errors_are_posted_back(self):
+        jobs = JobQueue(fake_export, workers=2)
+        first = jobs.submit("first", {"value": "good"})
+        second = jobs.submit("second", {"value": "bad"})
+        events = self.collect(jobs, 2)
+        jobs.shutdown()
+
+        by_job = {first.job_id: [], second.job_id: []}
+        for event, job_id, value in events:
+            by_job[job_id].append((event, value))
+        self.assertEqual([event for event, _ in by_job[first.job_id]][:2], [QUEUED, RUNNING])
+        self.assertIn(("log", "working on good"), by_job[first.job_id])
+        self.assertIn(("progress", 50), by_job[first.job_id])
+        self.assertEqual(by_job[first.job_id][-1], (DONE, {"value": "good"}))
+        self.assertEqual(by_job[second.job_id][-1][0], FAILED)
+        self.assertIsInstance(by_job[second.job_id][-1][1], ValueError)
+
+    def test_job_can_run_its_own_target(self):
+        jobs = JobQueue(fake_export, workers=1)
+        job = jobs.submit("other", {"value": "good"}, target=lambda value, log, progress: {"other": value})
+        events = self.collect(jobs, 1)
+        jobs.shutdown()
+        self.assertEqual(events[-1], (DONE, job.job_id, {"other": "good"}))
+
+    def test_job_spec_is_immutable(self):
+        jobs = JobQueue(fake_export, workers=0)
+        job = jobs.submit("job", {"value": "good"})
+        with self.assertRaises(TypeError):
+            job.arguments["value"] = "changed"
+        with self.assertRaises(AttributeError):
+            job.label = "changed"
+
+
+if __name__ == '__main__':
+    unittest.main()
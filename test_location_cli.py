@@ -0,0 +1,31 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from location_cli import main, parse_time
+from test_location_export import BASE_TS, make_frame
+
+
+class TestLocationCli(unittest.TestCase):
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("01/01/2024 00:01:30"), BASE_TS + 90)
+        self.assertEqual(parse_time("2024-01-01 00:01"), BASE_TS + 60)
+
+    def test_locate_command(self):
+        with tempfile.TemporaryDirectory() as folder:
+            excel_path = os.path.join(folder, "device.xlsx")
+            make_frame(range(BASE_TS, BASE_TS + 600, 60)).to_excel(excel_path, index=False)
+            kml_path = os.path.join(folder, "where.kml")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                main(["locate", excel_path, "01/01/2024 00:01:30", "01/01/2024 00:02:00", "--kml", kml_path])
+            self.assertTrue(os.path.exists(kml_path))
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith("01/01/2024 00:01:30  -27.470000, 153.020000  +/- 5.0 m"))
+
+
+if __name__ == '__main__':
+    unittest.main()
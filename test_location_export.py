@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import pandas as pd
+from location_export import apply_filters, convert_timestamp, export_partitioned, parse_part_numbers, partition_frame, placemark_fields, write_kml
+
+
+def make_frame(timestamps, accuracy=5.0):
+    return pd.DataFrame({
+        "Z_PK": [str(i + 1) for i in range(len(timestamps))],
+        "ZALTITUDE": 12.34,
+        "ZCOURSE": -1.0,
+        "ZHORIZONTALACCURACY": accuracy,
+        "ZLATITUDE": -27.47,
+        "ZLONGITUDE": 153.02,
+        "ZSPEED": 2.5,
+        "ZTIMESTAMP": [str(ts) for ts in timestamps],
+        "ZVERTICALACCURACY": 3.0,
+    })
+
+
+# 2024-01-01 00:00 AEST as seconds since the iPhone epoch
+BASE_TS = 725724000
+
+
+class TestLocationExport(unittest.TestCase):
+
+    def test_convert_timestamp(self):
+        self.assertEqual(convert_timestamp(BASE_TS), ('01/01/2024', '00:00:00', 'AEST (UTC+10)'))
+        self.assertEqual(convert_timestamp('invalid'), ('invalid', 'invalid', 'Unknown'))
+
+    def test_apply_filters(self):
+        df = make_frame([BASE_TS, BASE_TS + 60, BASE_TS + 7200])
+        df.loc[1, "ZHORIZONTALACCURACY"] = 80.0
+        filtered, filter_str = apply_filters(df, datetime(2024, 1, 1), datetime(2024, 1, 1, 1), "< 50m")
+        self.assertEqual(list(filtered["Z_PK"]), ["1"])
+        self.assertEqual(filter_str, "less than 50m")
+
+    def test_placemark_fields(self):
+        df = make_frame([BASE_TS])
+        coords, name, description = placemark_fields(df.iloc[0], True, True, True, True, "km/h")
+        self.assertEqual(coords, (153.02, -27.47, 12.3))
+        self.assertEqual(name, "01/01/2024 | 00:00:00 | 9.0 km/h | No data recorded")
+        self.assertIn("ID: 1\n", description)
+
+    def test_write_kml_skips_missing_coordinates(self):
+        df = make_frame([BASE_TS, BASE_TS + 1])
+        df.loc[1, "ZLATITUDE"] = None
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "out.kml")
+            self.assertEqual(write_kml(df, path, False, False, False, False, "km/h"), 1)
+            self.assertTrue(os.path.exists(path))
+
+    def test_partition_frame_by_hour(self):
+        df, _ = apply_filters(make_frame([BASE_TS + 7200, BASE_TS, BASE_TS + 60]), datetime(2024, 1, 1), datetime(2024, 1, 2), "nil")
+        parts = list(partition_frame(df, "hour"))
+        self.assertEqual([len(part) for part in parts], [2, 1])
+
+    def test_partition_frame_by_points(self):
+        df, _ = apply_filters(make_frame(range(BASE_TS, BASE_TS + 25)), datetime(2024, 1, 1), datetime(2024, 1, 2), "nil")
+        self.assertEqual([len(part) for part in partition_frame(df, "points", 10)], [10, 10, 5])
+
+    def test_parse_part_numbers(self):
+        self.assertEqual(parse_part_numbers("3, 7-9"), {3, 7, 8, 9})
+        self.assertEqual(parse_part_numbers(""), set())
+        for text in ("0", "7-", "5-3", "a"):
+            self.assertRaises(ValueError, parse_part_numbers, text)
+
+    def test_export_partitioned_writes_index(self):
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 3)
+        df, filter_str = apply_filters(make_frame([BASE_TS, BASE_TS + 90000]), start, end, "nil")
+        with tempfile.TemporaryDirectory() as folder:
+            index_path, point_count, part_paths = export_partitioned(df, "device.xlsx", folder, filter_str, start, end, "day", True, True, False, False, "km/h")
+            self.assertEqual(point_count, 2)
+            self.assertEqual(os.path.basename(index_path), "Exported - device - nil - 202401010000_to_202401030000.kml")
+            with open(index_path) as f:
+                index_kml = f.read()
+            self.assertEqual(index_kml.count("<NetworkLink"), 2)
+            self.assertIn("<begin>2024-01-01T00:00:00+10:00</begin>", index_kml)
+            parts_folder = os.path.splitext(index_path)[0] + " - parts"
+            self.assertEqual(sorted(os.listdir(parts_folder)), sorted(os.path.basename(path) for path in part_paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import numpy as np
+from exporters import export_batches, frame_batches, open_exporters
+from benchmark import benchmark_engines
+from location_export import COLUMN_DTYPES, apply_filters
+from location_reader import compact_frame, read_excel_frame, read_locations
+from test_location_export import BASE_TS, make_frame
+
+
+class TestLocationReader(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        df = make_frame(range(BASE_TS, BASE_TS + 200, 10))
+        df["Z_PK"] = [str(100000 + i) for i in range(len(df))]
+        df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float) + 0.123456
+        df["ZSPEED"] = -1.0
+        df["ZHORIZONTALACCURACY"] = 65.0
+        df.loc[0, "ZCOURSE"] = 181.25
+        df.loc[1, "ZALTITUDE"] = 7.45
+        self.excel_path = os.path.join(self.folder.name, "device.xlsx")
+        df.to_excel(self.excel_path, index=False)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def export(self, df, name):
+        df, filter_str = apply_filters(df, datetime(2024, 1, 1), datetime(2024, 1, 2), "< 100m")
+        output_folder = os.path.join(self.folder.name, name)
+        os.makedirs(output_folder)
+        file_exporters = open_exporters(["KML", "GeoJSON", "GPX", "CSV"], self.excel_path, output_folder, filter_str,
+                                        datetime(2024, 1, 1), datetime(2024, 1, 2), True, True, True, True, "km/h")
+        paths = export_batches(frame_batches(df), file_exporters)
+        contents = {}
+        for export_format, path in paths.items():
+            with open(path, encoding="utf-8") as f:
+                contents[export_format] = f.read()
+        return contents
+
+    def test_compact_dtypes(self):
+        df = read_locations(self.excel_path, compact=True)
+        self.assertEqual(df["Z_PK"].dtype, np.int32)
+        self.assertEqual(df["ZTIMESTAMP"].dtype, np.float64)
+        self.assertEqual(df["ZSPEED"].dtype, np.float32)
+        self.assertEqual(df["ZHORIZONTALACCURACY"].dtype, np.float32)
+        self.assertEqual(df["ZLATITUDE"].dtype, np.float64)
+        # 7.45 has no exact float32 value, so altitude keeps full precision
+        self.assertEqual(df["ZALTITUDE"].dtype, np.float64)
+        self.assertTrue((df["ZSPEED"] == -1).all())
+
+    def test_compact_keeps_text_keys(self):
+        df = make_frame([BASE_TS, BASE_TS + 1])
+        df["Z_PK"] = ["1", "A2"]
+        self.assertEqual(list(compact_frame(df)["Z_PK"]), ["1", "A2"])
+
+    def test_exported_values_unchanged(self):
+        default_frame = read_locations(self.excel_path)
+        compact = read_locations(self.excel_path, compact=True)
+        self.assertEqual(self.export(default_frame, "default"), self.export(compact, "compact"))
+
+    def test_engine_fallback(self):
+        # An engine that is missing or fails hands over to the next one
+        messages = []
+        df = read_excel_frame(self.excel_path, COLUMN_DTYPES, engines=["no-such-engine", "openpyxl"], log=messages.append)
+        self.assertTrue(df.equals(read_locations(self.excel_path)))
+        self.assertIn("falling back to openpyxl", messages[0])
+        self.assertIn("with the openpyxl engine", messages[1])
+        self.assertRaises(ValueError, read_excel_frame, self.excel_path, COLUMN_DTYPES, engines=["no-such-engine"])
+
+    def test_benchmark_engines(self):
+        self.assertGreater(benchmark_engines(self.excel_path, repeat=1)["openpyxl"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
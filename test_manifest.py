@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from integrity import hash_file
+from manifest import cached_outputs, export_parameters, matching_manifest, record_update, run_digest, save_manifest, save_run_record, select_new_rows
+from test_location_export import BASE_TS, make_frame
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.excel_path = os.path.join(self.folder.name, "device.xlsx")
+        with open(self.excel_path, "wb") as f:
+            f.write(b"source")
+        self.parameters = export_parameters(datetime(2024, 1, 1), datetime(2024, 1, 2), "nil", True, True, False, False, "km/h", ["KML"])
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_select_new_rows(self):
+        df = make_frame(range(BASE_TS, BASE_TS + 6))
+        df["Z_PK"] = ["10", "3", "12", "7", "11", "bad"]
+        new_rows = select_new_rows(df, {"last_pk": 10, "last_timestamp": BASE_TS})
+        self.assertEqual(list(new_rows["Z_PK"]), ["12", "11"])
+
+    def test_select_new_rows_by_timestamp(self):
+        df = make_frame(range(BASE_TS, BASE_TS + 6))
+        new_rows = select_new_rows(df, {"last_pk": None, "last_timestamp": BASE_TS + 3})
+        self.assertEqual(len(new_rows), 2)
+
+    def test_round_trip_and_parameter_mismatch(self):
+        path = os.path.join(self.folder.name, "export.manifest.json")
+        df = make_frame(range(BASE_TS, BASE_TS + 4))
+        manifest = record_update(None, self.excel_path, self.parameters, df, df, ["a.kml"], None, None)
+        save_manifest(path, manifest)
+
+        loaded = matching_manifest(path, self.excel_path, self.parameters)
+        self.assertEqual(loaded["last_pk"], 4)
+        self.assertEqual(loaded["last_timestamp"], BASE_TS + 3)
+        self.assertEqual(loaded["updates"][0]["files"], ["a.kml"])
+
+        changed = dict(self.parameters, speed_unit="m/s")
+        self.assertIsNone(matching_manifest(path, self.excel_path, changed))
+
+    def test_record_update_keeps_high_water_mark(self):
+        df = make_frame(range(BASE_TS, BASE_TS + 4))
+        manifest = record_update(None, self.excel_path, self.parameters, df, df, [], None, None)
+        manifest = record_update(manifest, self.excel_path, self.parameters, df.iloc[:0], df.iloc[:0], [], None, None)
+        self.assertEqual(manifest["last_pk"], 4)
+        self.assertEqual([update["number"] for update in manifest["updates"]], [1, 2])
+
+    def test_run_digest_depends_on_content_and_parameters(self):
+        content_digest = hash_file(self.excel_path)["sha256"]
+        digest = run_digest(content_digest, self.parameters)
+        self.assertEqual(digest, run_digest(content_digest, dict(self.parameters)))
+        self.assertNotEqual(digest, run_digest(content_digest, dict(self.parameters, show_speed=True)))
+        self.assertNotEqual(digest, run_digest("other content", self.parameters))
+
+    def test_cached_outputs_requires_intact_files(self):
+        output_path = os.path.join(self.folder.name, "Exported - device.kml")
+        with open(output_path, "w") as f:
+            f.write("<kml/>")
+        filters_path = os.path.join(self.folder.name, "Filters - device.txt")
+        with open(filters_path, "w", encoding="utf-8") as f:
+            f.write("Points Exported: 3\nRun Digest: abc\n")
+        save_run_record(filters_path, "abc", 3, [output_path])
+
+        self.assertEqual(cached_outputs(filters_path, "abc"), ([output_path], 3, "Points Exported: 3\nRun Digest: abc\n"))
+        self.assertIsNone(cached_outputs(filters_path, "def"))
+        # Same size and modification time, different bytes
+        stat = os.stat(output_path)
+        with open(output_path, "w") as f:
+            f.write("<KML/>")
+        os.utime(output_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(cached_outputs(filters_path, "abc"))
+
+
+if __name__ == '__main__':
+    unittest.main()
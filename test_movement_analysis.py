@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from location_export import placemark_fields
+from movement_analysis import analyse_movement, flagged, haversine, initial_bearing
+from test_location_export import BASE_TS, make_frame
+
+
+class TestMovementAnalysis(unittest.TestCase):
+
+    def test_haversine_and_bearing(self):
+        # One degree of latitude is about 111.2 km, heading due north
+        self.assertAlmostEqual(float(haversine(0.0, 0.0, 1.0, 0.0)), 111195, delta=1)
+        self.assertAlmostEqual(float(initial_bearing(0.0, 0.0, 1.0, 0.0)), 0.0)
+        self.assertAlmostEqual(float(initial_bearing(0.0, 0.0, 0.0, 1.0)), 90.0)
+
+    def test_derives_missing_speed_and_course(self):
+        df = make_frame([BASE_TS + 20, BASE_TS, BASE_TS + 10])
+        df["ZSPEED"] = -1.0
+        df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float)
+        # 0.001 degrees of latitude north every 10 seconds is about 11.1 m/s
+        df["ZLATITUDE"] = [-27.468, -27.470, -27.469]
+        df.loc[2, "ZSPEED"] = 4.0
+        result = analyse_movement(df)
+        self.assertEqual(list(result["ZTIMESTAMP"]), [BASE_TS, BASE_TS + 10, BASE_TS + 20])
+        self.assertEqual(list(result["speed_derived"]), [False, False, True])
+        self.assertEqual(list(result["ZSPEED"])[:2], [-1.0, 4.0])
+        self.assertAlmostEqual(result["ZSPEED"].iloc[2], 11.12, places=2)
+        self.assertAlmostEqual(result["ZCOURSE"].iloc[1], 0.0, places=3)
+        self.assertFalse(flagged(result).any())
+
+        _, name, description = placemark_fields(result.iloc[2], False, False, True, True, "m/s")
+        self.assertEqual(name, "11.1 m/s (derived) | 0.0 (derived)")
+
+    def test_flags_outlier_and_teleport(self):
+        df = make_frame(range(BASE_TS, BASE_TS + 600, 60))
+        df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float)
+        latitudes = np.full(10, -27.47)
+        latitudes[3] = -33.87  # One bad fix in Sydney, a minute either side of Brisbane
+        latitudes[7:] = -12.46  # Then stays in Darwin
+        df["ZLATITUDE"] = latitudes
+        result = analyse_movement(df)
+        self.assertEqual(list(np.flatnonzero(result["outlier"])), [3])
+        self.assertEqual(list(np.flatnonzero(result["teleport"])), [7])
+        self.assertFalse(result["speed_derived"].iloc[4])
+        self.assertIn("Movement Check: outlier", placemark_fields(result.iloc[3], False, False, False, False, "km/h")[2])
+
+    def test_accuracy_explains_jump(self):
+        df = make_frame([BASE_TS, BASE_TS + 1])
+        df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float)
+        df["ZLATITUDE"] = [-27.47, -27.475]  # About 556 m in one second
+        df["ZHORIZONTALACCURACY"] = 300.0
+        self.assertFalse(flagged(analyse_movement(df)).any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import unittest
+import pandas as pd
+from benchmark import PERF_ACCURACY_FILTER, check_budgets, format_report, load_baseline, run_perf_stages, synthetic_export
+from location_export import ACCURACY_FILTERS
+
+# The timed tier takes about a minute, so it only runs when asked for: LOCATION_PERF_TESTS=1 python -m pytest test_performance.py
+RUN_PERF_TESTS = bool(os.environ.get("LOCATION_PERF_TESTS"))
+
+
+class TestBudgetCheck(unittest.TestCase):
+
+    BASELINE = {"speed_tolerance": 0.5, "memory_tolerance": 0.3,
+                "stages": {"kml": {"rows_per_second": 10000.0, "peak_mb": 100.0}, "csv": {"rows_per_second": 20000.0, "peak_mb": 10.0}}}
+
+    def test_within_the_band_passes(self):
+        report = check_budgets({"kml": {"rows_per_second": 6000.0, "peak_mb": 120.0}, "csv": {"rows_per_second": 25000.0, "peak_mb": 3.0}}, self.BASELINE)
+        self.assertEqual([problems for *_, problems in report], [[], []])
+        self.assertIn("ok", format_report(report))
+
+    def test_slower_and_larger_stages_are_flagged(self):
+        report = check_budgets({"kml": {"rows_per_second": 1000.0, "peak_mb": 100.0}, "csv": {"rows_per_second": 20000.0, "peak_mb": 50.0}}, self.BASELINE)
+        self.assertEqual([problems for *_, problems in report], [["slower"], ["more memory"]])
+        self.assertIn("REGRESSED: slower", format_report(report))
+
+    def test_synthetic_export_is_repeatable(self):
+        df = synthetic_export(1000)
+        pd.testing.assert_frame_equal(df, synthetic_export(1000))
+        self.assertFalse(df["ZTIMESTAMP"].astype(float).is_monotonic_increasing)
+        self.assertFalse(df.equals(synthetic_export(1000, seed=1)))
+
+    def test_filter_stage_uses_a_real_filter(self):
+        self.assertIn(PERF_ACCURACY_FILTER, ACCURACY_FILTERS)
+
+    def test_baseline_covers_every_stage(self):
+        baseline = load_baseline()
+        self.assertEqual(set(baseline["stages"]), {"read", "filter", "kml", "csv", "geojson", "sort", "places", "end_to_end"})
+
+
+@unittest.skipUnless(RUN_PERF_TESTS, "set LOCATION_PERF_TESTS=1 to run the timed performance tier")
+class TestPerformanceBudgets(unittest.TestCase):
+
+    def test_stages_stay_within_budget(self):
+        baseline = load_baseline()
+        report = check_budgets(run_perf_stages(baseline["rows"], baseline["read_rows"], baseline["seed"], log=lambda message: None), baseline)
+        self.assertFalse(any(problems for *_, problems in report), "\n" + format_report(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
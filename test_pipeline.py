@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+from pipeline import run_pipeline
+
+
+class Batch(list):
+    pass
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_batches_pass_through_every_stage_in_order(self):
+        messages = []
+        source = ("read", (Batch([i, i]) for i in range(10)))
+        stages = [("double", lambda batch: Batch(value * 2 for value in batch)), ("add", lambda batch: Batch(value + 1 for value in batch))]
+        result = [list(batch) for batch in run_pipeline(source, stages, log=messages.append)]
+        self.assertEqual(result, [[i * 2 + 1] * 2 for i in range(10)])
+        self.assertEqual(len(messages), 3)
+        self.assertTrue(messages[1].startswith("Stage double: 10 batches, 20 rows"))
+
+    def test_queues_bound_how_far_the_source_runs_ahead(self):
+        produced = []
+
+        def source():
+            for i in range(100):
+                produced.append(i)
+                yield Batch([i])
+
+        batches = run_pipeline(("read", source()), [("same", lambda batch: batch)], queue_depth=2)
+        next(batches)
+        time.sleep(0.2)
+        # Two full queues, one batch held by each thread and the one already consumed
+        self.assertLessEqual(len(produced), 8)
+        batches.close()
+
+    def test_stage_errors_reach_the_consumer(self):
+        def fail(batch):
+            raise ValueError("bad batch")
+
+        with self.assertRaisesRegex(ValueError, "bad batch"):
+            list(run_pipeline(("read", iter([Batch([1])])), [("fail", fail)]))
+
+    def test_stopping_early_ends_every_thread(self):
+        threads = threading.active_count()
+        batches = run_pipeline(("read", (Batch([i]) for i in range(1000))), [("same", lambda batch: batch)], queue_depth=1)
+        next(batches)
+        batches.close()
+        self.assertEqual(threading.active_count(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import csv
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import numpy as np
+from places import cluster_cells, dwell_times, find_places, write_places
+from test_location_export import BASE_TS, make_frame
+
+HOME = (-27.47, 153.02)
+WORK = (-27.40, 153.10)
+
+
+def day_frame(days=3):
+    # Nights at home and days at work with one fix a minute, and a drive of 30 fixes each way
+    timestamps, lat, lon = [], [], []
+    rng = np.random.default_rng(0)
+    for day in range(days):
+        start = BASE_TS + day * 86400
+        for offset, (place_lat, place_lon), minutes in ((0, HOME, 480), (510 * 60, WORK, 480)):
+            timestamps.extend(start + offset + np.arange(minutes) * 60)
+            lat.extend(place_lat + rng.normal(0, 0.00005, minutes))
+            lon.extend(place_lon + rng.normal(0, 0.00005, minutes))
+        for offset, origin, destination in ((480 * 60, HOME, WORK), (990 * 60, WORK, HOME)):
+            timestamps.extend(start + offset + np.arange(30) * 60)
+            lat.extend(np.linspace(origin[0], destination[0], 32)[1:-1])
+            lon.extend(np.linspace(origin[1], destination[1], 32)[1:-1])
+    df = make_frame(timestamps)
+    df["ZLATITUDE"] = lat
+    df["ZLONGITUDE"] = lon
+    return df
+
+
+class TestPlaces(unittest.TestCase):
+
+    def test_dwell_counts_stays_and_caps_departures(self):
+        timestamps = np.array([0.0, 300.0, 7500.0])
+        lat = np.array([-27.47, -27.47, -27.40])
+        lon = np.array([153.02, 153.02, 153.10])
+        self.assertEqual(list(dwell_times(timestamps, lat, lon)), [300.0, 60.0, 0.0])
+
+    def test_sparse_fixes_are_noise(self):
+        lat = np.array([-27.47, -27.47, -27.47, -27.0])
+        lon = np.array([153.02, 153.02, 153.0203, 153.5])
+        dwell = np.array([1000.0, 1000.0, 0.0, 600.0])
+        labels = cluster_cells(lat, lon, dwell, radius_m=50, min_dwell_s=1800)
+        # The third fix adds no dwell of its own, but is within reach of the others and so part of their place
+        self.assertGreaterEqual(labels[0], 0)
+        self.assertEqual(list(labels[:3]), [labels[0]] * 3)
+        self.assertEqual(labels[3], -1)
+
+    def test_grid_is_not_sheared_away_from_longitude_zero(self):
+        # Two fixes 40 m apart north to south at Brisbane are one place, as they would be at longitude 0
+        lat = np.array([HOME[0], HOME[0] - 0.00036])
+        dwell = np.array([1000.0, 1000.0])
+        for lon in (HOME[1], 0.0):
+            labels = cluster_cells(lat, np.array([lon, lon]), dwell, radius_m=50, min_dwell_s=1800)
+            self.assertEqual(list(labels), [0, 0])
+
+    def test_home_and_work_are_ranked_with_visits(self):
+        places = find_places(day_frame())
+        self.assertEqual(len(places), 2)
+        home, work = places.to_dict("records")
+        self.assertAlmostEqual(home["latitude"], HOME[0], places=4)
+        self.assertAlmostEqual(work["longitude"], WORK[1], places=4)
+        self.assertEqual([home["visits"], work["visits"]], [3, 3])
+        self.assertEqual(home["first_seen"], BASE_TS)
+        self.assertGreater(home["dwell"], work["dwell"] - 3600)
+
+    def test_write_places_outputs(self):
+        with tempfile.TemporaryDirectory() as folder:
+            (kml_path, csv_path), place_count = write_places(day_frame(), "device.xlsx", folder, "nil", datetime(2024, 1, 1), datetime(2024, 1, 5))
+            self.assertEqual(place_count, 2)
+            with open(kml_path, encoding="utf-8") as f:
+                kml = f.read()
+            self.assertEqual(kml.count("<Placemark"), 2)
+            self.assertIn("Visits: 3", kml)
+            self.assertEqual(os.path.splitext(csv_path)[0], os.path.splitext(kml_path)[0])
+            with open(csv_path, encoding="utf-8", newline="") as f:
+                rows = list(csv.reader(f))
+            self.assertEqual([row[0] for row in rows[1:]], ["1", "2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from movement_analysis import haversine
+from point_lookup import LocationIndex, great_circle_point, write_lookup_kml
+from test_location_export import BASE_TS, make_frame
+
+
+def track():
+    # Heading due east along the equator, one fix a minute, with one fix shuffled out of order
+    df = make_frame([BASE_TS, BASE_TS + 60, BASE_TS + 120, BASE_TS + 7320])
+    df["ZLATITUDE"] = 0.0
+    df["ZLONGITUDE"] = [0.0, 0.01, 0.02, 0.5]
+    df["ZHORIZONTALACCURACY"] = [10.0, 20.0, 10.0, 10.0]
+    return df.iloc[[1, 0, 2, 3]]
+
+
+class TestPointLookup(unittest.TestCase):
+
+    def test_interpolates_between_bracketing_fixes(self):
+        results = LocationIndex(track()).locate([BASE_TS + 15, BASE_TS + 60, BASE_TS + 100])
+        np.testing.assert_allclose(results["longitude"], [0.0025, 0.01, 0.01 + 0.01 * 40 / 60], atol=1e-9)
+        np.testing.assert_allclose(results["latitude"], 0, atol=1e-9)
+        self.assertEqual(list(results["nearest_pk"]), ["1", "2", "3"])
+        self.assertEqual(list(results["time_offset"]), [-15, 0, 20])
+        # A quarter of the way: 3/4 of 10 m plus 1/4 of 20 m plus a quarter of the segment
+        segment = haversine(0, 0, 0, 0.01)
+        self.assertAlmostEqual(results["uncertainty"].iloc[0], 12.5 + segment / 4)
+        self.assertAlmostEqual(results["uncertainty"].iloc[1], 20.0)
+
+    def test_no_interpolation_outside_the_track_or_across_gaps(self):
+        results = LocationIndex(track()).locate([BASE_TS - 30, BASE_TS + 3000, BASE_TS + 9000])
+        self.assertTrue(results["latitude"].isna().all())
+        self.assertEqual(list(results["nearest_pk"]), ["1", "3", "4"])
+
+    def test_batch_of_queries(self):
+        queries = np.linspace(BASE_TS, BASE_TS + 120, 10000)
+        results = LocationIndex(track()).locate(queries)
+        self.assertEqual(len(results), 10000)
+        self.assertTrue(np.all(np.diff(results["longitude"]) >= 0))
+
+    def test_great_circle_midpoint(self):
+        lat, lon = great_circle_point(np.array([0.0]), np.array([0.0]), np.array([0.0]), np.array([90.0]), np.array([0.5]))
+        self.assertAlmostEqual(lat[0], 0)
+        self.assertAlmostEqual(lon[0], 45)
+        # Across the pole rather than along the parallel
+        lat, lon = great_circle_point(np.array([60.0]), np.array([0.0]), np.array([60.0]), np.array([180.0]), np.array([0.5]))
+        self.assertAlmostEqual(lat[0], 90)
+
+    def test_kml_output(self):
+        results = LocationIndex(track()).locate([BASE_TS + 30, BASE_TS + 3000])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "where.kml")
+            write_lookup_kml(results, path)
+            with open(path, encoding="utf-8") as f:
+                kml = f.read()
+        self.assertEqual(kml.count("<Placemark"), 2)
+        self.assertIn("<when>2024-01-01T00:00:30+10:00</when>", kml)
+        self.assertIn("Position: nearest fix", kml)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import pandas as pd
+from source_merge import SOURCE_COLUMN, merge_sources, source_batches
+from test_location_export import BASE_TS, make_frame
+
+
+class TestSourceMerge(unittest.TestCase):
+
+    def merge(self, *frames, batch_size=7):
+        batches = [source_batches(df, f"export{number}.xlsx", batch_size) for number, df in enumerate(frames, start=1)]
+        return pd.concat(list(merge_sources(batches)), ignore_index=True)
+
+    def test_overlapping_exports_merge_without_duplicates(self):
+        earlier = make_frame(range(BASE_TS, BASE_TS + 100))
+        later = make_frame(range(BASE_TS + 50, BASE_TS + 150))
+        later["Z_PK"] = [str(number) for number in range(51, 151)]
+        merged = self.merge(earlier, later)
+        self.assertEqual(len(merged), 150)
+        self.assertTrue(merged["ZTIMESTAMP"].is_monotonic_increasing)
+        self.assertFalse(merged.duplicated(["Z_PK", "ZTIMESTAMP"]).any())
+        # The first input listing a row is the one it is credited to
+        self.assertEqual(merged[SOURCE_COLUMN].value_counts().to_dict(), {"export1.xlsx": 100, "export2.xlsx": 50})
+
+    def test_same_key_at_another_time_is_kept(self):
+        # Z_PK 1 is a different fix in each input, Z_PK 2 is the same fix in both
+        first = make_frame([BASE_TS, BASE_TS + 10])
+        second = make_frame([BASE_TS + 5, BASE_TS + 10])
+        merged = self.merge(first, second, batch_size=1)
+        self.assertEqual(list(merged["ZTIMESTAMP"]), [BASE_TS, BASE_TS + 5, BASE_TS + 10])
+        self.assertEqual(list(merged["Z_PK"]), ["1", "1", "2"])
+
+    def test_unsorted_input_and_missing_timestamps(self):
+        df = make_frame([BASE_TS + 3, BASE_TS + 1, BASE_TS + 2])
+        df.loc[1, "ZTIMESTAMP"] = None
+        merged = self.merge(df, make_frame([]))
+        self.assertEqual(list(merged["ZTIMESTAMP"]), [BASE_TS + 2, BASE_TS + 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
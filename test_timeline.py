@@ -0,0 +1,47 @@
+import time
+import unittest
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from location_export import apply_filters
+from test_location_export import BASE_TS, make_frame
+from timeline import DAY, HOUR, TimelineIndex
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        # Three fixes an hour for six hours with mixed accuracy
+        self.df = make_frame(range(BASE_TS, BASE_TS + 6 * HOUR, 1200))
+        self.df["ZHORIZONTALACCURACY"] = [5.0, 10.0, 65.0] * 6
+        self.index = TimelineIndex(self.df)
+
+    def test_hourly_histogram(self):
+        self.assertEqual(self.index.bin_seconds, HOUR)
+        self.assertEqual(self.index.bin_starts()[0], BASE_TS)
+        self.assertEqual(list(self.index.histogram("nil")), [3] * 6)
+        self.assertEqual(list(self.index.histogram("< 50m")), [2] * 6)
+        self.assertEqual(list(self.index.histogram("< 10m")), [1] * 6)
+
+    def test_counts_match_export_filters(self):
+        for start, end in ((datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 1, 2, 20)), (datetime(2024, 1, 1, 1, 0), datetime(2024, 1, 1, 1, 0))):
+            for accuracy_filter in ("nil", "< 10m", "< 50m", "< 100m"):
+                expected = len(apply_filters(self.df.copy(), start, end, accuracy_filter)[0])
+                self.assertEqual(self.index.count(start, end, accuracy_filter), expected)
+
+    def test_daily_bins_for_long_spans(self):
+        index = TimelineIndex(make_frame([BASE_TS, BASE_TS + 30 * DAY + 5]))
+        self.assertEqual(index.bin_seconds, DAY)
+        self.assertEqual(len(index.histogram("nil")), 31)
+
+    def test_million_rows_fast(self):
+        n = 1_000_000
+        df = pd.DataFrame({"ZTIMESTAMP": BASE_TS + np.arange(n, dtype=np.float64), "ZHORIZONTALACCURACY": np.random.default_rng(1).uniform(0, 600, n)})
+        started = time.perf_counter()
+        index = TimelineIndex(df)
+        index.count(datetime(2024, 1, 2), datetime(2024, 1, 5), "< 50m")
+        self.assertLess(time.perf_counter() - started, 0.5)  # Well under 100 ms on a workstation, loose for slow CI machines
+
+
+if __name__ == '__main__':
+    unittest.main()
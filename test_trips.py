@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from location_export import apply_filters, export_partitioned
+from movement_analysis import haversine
+from test_location_export import BASE_TS, make_frame
+from trips import format_duration, segment_trips, trip_summaries
+
+
+def journeys():
+    # A drive north, a 20 minute stop with nothing recorded, then a fix 5 km away, each a minute apart
+    timestamps = [BASE_TS, BASE_TS + 60, BASE_TS + 120, BASE_TS + 1320, BASE_TS + 1380, BASE_TS + 1440]
+    df = make_frame(timestamps)
+    df["ZTIMESTAMP"] = df["ZTIMESTAMP"].astype(float)
+    df["ZLATITUDE"] = [-27.47, -27.46, -27.45, -27.45, -27.45, -27.40]
+    df["ZSPEED"] = [-1.0, -1.0, -1.0, 10.0, 12.0, -1.0]
+    return df.iloc[::-1]
+
+
+class TestTrips(unittest.TestCase):
+
+    def test_breaks_on_time_and_distance_gaps(self):
+        df, trip = segment_trips(journeys(), max_gap_s=600, max_distance_m=2000)
+        self.assertEqual(list(df["ZTIMESTAMP"]), sorted(df["ZTIMESTAMP"]))
+        self.assertEqual(list(trip), [1, 1, 1, 2, 2, 3])
+        _, trip = segment_trips(journeys(), max_gap_s=3600, max_distance_m=10000)
+        self.assertEqual(list(trip), [1] * 6)
+
+    def test_summaries(self):
+        df, trip = segment_trips(journeys())
+        summaries = trip_summaries(df, trip)
+        self.assertEqual(list(summaries["points"]), [3, 2, 1])
+        first = summaries.iloc[0]
+        step = haversine(-27.47, 153.02, -27.46, 153.02)
+        self.assertAlmostEqual(first["distance"], 2 * step)
+        self.assertEqual(first["duration"], 120)
+        # No reported speed, so the fastest step stands in
+        self.assertAlmostEqual(first["max_speed"], step / 60 * 3.6)
+        self.assertAlmostEqual(first["mean_speed"], 2 * step / 120 * 3.6)
+        # Reported speeds are used where the phone recorded them
+        self.assertAlmostEqual(summaries.iloc[1]["max_speed"], 12 * 3.6)
+        self.assertEqual(summaries.iloc[2]["mean_speed"], 0)
+        self.assertEqual(format_duration(3725), "1:02:05")
+
+    def test_partitioned_by_trip(self):
+        start, end = datetime(2024, 1, 1), datetime(2024, 1, 2)
+        df, filter_str = apply_filters(journeys(), start, end, "nil")
+        with tempfile.TemporaryDirectory() as folder:
+            index_path, point_count, part_paths = export_partitioned(df, "device.xlsx", folder, filter_str, start, end, "trip", True, True, False, False, "km/h")
+            with open(index_path, encoding="utf-8") as f:
+                index_kml = f.read()
+            parts = [os.path.basename(path) for path in part_paths]
+            self.assertEqual(sorted(os.listdir(os.path.dirname(part_paths[0]))), parts)
+        self.assertEqual(point_count, 6)
+        self.assertEqual(index_kml.count("<NetworkLink"), 3)
+        self.assertIn("<name>Trip 1: 3 points</name>", index_kml)
+        self.assertIn("Duration: 0:02:00", index_kml)
+        self.assertTrue(parts[0].endswith(" - trip 0001.kml"))
+
+
+if __name__ == '__main__':
+    unittest.main()
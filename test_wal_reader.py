@@ -0,0 +1,96 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from integrity import InputHasher
+from location_reader import read_locations
+from wal_reader import read_wal, table_columns
+
+SCHEMA = (
+    "CREATE TABLE ZRTCLLOCATIONMO (Z_PK INTEGER PRIMARY KEY, Z_ENT INTEGER, Z_OPT INTEGER, ZTYPE INTEGER, "
+    "ZALTITUDE FLOAT, ZCOURSE FLOAT, ZHORIZONTALACCURACY FLOAT, ZLATITUDE FLOAT, ZLONGITUDE FLOAT, "
+    "ZSPEED FLOAT, ZTIMESTAMP TIMESTAMP, ZVERTICALACCURACY FLOAT)"
+)
+
+
+class TestWalReader(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.live_path = os.path.join(self.folder.name, "live.sqlite")
+        self.connection = sqlite3.connect(self.live_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA wal_autocheckpoint=0")
+        self.connection.execute(SCHEMA)
+        self.connection.execute("CREATE TABLE ZOTHER (Z_PK INTEGER PRIMARY KEY, ZNAME VARCHAR)")
+        self.connection.commit()
+        # Move the schema into the main file so only location rows are left in the WAL
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def tearDown(self):
+        self.connection.close()
+        self.folder.cleanup()
+
+    def insert(self, pk, latitude, timestamp, speed=-1.0):
+        self.connection.execute("INSERT OR REPLACE INTO ZRTCLLOCATIONMO VALUES (?, 1, 1, 0, 12.5, -1.0, 5.0, ?, 153.02, ?, ?, 3.0)",
+                                (pk, latitude, speed, timestamp))
+
+    def snapshot(self):
+        # Copy the files while the connection is open, closing it would checkpoint the WAL away
+        db_path = os.path.join(self.folder.name, "Cache.sqlite")
+        shutil.copy(self.live_path, db_path)
+        shutil.copy(self.live_path + "-wal", db_path + "-wal")
+        return db_path + "-wal"
+
+    def test_table_columns(self):
+        columns, rowid_column = table_columns(self.live_path)
+        self.assertEqual(columns[:3], ["Z_PK", "Z_ENT", "Z_OPT"])
+        self.assertEqual(rowid_column, "Z_PK")
+
+    def test_recovers_uncheckpointed_rows(self):
+        for pk in range(1, 51):
+            self.insert(pk, -27.4 - pk / 1000, 725724000.0 + pk)
+        self.connection.execute("INSERT INTO ZOTHER VALUES (1, 'not a location')")
+        self.connection.commit()
+        df = read_wal(self.snapshot())
+        self.assertEqual(len(df), 50)
+        self.assertEqual(sorted(df["Z_PK"].astype(int)), list(range(1, 51)))
+        self.assertTrue(df["wal_committed"].all())
+        self.assertFalse(df["wal_superseded"].any())
+        row = df[df["Z_PK"] == "7"].iloc[0]
+        self.assertAlmostEqual(row["ZLATITUDE"], -27.407)
+        self.assertEqual(row["ZTIMESTAMP"], 725724007.0)
+
+        # Hashing the WAL as its frames are walked gives the same rows and the digest of the whole file
+        wal_path = self.snapshot()
+        hasher = InputHasher()
+        self.assertTrue(read_wal(wal_path, hasher=hasher).equals(df))
+        with open(wal_path, "rb") as f:
+            content = f.read()
+        self.assertEqual(hasher.record(), {"size": len(content), "sha256": hashlib.sha256(content).hexdigest()})
+
+    def test_superseded_versions_are_tagged(self):
+        self.insert(1, -27.1, 725724001.0)
+        self.connection.commit()
+        self.insert(1, -27.2, 725724001.0, speed=3.5)
+        self.connection.commit()
+        df = read_wal(self.snapshot())
+        self.assertEqual(len(df), 2)
+        self.assertEqual(list(df.sort_values("wal_frame")["wal_superseded"]), [True, False])
+        latest = read_wal(self.snapshot(), latest_only=True)
+        self.assertEqual(list(latest["ZSPEED"]), [3.5])
+        # An export of the WAL carries only the current version of each row
+        exported = read_locations(self.snapshot())
+        self.assertEqual(list(exported["Z_PK"]), ["1"])
+        self.assertEqual(list(exported["ZLATITUDE"]), [-27.2])
+
+    def test_rejects_non_wal_file(self):
+        db_path = self.snapshot()[:-4]
+        with self.assertRaises(ValueError):
+            read_wal(db_path, db_path=db_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
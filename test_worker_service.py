@@ -0,0 +1,71 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from worker_service import WorkerService, job_arguments, submit
+from test_location_export import BASE_TS, make_frame
+
+
+class TestWorkerService(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.excel_path = os.path.join(self.folder.name, "device.xlsx")
+        make_frame(range(BASE_TS, BASE_TS + 1200, 60)).to_excel(self.excel_path, index=False)
+        self.address = os.path.join(self.folder.name, "service.sock")
+        self.service = WorkerService(self.address)
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self.service.serve_forever, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait(5)
+
+    def tearDown(self):
+        submit({"command": "shutdown"}, self.address)
+        self.thread.join(5)
+        self.folder.cleanup()
+
+    def export_spec(self, **arguments):
+        arguments.update({"excel_path": self.excel_path, "output_folder": self.folder.name,
+                          "start_datetime": "2024-01-01T00:00:00", "end_datetime": "2024-01-02T00:00:00",
+                          "horizontal_accuracy_filter": "nil", "show_date": True, "show_time": True, "show_speed": False,
+                          "show_bearing": False, "speed_unit": "km/h"})
+        return {"command": "export", "arguments": arguments}
+
+    def test_job_arguments(self):
+        arguments = job_arguments(self.export_spec(formats=["KML", "CSV"], regenerate_parts=[2, 5]))
+        self.assertEqual(arguments["start_datetime"].hour, 0)
+        self.assertEqual(arguments["formats"], ("KML", "CSV"))
+        self.assertEqual(arguments["regenerate_parts"], (2, 5))
+        self.assertRaises(ValueError, job_arguments, {"command": "format_disk"})
+
+    def test_exports_reuse_the_loaded_file(self):
+        # The movement check needs the whole frame, so the first job loads it through the cache
+        first = submit(self.export_spec(formats=["CSV"], movement_check=True), self.address)
+        self.assertEqual(first["status"], "done")
+        self.assertEqual(first["result"]["point_count"], 20)
+        second = submit(self.export_spec(formats=["KML"]), self.address)
+        self.assertIn("Using the frame loaded in the background: 20 rows", second["log"])
+        stats = submit({"command": "ping"}, self.address)["result"]
+        self.assertEqual((stats["jobs_run"], stats["cached_files"]), (2, 1))
+        self.assertGreater(stats["cache_bytes"], 0)
+
+    def test_kml_jobs_share_one_pool(self):
+        service = WorkerService(os.path.join(self.folder.name, "pooled.sock"), kml_processes=2)
+        self.addCleanup(service.kml_pool.shutdown)
+        no_new_pool = mock.Mock(side_effect=AssertionError("a process pool was started for one job"))
+        with mock.patch("exporters.ProcessPoolExecutor", no_new_pool), mock.patch("location_export.ProcessPoolExecutor", no_new_pool):
+            for options in ({}, {"partition_by": "points", "points_per_partition": 8}, {}):
+                reply = service.run_job(self.export_spec(formats=["KML"], force=True, **options))
+                self.assertEqual(reply["status"], "done", reply.get("error"))
+                self.assertEqual(reply["result"]["point_count"], 20)
+        self.assertIn("Rendering KML in 2 processes", reply["log"])
+
+    def test_failed_job_is_reported(self):
+        reply = submit(self.export_spec(formats=["CSV"], unknown_option=1), self.address)
+        self.assertEqual(reply["status"], "failed")
+        self.assertIn("unknown_option", reply["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
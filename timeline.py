@@ -0,0 +1,71 @@
+import numpy as np
+from location_export import ACCURACY_FILTERS, UTC_OFFSET, iphone_seconds
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Data spanning more than this many days is binned per day instead of per hour
+HOURLY_SPAN_DAYS = 14
+
+# Accuracy class boundaries, one class per filter choice plus one for everything at or above the last
+ACCURACY_THRESHOLDS = np.array(sorted(max_accuracy for max_accuracy, _ in ACCURACY_FILTERS.values()), dtype=np.float64)
+
+
+class TimelineIndex:
+
+    def __init__(self, df):
+        timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+        accuracy = df["ZHORIZONTALACCURACY"].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(timestamps)
+        timestamps = timestamps[valid]
+        accuracy = accuracy[valid]
+
+        # Rows below a threshold fall in class i where ACCURACY_THRESHOLDS[i] is the smallest threshold above them
+        classes = np.searchsorted(ACCURACY_THRESHOLDS, accuracy, side="right")
+        classes[np.isnan(accuracy)] = len(ACCURACY_THRESHOLDS)
+        class_count = len(ACCURACY_THRESHOLDS) + 1
+
+        self.row_count = len(timestamps)
+        if self.row_count == 0:
+            self.first = self.last = None
+            self.bin_seconds = HOUR
+            self.counts = np.zeros((0, class_count), dtype=np.int64)
+            self.sorted_timestamps = [np.empty(0)] * class_count
+            return
+        self.first = float(timestamps.min())
+        self.last = float(timestamps.max())
+        self.bin_seconds = HOUR if self.last - self.first <= HOURLY_SPAN_DAYS * DAY else DAY
+
+        # Bins line up with local hours or days; one bincount gives every bin's count per accuracy class
+        self.bin_origin = self._bin_floor(self.first)
+        bins = ((timestamps - self.bin_origin) // self.bin_seconds).astype(np.int64)
+        bin_count = int(bins.max()) + 1
+        self.counts = np.bincount(bins * class_count + classes, minlength=bin_count * class_count).reshape(bin_count, class_count)
+
+        # Sorted timestamps per class give exact counts for any window, not just whole bins; sorting the values of
+        # each class is several times faster than an argsort of the whole column
+        self.sorted_timestamps = [np.sort(timestamps[classes == c]) for c in range(class_count)]
+
+    def _bin_floor(self, ts):
+        # Brisbane midnight or hour at or before the timestamp; the iPhone epoch itself is a UTC midnight
+        offset = UTC_OFFSET.total_seconds()
+        return (ts + offset) // self.bin_seconds * self.bin_seconds - offset
+
+    def classes_for_filter(self, horizontal_accuracy_filter):
+        if horizontal_accuracy_filter not in ACCURACY_FILTERS:
+            return len(ACCURACY_THRESHOLDS) + 1
+        max_accuracy = ACCURACY_FILTERS[horizontal_accuracy_filter][0]
+        return int(np.searchsorted(ACCURACY_THRESHOLDS, max_accuracy)) + 1
+
+    def count(self, start_datetime, end_datetime, horizontal_accuracy_filter):
+        # Same inclusive window and strict accuracy test as the export itself
+        start, end = iphone_seconds(start_datetime), iphone_seconds(end_datetime)
+        return sum(int(np.searchsorted(values, end, side="right") - np.searchsorted(values, start, side="left"))
+                   for values in self.sorted_timestamps[:self.classes_for_filter(horizontal_accuracy_filter)])
+
+    def histogram(self, horizontal_accuracy_filter):
+        # Counts per bin for the rows the accuracy filter keeps
+        return self.counts[:, :self.classes_for_filter(horizontal_accuracy_filter)].sum(axis=1)
+
+    def bin_starts(self):
+        return self.bin_origin + np.arange(len(self.counts)) * self.bin_seconds
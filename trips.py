@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from movement_analysis import haversine, sort_by_time
+
+# A new trip starts after the phone records nothing for this long, or jumps further than this between two fixes
+DEFAULT_TRIP_GAP_S = 600
+DEFAULT_TRIP_DISTANCE_M = 2000
+
+
+def _steps(df):
+    # Distance and time from each fix to the next, over the time-sorted frame
+    timestamps = df["ZTIMESTAMP"].to_numpy(dtype=np.float64)
+    lat = df["ZLATITUDE"].to_numpy(dtype=np.float64)
+    lon = df["ZLONGITUDE"].to_numpy(dtype=np.float64)
+    return haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]), np.diff(timestamps)
+
+
+def segment_trips(df, max_gap_s=DEFAULT_TRIP_GAP_S, max_distance_m=DEFAULT_TRIP_DISTANCE_M):
+    # Trip numbers from 1 for each row of the time-sorted frame, which is returned with them
+    df = sort_by_time(df)
+    if df.empty:
+        return df, np.zeros(0, dtype=np.int64)
+    distance, elapsed = _steps(df)
+    # A step with a missing coordinate has no distance, so only its time can split the trip
+    breaks = (elapsed > max_gap_s) | (np.nan_to_num(distance) > max_distance_m)
+    return df, np.concatenate([[1], np.cumsum(breaks) + 1])
+
+
+def trip_summaries(df, trip):
+    # One row per trip of the frame segment_trips returned: times, points, distance travelled and speeds in km/h
+    trip = np.asarray(trip)
+    distance, elapsed = _steps(df)
+    within = trip[1:] == trip[:-1]
+    distance = np.where(within, np.nan_to_num(distance), 0.0)
+    derived = np.divide(distance, elapsed, out=np.zeros_like(distance), where=within & (elapsed > 0)) * 3.6
+    steps = pd.DataFrame({"trip": trip[1:], "distance": distance, "derived_speed": derived})
+    # The speed the phone reported is trusted over one derived from two noisy fixes, which it only stands in for
+    reported = df["ZSPEED"].to_numpy(dtype=np.float64) * 3.6
+    fixes = pd.DataFrame({"trip": trip, "ZTIMESTAMP": df["ZTIMESTAMP"].to_numpy(dtype=np.float64),
+                          "reported_speed": np.where(reported >= 0, reported, np.nan)})
+    summaries = fixes.groupby("trip").agg(start=("ZTIMESTAMP", "min"), end=("ZTIMESTAMP", "max"), points=("ZTIMESTAMP", "size"),
+                                          max_speed=("reported_speed", "max"))
+    moved = steps.groupby("trip").agg(distance=("distance", "sum"), derived_speed=("derived_speed", "max"))
+    summaries = summaries.join(moved).fillna({"distance": 0.0, "derived_speed": 0.0})
+    summaries["max_speed"] = summaries["max_speed"].fillna(summaries["derived_speed"])
+    summaries["duration"] = summaries["end"] - summaries["start"]
+    duration = summaries["duration"].to_numpy()
+    summaries["mean_speed"] = np.divide(summaries["distance"].to_numpy(), duration, out=np.zeros(len(duration)), where=duration > 0) * 3.6
+    return summaries.drop(columns="derived_speed").reset_index()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def trip_description(summary, start_text, end_text):
+    return (
+        f"Start: {start_text}\n"
+        f"End: {end_text}\n"
+        f"Duration: {format_duration(summary['duration'])}\n"
+        f"Points: {summary['points']}\n"
+        f"Distance: {summary['distance'] / 1000:.2f} km\n"
+        f"Max Speed: {summary['max_speed']:.1f} km/h\n"
+        f"Mean Speed: {summary['mean_speed']:.1f} km/h"
+    )
@@ -0,0 +1,217 @@
+import mmap
+import os
+import sqlite3
+import struct
+from urllib.request import pathname2url
+import pandas as pd
+from location_export import COLUMN_NAMES, COLUMN_DTYPES, no_log
+
+TABLE_NAME = "ZRTCLLOCATIONMO"
+
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+WAL_HEADER = struct.Struct(">IIIIIIII")
+FRAME_HEADER = struct.Struct(">IIIIII")
+TABLE_LEAF_PAGE = 0x0D
+DB_HEADER_SIZE = 100
+
+_UINT16 = struct.Struct(">H")
+_INT_SIZES = {1: 1, 2: 2, 3: 3, 4: 4, 5: 6, 6: 8}
+_FLOAT = struct.Struct(">d")
+
+
+def _varint(buffer, offset):
+    # SQLite varints are big-endian, 7 bits per byte, with a full 8 bits in the ninth byte
+    value = 0
+    for i in range(8):
+        byte = buffer[offset + i]
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, offset + i + 1
+    return (value << 8) | buffer[offset + 8], offset + 9
+
+
+def _decode_record(buffer, offset, end):
+    header_size, position = _varint(buffer, offset)
+    header_end = offset + header_size
+    serial_types = []
+    while position < header_end:
+        serial_type, position = _varint(buffer, position)
+        serial_types.append(serial_type)
+
+    values = []
+    position = header_end
+    for serial_type in serial_types:
+        if serial_type == 0:
+            values.append(None)
+        elif serial_type in _INT_SIZES:
+            size = _INT_SIZES[serial_type]
+            values.append(int.from_bytes(buffer[position:position + size], "big", signed=True))
+            position += size
+        elif serial_type == 7:
+            values.append(_FLOAT.unpack_from(buffer, position)[0])
+            position += 8
+        elif serial_type in (8, 9):
+            values.append(serial_type - 8)
+        elif serial_type >= 12:
+            size = (serial_type - 12) // 2
+            value = bytes(buffer[position:position + size])
+            values.append(value.decode("utf-8", "replace") if serial_type % 2 else value)
+            position += size
+        else:
+            raise ValueError(f"Reserved serial type {serial_type}")
+        if position > end:
+            raise ValueError("Record runs past the end of its cell")
+    return values
+
+
+def _local_payload_size(payload_size, usable_size):
+    # How much of a table leaf cell's payload is stored on the page itself (SQLite file format, section 1.6)
+    max_local = usable_size - 35
+    if payload_size <= max_local:
+        return payload_size
+    min_local = ((usable_size - 12) * 32 // 255) - 23
+    local = min_local + ((payload_size - min_local) % (usable_size - 4))
+    return local if local <= max_local else min_local
+
+
+def _leaf_records(page, page_number, usable_size):
+    header_offset = DB_HEADER_SIZE if page_number == 1 else 0
+    if page[header_offset] != TABLE_LEAF_PAGE:
+        return
+    cell_count = _UINT16.unpack_from(page, header_offset + 3)[0]
+    pointers = header_offset + 8
+    for i in range(cell_count):
+        cell = _UINT16.unpack_from(page, pointers + 2 * i)[0]
+        if cell < pointers or cell >= usable_size:
+            continue
+        try:
+            payload_size, position = _varint(page, cell)
+            rowid, position = _varint(page, position)
+            if _local_payload_size(payload_size, usable_size) != payload_size:
+                continue  # Spills onto overflow pages, which location rows never need
+            yield rowid, _decode_record(page, position, position + payload_size)
+        except (IndexError, ValueError, struct.error):
+            continue  # A damaged or partially overwritten cell
+
+
+def table_columns(db_path, table_name=TABLE_NAME):
+    # immutable=1 keeps SQLite from touching the evidence, it neither checkpoints nor reads the WAL
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro&immutable=1"
+    connection = sqlite3.connect(uri, uri=True)
+    try:
+        columns = connection.execute(f"PRAGMA table_info({table_name})").fetchall()
+    finally:
+        connection.close()
+    if not columns:
+        raise ValueError(f"Table {table_name} was not found in {db_path}")
+    # An INTEGER PRIMARY KEY column is an alias for the rowid and is stored as NULL in the record
+    rowid_column = next((name for _, name, column_type, _, _, pk in columns if pk == 1 and column_type.upper() == "INTEGER"), None)
+    return [name for _, name, _, _, _, _ in columns], rowid_column
+
+
+def database_usable_size(db_path, page_size):
+    # Byte 20 of the database header holds the reserved space at the end of every page
+    with open(db_path, "rb") as f:
+        header = f.read(DB_HEADER_SIZE)
+    return page_size - (header[20] if len(header) == DB_HEADER_SIZE else 0)
+
+
+def iter_wal_rows(wal_path, columns, rowid_column="Z_PK", usable_size=None, log=no_log, hasher=None):
+    # With a hasher the header, every frame as it is walked and any bytes after the last whole frame are fed to it,
+    # so the digest comes out of the same pass over the mapping
+    wanted = [columns.index(name) for name in COLUMN_NAMES if name != rowid_column]
+    wanted_names = [name for name in COLUMN_NAMES if name != rowid_column]
+    latitude_index = columns.index("ZLATITUDE")
+    with open(wal_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < WAL_HEADER.size:
+            raise ValueError(f"{wal_path} is too small to be a WAL file")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        magic, version, page_size, checkpoint, salt1, salt2, _, _ = WAL_HEADER.unpack_from(mm, 0)
+        if magic not in WAL_MAGIC:
+            raise ValueError(f"{wal_path} is not a SQLite WAL file")
+        usable_size = usable_size or page_size
+        log(f"WAL page size {page_size}, checkpoint {checkpoint}, salt {salt1:08x}-{salt2:08x}")
+
+        # Frames are slices of the mapping, so pages are decoded in place without being copied
+        view = memoryview(mm)
+        frame_size = FRAME_HEADER.size + page_size
+        frame_count = (len(mm) - WAL_HEADER.size) // frame_size
+        pending = []
+        try:
+            if hasher is not None:
+                with view[:WAL_HEADER.size] as header:
+                    hasher.update(header)
+            for frame in range(frame_count):
+                offset = WAL_HEADER.size + frame * frame_size
+                if hasher is not None:
+                    with view[offset:offset + frame_size] as frame_bytes:
+                        hasher.update(frame_bytes)
+                page_number, commit_size, frame_salt1, frame_salt2, _, _ = FRAME_HEADER.unpack_from(mm, offset)
+                current = (frame_salt1, frame_salt2) == (salt1, salt2)
+                page = view[offset + FRAME_HEADER.size:offset + frame_size]
+                for rowid, values in _leaf_records(page, page_number, usable_size):
+                    if len(values) != len(columns) or not isinstance(values[latitude_index], float):
+                        continue  # A row of some other table
+                    row = {name: values[index] for name, index in zip(wanted_names, wanted)}
+                    if rowid_column:
+                        row[rowid_column] = rowid
+                    row.update({"wal_frame": frame + 1, "wal_salt": f"{frame_salt1:08x}-{frame_salt2:08x}", "wal_current": current})
+                    pending.append(row)
+                page.release()
+
+                # A commit frame makes every earlier frame of its generation part of a committed transaction
+                if commit_size:
+                    for row in pending:
+                        row["wal_committed"] = row["wal_current"]
+                        yield row
+                    pending = []
+            if hasher is not None:
+                with view[WAL_HEADER.size + frame_count * frame_size:] as tail:
+                    hasher.update(tail)
+            for row in pending:
+                row["wal_committed"] = False
+                yield row
+        finally:
+            view.release()
+    finally:
+        mm.close()
+
+
+def read_wal(wal_path, db_path=None, columns=None, rowid_column="Z_PK", latest_only=False, log=no_log, hasher=None):
+    # The schema comes from the main database next to the WAL unless the column order is given
+    db_path = db_path or (wal_path[:-4] if wal_path.endswith("-wal") else None)
+    usable_size = None
+    if columns is None:
+        if not db_path or not os.path.exists(db_path):
+            raise ValueError("The main database file is needed next to the WAL to read the table layout.")
+        columns, rowid_column = table_columns(db_path)
+    if db_path and os.path.exists(db_path):
+        with open(wal_path, "rb") as f:
+            page_size = WAL_HEADER.unpack(f.read(WAL_HEADER.size))[2]
+        usable_size = database_usable_size(db_path, page_size)
+
+    # Every frame holds a whole page, so unchanged rows repeat; only one copy of each distinct version is
+    # kept while streaming, preferring the latest committed one
+    log(f"Reading WAL frames: {wal_path}")
+    versions = {}
+    for row in iter_wal_rows(wal_path, columns, rowid_column, usable_size=usable_size, log=log, hasher=hasher):
+        key = tuple(row[name] for name in COLUMN_NAMES)
+        previous = versions.get(key)
+        if previous is None or row["wal_committed"] or not previous["wal_committed"]:
+            versions[key] = row
+    df = pd.DataFrame(sorted(versions.values(), key=lambda row: row["wal_frame"]),
+                      columns=COLUMN_NAMES + ["wal_frame", "wal_salt", "wal_current", "wal_committed"])
+
+    # Older versions of a row are kept for the record but tagged as superseded by the last committed version
+    live = df.sort_values(["wal_committed", "wal_frame"], kind="stable").drop_duplicates("Z_PK", keep="last").index
+    df["wal_superseded"] = ~df.index.isin(live)
+    log(f"Recovered {len(df)} row versions for {df['Z_PK'].nunique()} rows from the WAL")
+    if latest_only:
+        df = df[~df["wal_superseded"] & df["wal_committed"]]
+        log(f"Keeping the latest committed version of each row: {len(df)} rows")
+    df = df.drop(columns="wal_current")
+    # Timestamps stay numeric, a NULL would not survive a round trip through text
+    return df.astype({**COLUMN_DTYPES, "ZTIMESTAMP": float})
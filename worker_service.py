@@ -0,0 +1,154 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing.connection import Client, Listener
+import export_runner
+import frame_cache as frame_cache_module
+from location_export import PROCESS_CONTEXT, no_log
+
+# A long-running process that keeps recently loaded sources parsed in memory, so back-to-back exports of the same
+# evidence file only filter and write; jobs arrive as JSON over a Unix socket, or a named pipe on Windows
+
+# Memory the parsed frames may take before the least recently used are dropped
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3
+SERVICE_ENTRIES = 8
+
+# Job commands and the runner each one calls with the job's arguments
+COMMANDS = {
+    "export": export_runner.run_export,
+    "colocation": export_runner.run_colocation,
+}
+
+# Arguments sent as JSON strings or lists that the runners take as datetimes or tuples
+DATETIME_ARGUMENTS = ("start_datetime", "end_datetime")
+TUPLE_ARGUMENTS = ("formats", "hash_algorithms", "merge_paths", "regenerate_parts")
+
+
+def default_address():
+    if sys.platform == "win32":
+        return r"\\.\pipe\location-export"
+    return os.path.join(tempfile.gettempdir(), f"location-export-{os.getuid()}.sock")
+
+
+def job_arguments(spec):
+    # The runner keyword arguments for a JSON job spec: {"command": "export", "arguments": {...}}
+    if spec.get("command") not in COMMANDS:
+        raise ValueError(f"Unknown command: {spec.get('command')}")
+    arguments = dict(spec.get("arguments", {}))
+    for name in DATETIME_ARGUMENTS:
+        if name in arguments:
+            arguments[name] = datetime.fromisoformat(arguments[name])
+    for name in TUPLE_ARGUMENTS:
+        if name in arguments:
+            arguments[name] = tuple(arguments[name])
+    return arguments
+
+
+class WorkerService:
+
+    def __init__(self, address=None, max_bytes=DEFAULT_MEMORY_BUDGET, kml_processes=None, log=no_log):
+        # kml_processes is used by every export job that does not set its own; those jobs share one pool of worker
+        # processes for the life of the service, so a small export does not pay for starting them
+        self.address = address or default_address()
+        self.kml_processes = kml_processes
+        self.kml_pool = self._start_kml_pool()
+        self.frame_cache = frame_cache_module.FrameCache(max_entries=SERVICE_ENTRIES, max_bytes=max_bytes)
+        self.log = log
+        self.jobs_run = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _start_kml_pool(self):
+        # Worker processes start on the first job that renders KML, not with the service
+        if not self.kml_processes or self.kml_processes <= 1:
+            return None
+        return ProcessPoolExecutor(max_workers=self.kml_processes, mp_context=PROCESS_CONTEXT)
+
+    def run_job(self, spec):
+        # Runs one job against the shared cache and returns the reply, with the job's log lines
+        lines = []
+        try:
+            arguments = job_arguments(spec)
+            if spec["command"] == "export" and self.kml_processes:
+                arguments.setdefault("kml_processes", self.kml_processes)
+                if arguments["kml_processes"] == self.kml_processes and self.kml_pool is not None:
+                    arguments["kml_pool"] = self.kml_pool
+            result = COMMANDS[spec["command"]](**arguments, frame_cache=self.frame_cache, log=lines.append)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker process died, so the next job gets a fresh pool
+                with self.lock:
+                    if self.kml_pool is arguments.get("kml_pool"):
+                        self.kml_pool = self._start_kml_pool()
+            self.log(f"Job failed: {e}")
+            return {"status": "failed", "error": str(e), "log": lines}
+        with self.lock:
+            self.jobs_run += 1
+        return {"status": "done", "result": result, "log": lines}
+
+    def stats(self):
+        with self.lock:
+            jobs_run = self.jobs_run
+        return {"jobs_run": jobs_run, "cached_files": len(self.frame_cache.entries), "cache_bytes": self.frame_cache.memory()}
+
+    def handle(self, connection):
+        with connection:
+            try:
+                spec = json.loads(connection.recv_bytes().decode("utf-8"))
+            except (EOFError, OSError, ValueError) as e:
+                self.log(f"Unreadable request: {e}")
+                return
+            command = spec.get("command")
+            if command == "ping":
+                reply = {"status": "done", "result": self.stats()}
+            elif command == "shutdown":
+                reply = {"status": "done", "result": self.stats()}
+                self.stopping.set()
+            else:
+                self.log(f"Job received: {command}")
+                reply = self.run_job(spec)
+            connection.send_bytes(json.dumps(reply, default=str).encode("utf-8"))
+        if command == "shutdown":
+            # accept() only returns for a connection, so make one to let the serving loop see the stop
+            Client(self.address).close()
+
+    def serve_forever(self, ready=None):
+        # Every connection is served on its own thread, so a long export does not hold up the next client
+        if sys.platform != "win32" and os.path.exists(self.address):
+            try:
+                Client(self.address).close()
+            except OSError:
+                os.remove(self.address)  # Left behind by a service that did not shut down cleanly
+            else:
+                raise RuntimeError(f"A worker service is already listening on {self.address}")
+        self.listener = Listener(self.address)
+        try:
+            if sys.platform != "win32":
+                os.chmod(self.address, 0o600)  # Only this user may submit jobs
+            self.log(f"Worker service listening on {self.address}")
+            if ready is not None:
+                ready.set()
+            while True:
+                connection = self.listener.accept()
+                if self.stopping.is_set():
+                    connection.close()
+                    break
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+        finally:
+            self.listener.close()
+            self.frame_cache.shutdown()
+            if self.kml_pool is not None:
+                self.kml_pool.shutdown(wait=False, cancel_futures=True)
+            self.log("Worker service stopped")
+
+
+def submit(spec, address=None):
+    # Sends one job spec to a running service and waits for its reply
+    with Client(address or default_address()) as connection:
+        connection.send_bytes(json.dumps(spec, default=str).encode("utf-8"))
+        return json.loads(connection.recv_bytes().decode("utf-8"))